@@ -0,0 +1,347 @@
+# Notation hors ligne par lots : le fichier d'entrée (CSV ou Parquet) est lu par morceaux, chaque morceau
+# est noté par les modèles de l'API dans un pool de processus et les résultats sont écrits dans l'ordre.
+# Un point de reprise est enregistré après chaque morceau écrit : une relance reprend où le calcul s'est arrêté.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from feature_store import CATEGORY_LEVELS, CSV_DTYPES, preprocess_frame
+from model_registry import ModelRegistry
+from model_specs import MODEL_FORMAT, OCCUPANCY_MODEL, COMPACT_MODEL_DIR, model_specs
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet facultatif : le CSV suffit
+    pa = pq = None
+
+# Prédiction -> groupe de modèles du registre
+MODEL_GROUPS = {'duration': 'regression', 'occupancy': 'classification', 'cluster': 'kmeans'}
+
+# Colonnes brutes nécessaires pour dériver les caractéristiques avec le prétraitement d'entraînement
+RAW_COLUMNS = ['Timestamp', 'Entry_Time', 'Exit_Time'] + [col for col in CATEGORY_LEVELS if col != 'Time_of_Day']
+
+# Modèles chargés une fois par processus (hérités du parent avec fork, sinon chargés par init_worker)
+_registry = None
+
+
+def load_models(models, model_dir='.', model_format=MODEL_FORMAT, occupancy_model=OCCUPANCY_MODEL,
+                compact_dir=COMPACT_MODEL_DIR):
+    """Registre des seuls groupes demandés, avec les fichiers et la construction de improved_app.py"""
+    groups = {MODEL_GROUPS[name] for name in models}
+    specs = [spec for spec in model_specs(model_format, occupancy_model, compact_dir) if spec.name in groups]
+    registry = ModelRegistry(specs, base_dir=model_dir, parallel=False)
+    registry.load_all()
+    missing = [name for name in registry.specs if not registry.is_ready(name)]
+    if missing:
+        raise RuntimeError(f"Modèles non chargés: {', '.join(missing)}")
+    return registry
+
+
+def init_worker(models, model_dir, model_format, occupancy_model, compact_dir):
+    global _registry
+    if _registry is None:
+        _registry = load_models(models, model_dir, model_format, occupancy_model, compact_dir)
+
+
+def is_parquet(path):
+    return path.rstrip('/').endswith('.parquet')
+
+
+# ----------------------------------------------------------------------
+# Lecture et préparation
+# ----------------------------------------------------------------------
+
+def raw_dtypes(columns):
+    """Types catégoriels et booléens du CSV d'entraînement pour un fichier d'événements bruts ; les colonnes
+    numériques restent inférées pour qu'une valeur invalide n'invalide que sa ligne"""
+    if 'Timestamp' not in columns:
+        return {}
+    return {col: dtype for col, dtype in CSV_DTYPES.items()
+            if col in columns and dtype not in ('int64', 'float64')}
+
+
+def read_chunks(path, chunksize, skip_rows=0):
+    """Morceaux d'au plus chunksize lignes, en sautant les skip_rows premières lignes (reprise)"""
+    if is_parquet(path):
+        if pq is None:
+            raise RuntimeError("La lecture Parquet nécessite pyarrow (pip install pyarrow)")
+        seen = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            start, seen = seen, seen + batch.num_rows
+            if seen <= skip_rows:
+                continue
+            frame = batch.to_pandas()
+            if start < skip_rows:
+                frame = frame.iloc[skip_rows - start:].reset_index(drop=True)
+            yield frame.astype(raw_dtypes(frame.columns))
+        return
+    dtypes = raw_dtypes(pd.read_csv(path, nrows=0).columns)
+    skip = (lambda i: 0 < i <= skip_rows) if skip_rows else None
+    yield from pd.read_csv(path, dtype=dtypes, chunksize=chunksize, skiprows=skip)
+
+
+def total_rows(path):
+    """Nombre de lignes si connu sans lire le fichier (métadonnées Parquet), sinon None"""
+    if is_parquet(path) and pq is not None:
+        return pq.ParquetFile(path).metadata.num_rows
+    return None
+
+
+def prepare_features(frame):
+    """Caractéristiques des modèles et {position: message} des lignes brutes invalides
+
+    Les caractéristiques sont dérivées des colonnes brutes (même prétraitement qu'à l'entraînement) quand
+    le fichier contient des événements bruts, sinon lues telles quelles. Une date, une heure ou une
+    modalité invalide n'invalide que sa ligne.
+    """
+    if 'Timestamp' not in frame.columns:
+        return frame, {}
+    missing = [col for col in RAW_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Colonnes brutes absentes du fichier: {', '.join(missing)}")
+    # La cible n'est pas nécessaire pour noter et peut être absente ou inconnue
+    invalid = {}
+    features_frame = preprocess_frame(frame.drop(columns=['occupancy'], errors='ignore'), invalid)
+    return features_frame, {position: '; '.join(f"Invalid value for {col}" for col in cols)
+                            for position, cols in invalid.items()}
+
+
+def feature_matrix(features_frame, vector, exclude=()):
+    """Matrice des lignes valides, masque des lignes valides et {position: message} des autres
+
+    Les lignes passent par le schéma compilé de l'API (FeatureVector.fill_batch) : mêmes conversions et
+    mêmes messages que les requêtes HTTP. Les positions de exclude (lignes brutes invalides) sont écartées.
+    """
+    missing = [feature for feature in vector.features if feature not in features_frame.columns]
+    if missing:
+        raise ValueError(f"Caractéristiques absentes du fichier: {', '.join(missing)}")
+    records = features_frame[vector.features].to_dict('records')
+    matrix, valid_indices, errors = vector.fill_batch(records)
+    valid = np.zeros(len(records), dtype=bool)
+    valid[valid_indices] = True
+    if exclude:
+        excluded = np.zeros(len(records), dtype=bool)
+        excluded[list(exclude)] = True
+        matrix = matrix[~excluded[valid_indices]]
+        valid &= ~excluded
+    return matrix, valid, errors
+
+
+def masked(values, valid, dtype):
+    """Colonne de la taille du morceau, manquante pour les lignes invalides"""
+    column = pd.Series(None if dtype == object else pd.NA, index=range(len(valid)), dtype=dtype)
+    column[valid] = values
+    return column
+
+
+# ----------------------------------------------------------------------
+# Notation (exécutée dans les processus du pool)
+# ----------------------------------------------------------------------
+
+def score_chunk(frame, start_row, models, keep_columns=()):
+    """Note un morceau avec chaque modèle demandé ; les lignes invalides reçoivent un message d'erreur"""
+    n_rows = len(frame)
+    missing = [col for col in keep_columns if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Colonnes à recopier absentes du fichier: {', '.join(missing)}")
+    features_frame, invalid = prepare_features(frame)
+    output = {'row': np.arange(start_row, start_row + n_rows)}
+    for col in keep_columns:
+        output[col] = frame[col].to_numpy()
+    errors = [[invalid[i]] if i in invalid else [] for i in range(n_rows)]
+    for name in models:
+        compiled = _registry.get(MODEL_GROUPS[name]).compiled
+        matrix, valid, row_errors = feature_matrix(features_frame, compiled.vector, invalid)
+        X = compiled.transform(matrix)
+        if name == 'duration':
+            output['duration_hours'] = masked(compiled.predict_transformed(X), valid, 'Float64')
+        elif name == 'occupancy':
+            predictions, probabilities = compiled.predict_transformed(X)
+            output['occupancy_prediction'] = masked(predictions.astype(int), valid, 'Int64')
+            output['occupancy_probability'] = masked(probabilities[:, -1], valid, 'Float64')
+        else:
+            nearest, distances = compiled.assign(X)
+            clusters = nearest[:, 0]
+            output['cluster'] = masked(clusters, valid, 'Int64')
+            output['cluster_profile'] = masked(np.asarray(compiled.profiles, dtype=object)[clusters], valid, object)
+            nearest_distance = distances[np.arange(len(clusters)), clusters]
+            output['cluster_confidence'] = masked(1.0 / (1.0 + nearest_distance), valid, 'Float64')
+        for i, message in row_errors.items():
+            if i not in invalid:
+                errors[i].append(f"{name}: {message}")
+    output['error'] = ['; '.join(e) for e in errors]
+    return pd.DataFrame(output)
+
+
+# ----------------------------------------------------------------------
+# Écriture et reprise
+# ----------------------------------------------------------------------
+
+class ResultWriter:
+    """Sortie CSV (un fichier, tronqué à la dernière position validée lors d'une reprise) ou Parquet
+    (un répertoire de fichiers part-NNNNN.parquet, un par morceau)"""
+
+    def __init__(self, path, position=None):
+        self.path = path
+        self.parquet = is_parquet(path)
+        if self.parquet:
+            if pq is None:
+                raise RuntimeError("L'écriture Parquet nécessite pyarrow (pip install pyarrow)")
+            os.makedirs(path, exist_ok=True)
+            self.position = position or 0
+            # Parties écrites après le dernier point de reprise : elles seront recalculées
+            for part in glob.glob(os.path.join(path, 'part-*.parquet')):
+                if int(os.path.basename(part)[5:10]) >= self.position:
+                    os.remove(part)
+        else:
+            self.position = position or 0
+            with open(path, 'a' if self.position else 'w', newline='') as f:
+                f.truncate(self.position)
+
+    def write(self, frame):
+        if self.parquet:
+            final = os.path.join(self.path, f'part-{self.position:05d}.parquet')
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), final + '.tmp')
+            os.replace(final + '.tmp', final)
+            self.position += 1
+            return
+        with open(self.path, 'a', newline='') as f:
+            frame.to_csv(f, header=self.position == 0, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+            self.position = f.tell()
+
+
+def checkpoint_path(output_path):
+    return output_path.rstrip('/') + '.checkpoint.json'
+
+
+def run_signature(input_path, models, keep_columns, registry):
+    """Ce qui doit être identique pour reprendre : fichier d'entrée, colonnes produites, versions des modèles"""
+    st = os.stat(input_path)
+    return {
+        'input': os.path.abspath(input_path),
+        'input_size': st.st_size,
+        'input_mtime': st.st_mtime,
+        'models': list(models),
+        'keep_columns': list(keep_columns),
+        'model_versions': {name: group.version for name, group in registry.snapshot().items()},
+    }
+
+
+def read_checkpoint(path, signature):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['signature'] != signature:
+        raise RuntimeError(f"{path} correspond à une autre exécution (fichier d'entrée, colonnes ou modèles "
+                           "différents) : relancer avec --restart")
+    return checkpoint
+
+
+def save_checkpoint(path, signature, rows_done, position):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'signature': signature, 'rows_done': rows_done, 'position': position}, f)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+# Orchestration
+# ----------------------------------------------------------------------
+
+def batch_score(input_path, output_path, models=('duration', 'occupancy', 'cluster'), chunksize=50000,
+                n_jobs=None, keep_columns=(), restart=False, model_dir='.', model_format=MODEL_FORMAT,
+                occupancy_model=OCCUPANCY_MODEL, compact_dir=COMPACT_MODEL_DIR):
+    """Note tout le fichier d'entrée et écrit les prédictions ; renvoie le nombre de lignes notées"""
+    global _registry
+    n_jobs = n_jobs or os.cpu_count() or 1
+    _registry = load_models(models, model_dir, model_format, occupancy_model, compact_dir)
+
+    signature = run_signature(input_path, models, keep_columns, _registry)
+    checkpoint_file = checkpoint_path(output_path)
+    checkpoint = None if restart else read_checkpoint(checkpoint_file, signature)
+    rows_done = checkpoint['rows_done'] if checkpoint else 0
+    writer = ResultWriter(output_path, checkpoint['position'] if checkpoint else None)
+    if rows_done:
+        print(f"Reprise après {rows_done} lignes déjà notées")
+
+    total = total_rows(input_path)
+    start_time = time.perf_counter()
+    scored = 0
+
+    def write(frame):
+        nonlocal rows_done, scored
+        writer.write(frame)
+        rows_done += len(frame)
+        scored += len(frame)
+        save_checkpoint(checkpoint_file, signature, rows_done, writer.position)
+        elapsed = time.perf_counter() - start_time
+        progress = f"{rows_done}/{total} lignes ({rows_done / total:.0%})" if total else f"{rows_done} lignes"
+        print(f"{progress}, {scored / elapsed:.0f} lignes/s", flush=True)
+
+    chunks = read_chunks(input_path, chunksize, rows_done)
+    next_row = rows_done
+    if n_jobs == 1:
+        for chunk in chunks:
+            write(score_chunk(chunk, next_row, models, keep_columns))
+            next_row += len(chunk)
+    else:
+        # Au plus 2 morceaux en attente par processus : la mémoire ne dépend pas de la taille du fichier
+        with ProcessPoolExecutor(n_jobs, initializer=init_worker,
+                                 initargs=(models, model_dir, model_format, occupancy_model, compact_dir)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, next_row, models, keep_columns))
+                next_row += len(chunk)
+                while len(pending) >= 2 * n_jobs:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+
+    # Exécution complète : le point de reprise n'a plus d'objet
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    elapsed = time.perf_counter() - start_time
+    print(f"Terminé! {scored} lignes notées en {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.0f} lignes/s) "
+          f"-> {output_path}")
+    return rows_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notation hors ligne d'un fichier CSV ou Parquet par les modèles de l'API")
+    parser.add_argument('input', help="Fichier CSV ou Parquet (événements bruts ou caractéristiques)")
+    parser.add_argument('output', help="Fichier CSV, ou répertoire .parquet (nécessite pyarrow)")
+    parser.add_argument('--models', default='duration,occupancy,cluster')
+    parser.add_argument('--chunksize', type=int, default=50000, help="Lignes par morceau")
+    parser.add_argument('--n-jobs', type=int, default=None, help="Processus de notation (défaut : nombre de CPU)")
+    parser.add_argument('--keep', default='', help="Colonnes d'entrée recopiées dans la sortie (séparées par des virgules)")
+    parser.add_argument('--restart', action='store_true', help="Ignore le point de reprise et recommence")
+    parser.add_argument('--model-dir', default='.', help="Répertoire des modèles")
+    parser.add_argument('--format', choices=['pickle', 'compact'], default=MODEL_FORMAT)
+    parser.add_argument('--occupancy-model', choices=['exact', 'approx'], default=OCCUPANCY_MODEL)
+    args = parser.parse_args()
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    unknown = set(models) - set(MODEL_GROUPS)
+    if unknown:
+        parser.error(f"modèles inconnus: {', '.join(sorted(unknown))}")
+    keep_columns = [c.strip() for c in args.keep.split(',') if c.strip()]
+    try:
+        batch_score(args.input, args.output, models, args.chunksize, args.n_jobs, keep_columns, args.restart,
+                    args.model_dir, args.format, args.occupancy_model)
+    except (RuntimeError, ValueError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
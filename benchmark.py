@@ -0,0 +1,381 @@
+# Banc d'essai reproductible : micro-benchmarks (entraînement et API), générateur de charge et comparaison
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+import pandas as pd
+
+DATA_PATH = "cleaned_smart_parking_data.csv"
+RESULTS_DIR = "benchmark_results"
+
+# Points d'entrée de l'API : nom -> (route unitaire, groupe de modèles)
+ENDPOINTS = {
+    'duration': ('/predict/duration', 'regression'),
+    'occupancy': ('/predict/occupancy', 'classification'),
+    'cluster': ('/predict/cluster', 'kmeans'),
+}
+
+
+# ==========================================================
+# OUTILS
+# ==========================================================
+
+def summarize(samples):
+    """Statistiques (en secondes) d'une série de mesures"""
+    samples = np.asarray(samples, dtype=float)
+    return {
+        "runs": int(samples.size),
+        "min": float(samples.min()),
+        "median": float(np.median(samples)),
+        "mean": float(samples.mean()),
+        "p95": float(np.percentile(samples, 95)),
+        "max": float(samples.max())
+    }
+
+def timeit(fn, repeat=5, warmup=1):
+    """Exécute fn `warmup` fois sans mesure puis `repeat` fois en mesurant chaque appel"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def quiet(fn):
+    """Enveloppe fn pour masquer ses affichages (les scripts d'entraînement sont bavards)"""
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return wrapped
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def environment_info():
+    import sklearn
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def save_results(results, output, mode):
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{mode}-{results['environment']['commit']}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Résultats sauvegardés dans {output}")
+    return output
+
+def serving_records(data_path, features):
+    """Lignes du CSV converties en enregistrements JSON contenant toutes les caractéristiques demandées"""
+    from train_models import preprocess_data
+    df = preprocess_data(data_path)
+    return df[list(features)].astype(float)
+
+def synthetic_rows(df, n_rows, seed=42, jitter=0.05):
+    """Rejoue les lignes réelles ; au-delà de leur nombre, rééchantillonne avec un bruit gaussien
+
+    Les colonnes binaires (0/1) sont rééchantillonnées sans bruit ; les colonnes
+    continues reçoivent un bruit de `jitter` écart-type.
+    """
+    values = df.to_numpy(dtype=float)
+    if n_rows <= len(values):
+        return values[:n_rows]
+    rng = np.random.default_rng(seed)
+    rows = values[rng.integers(0, len(values), size=n_rows)]
+    continuous = [i for i in range(values.shape[1]) if not np.isin(values[:, i], (0.0, 1.0)).all()]
+    std = values[:, continuous].std(axis=0)
+    rows[:, continuous] += rng.normal(0.0, 1.0, size=(n_rows, len(continuous))) * std * jitter
+    return rows
+
+
+# ==========================================================
+# MICRO-BENCHMARKS
+# ==========================================================
+
+def bench_training(data_path, repeat, quick):
+    import train_models
+    import train_kmeans
+    import improve_classification
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    results = {}
+    print("Benchmark: train_models.preprocess_data")
+    results['train_models.preprocess_data'] = timeit(lambda: train_models.preprocess_data(data_path), repeat)
+
+    df_encoded = train_models.preprocess_data(data_path)
+    X = df_encoded.drop(['Parking_Duration', 'occupancy'], axis=1)
+    y = df_encoded['Parking_Duration']
+    # select_features est coûteux : une seule mesure en mode rapide
+    heavy_repeat = 1 if quick else max(1, repeat // 2)
+    print("Benchmark: train_models.select_features (régression)")
+    results['train_models.select_features.regression'] = timeit(
+        quiet(lambda: train_models.select_features(X, y, k=4, task_type='regression')), heavy_repeat, warmup=0)
+    X = df_encoded.drop('occupancy', axis=1)
+    y = df_encoded['occupancy']
+    print("Benchmark: train_models.select_features (classification)")
+    results['train_models.select_features.classification'] = timeit(
+        quiet(lambda: train_models.select_features(X, y, k=3, task_type='classification')), heavy_repeat, warmup=0)
+
+    df = pd.read_csv(data_path)
+    X_scaled = StandardScaler().fit_transform(df[train_kmeans.kmeans_features])
+    print("Benchmark: train_kmeans.sweep_k")
+    results['train_kmeans.sweep_k'] = timeit(lambda: train_kmeans.sweep_k(X_scaled), heavy_repeat, warmup=0)
+
+    df_encoded = quiet(lambda: improve_classification.load_classification_data(data_path))()
+    features = [f for f in improve_classification.important_features if f in df_encoded.columns]
+    X_train, _, y_train, _ = train_test_split(
+        StandardScaler().fit_transform(df_encoded[features]), df_encoded['occupancy'],
+        test_size=0.3, random_state=42, stratify=df_encoded['occupancy'])
+    print("Benchmark: improve_classification.search_svm (GridSearchCV)")
+    results['improve_classification.search_svm'] = timeit(
+        quiet(lambda: improve_classification.search_svm(X_train, y_train, verbose=0, method='grid')), 1, warmup=0)
+    # Sans cache disque : mesure le coût réel de la recherche, pas une relecture
+    print("Benchmark: improve_classification.search_svm (divisions successives)")
+    results['improve_classification.search_svm.halving'] = timeit(
+        quiet(lambda: improve_classification.search_svm(X_train, y_train, verbose=0, cache_dir='')),
+        heavy_repeat, warmup=0)
+    return results
+
+def bench_serving(data_path, repeat, requests_per_run=200, batch_size=1000):
+    """Mesure chaque handler de prédiction via le client de test Flask (sans réseau)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import improved_app
+    client = improved_app.app.test_client()
+    results = {}
+    for name, (route, group_name) in ENDPOINTS.items():
+        group = improved_app.registry.get(group_name)
+        if group is None:
+            print(f"Modèle {group_name} non chargé : benchmark {name} ignoré")
+            continue
+        df = serving_records(data_path, group.compiled.vector.features)
+        records = df.to_dict('records')
+        singles = [records[i % len(records)] for i in range(requests_per_run)]
+
+        def run_single():
+            for record in singles:
+                client.post(route, json=record)
+
+        batch = synthetic_rows(df, batch_size)
+        batch_payload = {feature: batch[:, i].tolist() for i, feature in enumerate(df.columns)}
+
+        def run_batch():
+            client.post(f"{route}/batch", json=batch_payload)
+
+        print(f"Benchmark: {route} et {route}/batch")
+        stats = timeit(run_single, repeat)
+        results[f"api.{name}.single"] = {**stats, "per_request": {k: v / requests_per_run
+                                                                  for k, v in stats.items() if k != "runs"}}
+        stats = timeit(run_batch, repeat)
+        results[f"api.{name}.batch{batch_size}"] = {**stats, "per_record": {k: v / batch_size
+                                                                          for k, v in stats.items() if k != "runs"}}
+    return results
+
+def run_micro(args):
+    results = {"mode": "micro", "environment": environment_info(), "benchmarks": {}}
+    if args.only in (None, 'serving'):
+        results["benchmarks"].update(bench_serving(args.data, args.repeat))
+    if args.only in (None, 'training'):
+        results["benchmarks"].update(bench_training(args.data, args.repeat, args.quick))
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:55s} médiane {stats['median'] * 1000:10.3f} ms")
+    save_results(results, args.output, "micro")
+
+
+# ==========================================================
+# GÉNÉRATEUR DE CHARGE
+# ==========================================================
+
+def make_sender(url):
+    """Renvoie send(path, payload) -> code HTTP, via HTTP ou via le client de test Flask"""
+    if url:
+        import urllib.error
+        import urllib.request
+
+        def send(path, payload):
+            req = urllib.request.Request(url.rstrip('/') + path, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(req, timeout=30) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return send, None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import improved_app
+    app = improved_app.app
+
+    def send(path, payload):
+        # Un client par appel : le client de test Flask n'est pas partagé entre threads
+        return app.test_client().post(path, json=payload).status_code
+    return send, improved_app
+
+def run_load(args):
+    route, group_name = ENDPOINTS[args.endpoint]
+    send, app_module = make_sender(args.url)
+    if app_module is not None:
+        features = app_module.registry.get(group_name).compiled.vector.features
+    else:
+        import urllib.request
+        with urllib.request.urlopen(args.url.rstrip('/') + '/features', timeout=30) as response:
+            available = json.load(response)
+        features = available.get(f"{group_name}_features")
+        if features is None:
+            sys.exit(f"Impossible de connaître les caractéristiques du groupe {group_name} via /features")
+    df = serving_records(args.data, features)
+    rows = synthetic_rows(df, args.rows, seed=args.seed)
+    columns = list(df.columns)
+
+    if args.batch_size > 0:
+        path = f"{route}/batch"
+        chunks = [rows[i:i + args.batch_size] for i in range(0, len(rows), args.batch_size)]
+        payloads = ({c: chunk[:, j].tolist() for j, c in enumerate(columns)} for chunk in chunks)
+    else:
+        path = route
+        payloads = (dict(zip(columns, row.tolist())) for row in rows)
+
+    latencies = []
+    statuses = {}
+
+    def call(payload):
+        start = time.perf_counter()
+        status = send(path, payload)
+        return time.perf_counter() - start, status
+
+    print(f"Charge: {len(rows)} lignes sur {path} ({args.concurrency} clients concurrents)")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # Soumission par fenêtres bornées : 1M de lignes ne crée pas 1M de Futures d'un coup
+        while True:
+            window = list(islice(payloads, args.concurrency * 64))
+            if not window:
+                break
+            for latency, status in pool.map(call, window):
+                latencies.append(latency)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+    elapsed = time.perf_counter() - start
+
+    latencies = np.asarray(latencies)
+    report = {
+        "mode": "load",
+        "environment": environment_info(),
+        "config": {"endpoint": args.endpoint, "path": path, "rows": len(rows), "batch_size": args.batch_size,
+                   "concurrency": args.concurrency, "target": args.url or "in-process"},
+        "load": {
+            "requests": int(latencies.size),
+            "elapsed_seconds": elapsed,
+            "throughput_rows_per_second": len(rows) / elapsed,
+            "throughput_requests_per_second": latencies.size / elapsed,
+            "latency_seconds": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p90": float(np.percentile(latencies, 90)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max())
+            },
+            "status_codes": statuses
+        }
+    }
+    load = report["load"]
+    print(f"Débit: {load['throughput_rows_per_second']:.1f} lignes/s, "
+          f"p50 {load['latency_seconds']['p50'] * 1000:.3f} ms, p99 {load['latency_seconds']['p99'] * 1000:.3f} ms")
+    save_results(report, args.output, f"load-{args.endpoint}")
+
+
+# ==========================================================
+# COMPARAISON ENTRE DEUX EXÉCUTIONS
+# ==========================================================
+
+def comparable_metrics(results):
+    """Aplatit un fichier de résultats en {métrique: (valeur, plus_grand_est_mieux)}"""
+    metrics = {}
+    for name, stats in results.get("benchmarks", {}).items():
+        metrics[f"{name}.median"] = (stats["median"], False)
+    load = results.get("load")
+    if load:
+        metrics["load.throughput_rows_per_second"] = (load["throughput_rows_per_second"], True)
+        for percentile, value in load["latency_seconds"].items():
+            metrics[f"load.latency.{percentile}"] = (value, False)
+    return metrics
+
+def run_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    base_metrics = comparable_metrics(baseline)
+    new_metrics = comparable_metrics(candidate)
+    print(f"Référence : {baseline['environment']['commit']}  Candidat : {candidate['environment']['commit']}")
+    regressions = []
+    for name in sorted(set(base_metrics) & set(new_metrics)):
+        base, higher_is_better = base_metrics[name]
+        new, _ = new_metrics[name]
+        change = (new - base) / base if base else 0.0
+        worse = -change if higher_is_better else change
+        flag = "RÉGRESSION" if worse > args.threshold else ("amélioration" if worse < -args.threshold else "")
+        if flag == "RÉGRESSION":
+            regressions.append(name)
+        print(f"{name:60s} {base:12.6g} -> {new:12.6g} ({change:+.1%}) {flag}")
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nAucune régression détectée")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de l'entraînement et de l'API de prédiction")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    micro = subparsers.add_parser('micro', help="Micro-benchmarks de l'entraînement et des handlers de prédiction")
+    micro.add_argument('--data', default=DATA_PATH)
+    micro.add_argument('--repeat', type=int, default=5)
+    micro.add_argument('--quick', action='store_true', help="Une seule mesure pour les étapes coûteuses")
+    micro.add_argument('--only', choices=['training', 'serving'])
+    micro.add_argument('--output')
+    micro.set_defaults(func=run_micro)
+
+    load = subparsers.add_parser('load', help="Rejoue les lignes du CSV contre un endpoint")
+    load.add_argument('--data', default=DATA_PATH)
+    load.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='occupancy')
+    load.add_argument('--rows', type=int, default=10000, help="Nombre de lignes (agrandissement synthétique au-delà du CSV, ex. 1000000)")
+    load.add_argument('--batch-size', type=int, default=0, help="0 = une requête par ligne, sinon endpoint /batch")
+    load.add_argument('--concurrency', type=int, default=8)
+    load.add_argument('--url', help="URL de l'API (par défaut : application chargée en processus)")
+    load.add_argument('--seed', type=int, default=42)
+    load.add_argument('--output')
+    load.set_defaults(func=run_load)
+
+    compare = subparsers.add_parser('compare', help="Compare deux fichiers de résultats et signale les régressions")
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=0.10, help="Écart relatif toléré (0.10 = 10 %%)")
+    compare.set_defaults(func=run_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+# Format d'inférence compact : chaque groupe (scaler + modèle) est exporté en tableaux NumPy dans un .npz
+# versionné, évalué ensuite sans scikit-learn ni joblib (démarrage rapide, indépendant des versions)
+import argparse
+import os
+import numpy as np
+import joblib
+
+from fast_inference import (CentroidIndex, FeatureVector, LINEAR_REGRESSORS, is_logistic, is_nystroem_logistic,
+                            logistic_output, nystroem_parameters, rbf_kernel, scaler_parameters)
+
+FORMAT_VERSION = 1
+COMPACT_DIR = 'compact_models'
+
+# Probabilités de Platt bornées comme dans libsvm
+LIBSVM_MIN_PROB = 1e-7
+# Couplage des probabilités par paires de libsvm (multiclass_probability) : itérations et tolérance pour 2 classes
+LIBSVM_MAX_ITER = 100
+LIBSVM_EPS = 0.005 / 2
+
+
+class CompactFormatError(ValueError):
+    """Modèle non exportable ou fichier compact illisible"""
+
+
+# ----------------------------------------------------------------------
+# Export (lit les estimateurs scikit-learn par leurs attributs)
+# ----------------------------------------------------------------------
+
+def flatten_forest(estimators, classifier):
+    """Concatène les arbres en tableaux de nœuds ; les indices des enfants deviennent globaux"""
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        if not classifier and tree.value.shape[1] != 1:
+            raise CompactFormatError("Forêts à plusieurs sorties non prises en charge")
+        children_left = tree.children_left.astype(np.int64)
+        children_right = tree.children_right.astype(np.int64)
+        leaf = children_left < 0
+        left.append(np.where(leaf, -1, children_left + offset))
+        right.append(np.where(leaf, -1, children_right + offset))
+        feature.append(np.where(leaf, 0, tree.feature).astype(np.int64))
+        threshold.append(tree.threshold.astype(np.float64))
+        if classifier:
+            # Proportions de classes par feuille, normalisées comme DecisionTreeClassifier.predict_proba
+            counts = tree.value[:, 0, :].astype(np.float64)
+            totals = counts.sum(axis=1, keepdims=True)
+            totals[totals == 0.0] = 1.0
+            value.append(counts / totals)
+        else:
+            value.append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+    return {
+        'tree_left': np.concatenate(left),
+        'tree_right': np.concatenate(right),
+        'tree_feature': np.concatenate(feature),
+        'tree_threshold': np.concatenate(threshold),
+        'tree_value': np.concatenate(value),
+        'tree_roots': np.asarray(roots, dtype=np.int64),
+        'tree_max_depth': np.int64(max_depth),
+    }
+
+
+def export_arrays(kind, scaler, model, features, profiles=None):
+    """Tableaux du format compact pour un groupe ('regression', 'classification' ou 'kmeans')"""
+    features = [str(f) for f in features]
+    mean, scale = scaler_parameters(scaler, len(features))
+    model_type = type(model).__name__
+    arrays = {
+        'format_version': np.int64(FORMAT_VERSION),
+        'kind': np.str_(kind),
+        'source': np.str_(model_type),
+        'features': np.asarray(features, dtype=str),
+        'mean': mean,
+        'scale': scale,
+    }
+    if kind == 'kmeans':
+        centers = np.asarray(model.cluster_centers_, dtype=np.float64)
+        arrays.update(estimator=np.str_('kmeans'), centroids=mean + scale * centers, inv_scale=1.0 / scale)
+        if profiles is not None and len(profiles) == len(centers):
+            arrays['profiles'] = np.asarray([str(p) for p in profiles], dtype=str)
+    elif kind == 'regression' and model_type in LINEAR_REGRESSORS:
+        coef = np.ravel(model.coef_).astype(np.float64)
+        weights = coef / scale
+        bias = float(np.ravel(model.intercept_)[0]) - float(weights @ mean)
+        arrays.update(estimator=np.str_('linear'), weights=weights, bias=np.float64(bias))
+    elif kind == 'regression' and model_type == 'RandomForestRegressor':
+        arrays.update(estimator=np.str_('forest'), **flatten_forest(model.estimators_, classifier=False))
+    elif kind == 'classification' and is_logistic(model):
+        coef = np.ravel(model.coef_).astype(np.float64)
+        weights = coef / scale
+        bias = float(np.ravel(model.intercept_)[0]) - float(weights @ mean)
+        arrays.update(estimator=np.str_('logistic'), weights=weights, bias=np.float64(bias))
+    elif kind == 'classification' and is_nystroem_logistic(model):
+        components, gamma, weights, bias = nystroem_parameters(model, len(features))
+        arrays.update(estimator=np.str_('nystroem'), components=components, gamma=np.float64(gamma),
+                      weights=weights, bias=np.float64(bias))
+    elif kind == 'classification' and model_type == 'RandomForestClassifier':
+        arrays.update(estimator=np.str_('forest'), **flatten_forest(model.estimators_, classifier=True))
+    elif kind == 'classification' and model_type == 'SVC':
+        if len(model.classes_) != 2 or model.kernel not in ('rbf', 'linear'):
+            raise CompactFormatError("Seuls les SVC binaires à noyau rbf ou linéaire sont pris en charge")
+        if not getattr(model, 'probability', False):
+            raise CompactFormatError("Le SVC doit être entraîné avec probability=True")
+        arrays.update(
+            estimator=np.str_('svc'),
+            kernel=np.str_(model.kernel),
+            gamma=np.float64(model._gamma),
+            support_vectors=np.asarray(model.support_vectors_, dtype=np.float64),
+            dual_coef=np.ravel(model.dual_coef_).astype(np.float64),
+            intercept=np.float64(np.ravel(model.intercept_)[0]),
+            prob_a=np.float64(model.probA_[0]),
+            prob_b=np.float64(model.probB_[0]),
+        )
+    else:
+        raise CompactFormatError(f"Modèle {model_type} non pris en charge pour le groupe {kind}")
+    if kind == 'classification':
+        arrays['classes'] = np.asarray(model.classes_)
+    return arrays
+
+
+def save_compact(path, arrays):
+    """Écriture atomique (le registre peut relire le fichier à tout moment)"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+# Exécution (NumPy uniquement)
+# ----------------------------------------------------------------------
+
+def libsvm_binary_probability(r):
+    """multiclass_probability de libsvm pour k=2, vectorisé par ligne
+
+    scikit-learn n'utilise pas le raccourci p = r des versions récentes de libsvm : il résout le
+    couplage par paires de façon itérative avec une tolérance de 0.0025, d'où des écarts de
+    l'ordre de 1e-3 avec la sigmoïde seule. r est la probabilité de la première classe.
+    """
+    q = 1.0 - r
+    Q = [[q * q, -q * r], [-q * r, r * r]]
+    p = [np.full_like(r, 0.5), np.full_like(r, 0.5)]
+    for _ in range(LIBSVM_MAX_ITER):
+        Qp = [Q[0][0] * p[0] + Q[0][1] * p[1], Q[1][0] * p[0] + Q[1][1] * p[1]]
+        pQp = p[0] * Qp[0] + p[1] * Qp[1]
+        active = np.maximum(np.abs(Qp[0] - pQp), np.abs(Qp[1] - pQp)) >= LIBSVM_EPS
+        if not active.any():
+            break
+        for t in range(2):
+            diff = np.where(active, (pQp - Qp[t]) / Q[t][t], 0.0)
+            p[t] = p[t] + diff
+            pQp = (pQp + diff * (diff * Q[t][t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+            Qp = [(Qp[j] + diff * Q[t][j]) / (1 + diff) for j in range(2)]
+            p = [p[j] / (1 + diff) for j in range(2)]
+    return p[0]
+
+
+class FlatForest:
+    """Forêt d'arbres stockée en tableaux de nœuds ; toutes les lignes et tous les arbres avancent ensemble"""
+
+    def __init__(self, data):
+        self.left = data['tree_left']
+        self.right = data['tree_right']
+        self.feature = data['tree_feature']
+        self.threshold = data['tree_threshold']
+        self.value = data['tree_value']
+        self.roots = data['tree_roots']
+        self.max_depth = int(data['tree_max_depth'])
+
+    def leaves(self, X):
+        # scikit-learn compare des caractéristiques float32 à des seuils float64
+        X32 = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X32.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (X32.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            go_left = X32[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(left < 0, nodes, np.where(go_left, left, self.right[nodes]))
+        return nodes
+
+    def mean_value(self, X):
+        """Moyenne des feuilles atteintes sur l'ensemble des arbres"""
+        return self.value[self.leaves(X)].mean(axis=1)
+
+
+class CompactModel:
+    """Base commune : ordre des caractéristiques et standardisation"""
+
+    def __init__(self, data):
+        self.data = data
+        self.vector = FeatureVector(data['features'].tolist())
+        self.mean = data['mean']
+        self.scale = data['scale']
+        self.estimator = str(data['estimator'])
+        self.source = str(data['source'])
+
+    def standardize(self, X):
+        return (X - self.mean) / self.scale
+
+
+class CompactRegression(CompactModel):
+    def __init__(self, data):
+        super().__init__(data)
+        self.fused = self.estimator == 'linear'
+        if self.fused:
+            self.weights = data['weights']
+            self.bias = float(data['bias'])
+        else:
+            self.forest = FlatForest(data)
+
+    def transform(self, X):
+        return X if self.fused else self.standardize(X)
+
+    def predict_transformed(self, X):
+        if self.fused:
+            return X @ self.weights + self.bias
+        return self.forest.mean_value(X)
+
+    def predict(self, X):
+        return self.predict_transformed(self.transform(X))
+
+    def predict_record(self, json_data):
+        return float(self.predict(self.vector.fill(json_data))[0])
+
+
+class CompactClassifier(CompactModel):
+    def __init__(self, data):
+        super().__init__(data)
+        self.classes = data['classes']
+        self.fused = self.estimator == 'logistic'
+        if self.fused:
+            self.weights = data['weights']
+            self.bias = float(data['bias'])
+        elif self.estimator == 'forest':
+            self.forest = FlatForest(data)
+        elif self.estimator == 'nystroem':
+            self.components = data['components']
+            self.component_norms = np.einsum('ij,ij->i', self.components, self.components)
+            self.gamma = float(data['gamma'])
+            self.weights = data['weights']
+            self.bias = float(data['bias'])
+        else:
+            self.kernel = str(data['kernel'])
+            self.gamma = float(data['gamma'])
+            self.support_vectors = data['support_vectors']
+            self.sv_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+            self.dual_coef = data['dual_coef']
+            self.intercept = float(data['intercept'])
+            self.prob_a = float(data['prob_a'])
+            self.prob_b = float(data['prob_b'])
+
+    def transform(self, X):
+        return X if self.fused else self.standardize(X)
+
+    def svc_decision(self, X):
+        """Équivalent de SVC.decision_function pour un problème binaire"""
+        if self.kernel == 'linear':
+            kernel = X @ self.support_vectors.T
+        else:
+            kernel = rbf_kernel(X, self.support_vectors, self.sv_norms, self.gamma)
+        return kernel @ self.dual_coef + self.intercept
+
+    def predict_transformed(self, X):
+        """Renvoie (classes prédites, probabilités) comme predict/predict_proba"""
+        if self.fused:
+            return logistic_output(X @ self.weights + self.bias, self.classes)
+        if self.estimator == 'nystroem':
+            kernel = rbf_kernel(X, self.components, self.component_norms, self.gamma)
+            return logistic_output(kernel @ self.weights + self.bias, self.classes)
+        if self.estimator == 'forest':
+            probabilities = self.forest.mean_value(X)
+            return self.classes[np.argmax(probabilities, axis=1)], probabilities
+        decision = self.svc_decision(X)
+        # Platt (libsvm) : la valeur de décision interne de libsvm est l'opposé de decision_function
+        first = np.exp(-np.logaddexp(0.0, -decision * self.prob_a + self.prob_b))
+        first = libsvm_binary_probability(np.clip(first, LIBSVM_MIN_PROB, 1.0 - LIBSVM_MIN_PROB))
+        # predict suit le signe de la décision, pas les probabilités (comme scikit-learn)
+        return self.classes[(decision > 0).astype(int)], np.column_stack([first, 1.0 - first])
+
+    def predict(self, X):
+        return self.predict_transformed(self.transform(X))
+
+    def predict_record(self, json_data):
+        predictions, probabilities = self.predict(self.vector.fill(json_data))
+        return int(predictions[0]), probabilities[0]
+
+
+class CompactKMeans(CompactModel):
+    def __init__(self, data, profiles=None):
+        super().__init__(data)
+        self.centroids = data['centroids']
+        self.index = CentroidIndex(self.centroids, data['inv_scale'])
+        self.n_clusters = self.index.n_clusters
+        if profiles is None and 'profiles' in data:
+            profiles = data['profiles'].tolist()
+        self.profiles = list(profiles) if profiles is not None else [f"Cluster {i}" for i in range(self.n_clusters)]
+
+    def transform(self, X):
+        return X
+
+    def distances(self, X):
+        return self.index.distances(X)
+
+    def assign(self, X, top_k=1):
+        return self.index.assign(X, top_k)
+
+    def predict_record(self, json_data):
+        distances = self.distances(self.vector.fill(json_data))[0]
+        return int(np.argmin(distances)), distances
+
+
+RUNTIMES = {'regression': CompactRegression, 'classification': CompactClassifier, 'kmeans': CompactKMeans}
+
+
+def load_arrays(path):
+    """Lit un fichier compact (sans pickle) et vérifie sa version"""
+    with np.load(path, allow_pickle=False) as npz:
+        data = {key: npz[key] for key in npz.files}
+    version = int(data.get('format_version', -1))
+    if version != FORMAT_VERSION:
+        raise CompactFormatError(f"{path}: version de format {version} non prise en charge (attendue {FORMAT_VERSION})")
+    return data
+
+
+def load_compact(path):
+    data = load_arrays(path)
+    return RUNTIMES[str(data['kind'])](data)
+
+
+# ----------------------------------------------------------------------
+# Export des artefacts .pkl du répertoire courant
+# ----------------------------------------------------------------------
+
+def export_all(source_dir='.', output_dir=COMPACT_DIR, classification_prefix='improved_classification'):
+    """Compile les trois groupes .pkl en regression.npz, classification.npz et kmeans.npz
+
+    L'approximation Nystroem du classifieur ({classification_prefix}_approx_*.pkl), si elle existe,
+    est exportée en plus dans classification_approx.npz.
+    """
+    groups = [
+        ('regression', 'regression', 'regression'),
+        ('classification', 'classification', classification_prefix),
+        ('kmeans', 'kmeans', 'kmeans'),
+    ]
+    approx_prefix = f'{classification_prefix}_approx'
+    if os.path.exists(os.path.join(source_dir, f'{approx_prefix}_model.pkl')):
+        groups.append(('classification_approx', 'classification', approx_prefix))
+    written = []
+    for name, kind, prefix in groups:
+        load = lambda role: joblib.load(os.path.join(source_dir, f'{prefix}_{role}.pkl'))
+        profiles_path = os.path.join(source_dir, f'{prefix}_profiles.pkl')
+        profiles = joblib.load(profiles_path) if kind == 'kmeans' and os.path.exists(profiles_path) else None
+        arrays = export_arrays(kind, load('scaler'), load('model'), load('features'), profiles)
+        path = os.path.join(output_dir, f'{name}.npz')
+        save_compact(path, arrays)
+        written.append(path)
+        print(f"{path}: {arrays['source']} -> {arrays['estimator']} ({os.path.getsize(path)} octets)")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export des modèles .pkl au format compact .npz")
+    parser.add_argument('--source-dir', default='.')
+    parser.add_argument('--output-dir', default=COMPACT_DIR)
+    parser.add_argument('--classification-prefix', default='improved_classification')
+    args = parser.parse_args()
+    export_all(args.source_dir, args.output_dir, args.classification_prefix)
@@ -7,6 +7,9 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 
+from drift_monitor import save_reference
+from train_kmeans import cluster_profiles
+
 print("Ce script convertit les fichiers .pkl pour qu'ils soient compatibles avec la version de numpy/scikit-learn dans Docker.")
 
 # Vérifier si les fichiers d'origine existent
@@ -54,6 +57,7 @@ model_reg.fit(X_reg_scaled, y_reg)
 
 joblib.dump(model_reg, 'regression_model.pkl')
 joblib.dump(scaler_reg, 'regression_scaler.pkl')
+save_reference('regression', X_reg, regression_features)
 print("regression_model.pkl et regression_scaler.pkl créés")
 
 # Modèle de classification
@@ -69,6 +73,7 @@ model_class.fit(X_class_scaled, y_class)
 
 joblib.dump(model_class, 'improved_classification_model.pkl')
 joblib.dump(scaler_class, 'improved_classification_scaler.pkl')
+save_reference('improved_classification', X_class, classification_features)
 print("improved_classification_model.pkl et improved_classification_scaler.pkl créés")
 
 # Modèle KMeans - Ajout d'échantillons supplémentaires pour avoir au moins 4 échantillons
@@ -89,7 +94,10 @@ kmeans.fit(X_kmeans_scaled)
 
 joblib.dump(kmeans, 'kmeans_model.pkl')
 joblib.dump(scaler_kmeans, 'kmeans_scaler.pkl')
-print("kmeans_model.pkl et kmeans_scaler.pkl créés")
+# Profils des clusters de démonstration (le kmeans_profiles.pkl du dépôt décrit le modèle entraîné)
+joblib.dump(cluster_profiles(kmeans.cluster_centers_, kmeans_features), 'kmeans_profiles.pkl')
+save_reference('kmeans', X_kmeans, kmeans_features)
+print("kmeans_model.pkl, kmeans_scaler.pkl et kmeans_profiles.pkl créés")
 
 # Colonnes du modèle
 model_columns = list(demo_data.columns)
@@ -0,0 +1,255 @@
+# Surveillance de la dérive des entrées : histogrammes à bornes fixes par caractéristique et par modèle.
+# Les bornes (quantiles) et les effectifs de référence sont calculés à l'entraînement ; en service,
+# chaque ligne validée incrémente une case par caractéristique : temps et mémoire constants par requête
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+import numpy as np
+
+REFERENCE_FILE = 'drift_reference.json'
+
+# Nombre de classes des histogrammes (quantiles de la référence : ~10 % des lignes par classe)
+DEFAULT_BINS = 10
+
+# Seuils usuels de l'indice de stabilité (PSI) : < 0.1 stable, 0.1-0.25 à surveiller, > 0.25 dérive
+PSI_WARNING = 0.1
+PSI_ALERT = 0.25
+
+# En dessous, l'échantillon de trafic est trop petit pour conclure
+MIN_LIVE_ROWS = 100
+
+# Proportion plancher dans le calcul du PSI (classe vide d'un côté)
+EPSILON = 1e-4
+
+
+def reference_sketch(X, features, bins=DEFAULT_BINS):
+    """Bornes (quantiles distincts), effectifs et moments de chaque caractéristique des données d'entraînement"""
+    X = np.asarray(X, dtype=float)
+    quantiles = np.linspace(0, 1, bins + 1)[1:-1]
+    edges, counts = [], []
+    for column in X.T:
+        column_edges = np.unique(np.quantile(column, quantiles))
+        edges.append(column_edges.tolist())
+        counts.append(np.bincount(np.searchsorted(column_edges, column, side='left'),
+                                  minlength=len(column_edges) + 1).tolist())
+    return {
+        'features': [str(f) for f in features],
+        'rows': int(len(X)),
+        'edges': edges,
+        'counts': counts,
+        'mean': X.mean(axis=0).tolist(),
+        'std': X.std(axis=0).tolist(),
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def save_reference(section, X, features, path=REFERENCE_FILE, output_dir='.', bins=DEFAULT_BINS):
+    """Écrit la référence d'un groupe de fichiers ({section}_*.pkl) sans toucher aux autres sections"""
+    path = os.path.join(output_dir, path)
+    content = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            content = json.load(f)
+    content[section] = reference_sketch(X, features, bins)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+    os.replace(tmp, path)
+    return path
+
+
+def population_stability(expected, observed):
+    """PSI entre deux histogrammes de mêmes classes"""
+    p = np.maximum(expected / max(expected.sum(), 1), EPSILON)
+    q = np.maximum(observed / max(observed.sum(), 1), EPSILON)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def drift_status(psi, live_rows):
+    if live_rows < MIN_LIVE_ROWS:
+        return 'insufficient_data'
+    if psi > PSI_ALERT:
+        return 'drift'
+    if psi > PSI_WARNING:
+        return 'warning'
+    return 'stable'
+
+
+class ModelSketch:
+    """Histogrammes du trafic d'un modèle, sur les classes de sa référence
+
+    Deux fenêtres glissantes de `window` lignes (précédente et courante) : la comparaison porte sur
+    les 1 à 2 dernières fenêtres, la mémoire reste de 2 × caractéristiques × classes compteurs.
+    Une ligne coûte une recherche dichotomique par caractéristique ; les compteurs sont des listes
+    Python, plus rapides que des opérations NumPy sur une seule valeur.
+    """
+
+    def __init__(self, reference, window=10000):
+        self.reference = reference
+        self.features = reference['features']
+        self.index = {name: i for i, name in enumerate(self.features)}
+        # Classe d'une valeur : bisect_left(bornes, valeur), comme searchsorted(side='left') à l'entraînement
+        self.edges = [list(edges) for edges in reference['edges']]
+        self.expected = [np.asarray(counts, dtype=float) for counts in reference['counts']]
+        self.window = max(1, int(window))
+        self.lock = threading.Lock()
+        self._plans = {}
+        self._previous = self._empty()
+        self._current = self._empty()
+
+    def _empty(self):
+        return {'rows': 0, 'counts': [[0] * (len(edges) + 1) for edges in self.edges],
+                'sum': [0.0] * len(self.features), 'sum_sq': [0.0] * len(self.features)}
+
+    def plan(self, features):
+        """[(colonne de la ligne servie, indice de la référence, bornes)] des caractéristiques communes
+
+        Calculé une fois par liste de caractéristiques (celle du modèle compilé).
+        """
+        cached = self._plans.get(id(features))
+        if cached is None or cached[0] is not features:
+            steps = [(j, self.index[name], self.edges[self.index[name]])
+                     for j, name in enumerate(features) if name in self.index]
+            cached = (features, steps)
+            self._plans[id(features)] = cached
+        return cached[1]
+
+    def observe(self, features, matrix):
+        """Ajoute des lignes validées (dans l'ordre `features`) aux histogrammes"""
+        steps = self.plan(features)
+        if len(matrix) == 1:
+            values = matrix[0].tolist()
+            with self.lock:
+                current = self._current
+                counts, sums, squares = current['counts'], current['sum'], current['sum_sq']
+                for j, i, edges in steps:
+                    value = values[j]
+                    counts[i][bisect_left(edges, value)] += 1
+                    sums[i] += value
+                    squares[i] += value * value
+                current['rows'] += 1
+                self._rotate()
+            return
+        # Lot : une passe vectorisée par caractéristique
+        updates = []
+        for j, i, edges in steps:
+            column = matrix[:, j]
+            bins = np.searchsorted(edges, column, side='left')
+            updates.append((i, np.bincount(bins, minlength=len(edges) + 1).tolist(),
+                            float(column.sum()), float(np.dot(column, column))))
+        with self.lock:
+            current = self._current
+            for i, added, total, squares in updates:
+                current['counts'][i] = [a + b for a, b in zip(current['counts'][i], added)]
+                current['sum'][i] += total
+                current['sum_sq'][i] += squares
+            current['rows'] += len(matrix)
+            self._rotate()
+
+    def _rotate(self):
+        if self._current['rows'] >= self.window:
+            self._previous, self._current = self._current, self._empty()
+
+    def snapshot(self):
+        with self.lock:
+            windows = [self._previous, self._current]
+            return {
+                'rows': sum(w['rows'] for w in windows),
+                'counts': [np.add(*counts) for counts in zip(*(w['counts'] for w in windows))],
+                'sum': np.add(*(w['sum'] for w in windows)),
+                'sum_sq': np.add(*(w['sum_sq'] for w in windows)),
+            }
+
+    def report(self):
+        live = self.snapshot()
+        features = {}
+        worst = 'stable'
+        order = ['stable', 'insufficient_data', 'warning', 'drift']
+        for i, name in enumerate(self.features):
+            observed = np.asarray(live['counts'][i], dtype=float)
+            expected = self.expected[i]
+            rows = int(observed.sum())
+            psi = population_stability(expected, observed) if rows else None
+            status = drift_status(psi, rows) if rows else 'insufficient_data'
+            expected_cdf = np.cumsum(expected) / max(expected.sum(), 1)
+            observed_cdf = np.cumsum(observed) / max(rows, 1)
+            mean = live['sum'][i] / rows if rows else None
+            features[name] = {
+                'status': status,
+                'psi': round(psi, 4) if psi is not None else None,
+                'ks': round(float(np.abs(expected_cdf - observed_cdf).max()), 4) if rows else None,
+                'live_rows': rows,
+                'live_mean': round(float(mean), 4) if rows else None,
+                'live_std': round(float(np.sqrt(max(live['sum_sq'][i] / rows - mean ** 2, 0.0))), 4) if rows else None,
+                'reference_mean': round(self.reference['mean'][i], 4),
+                'reference_std': round(self.reference['std'][i], 4),
+            }
+            worst = max(worst, status, key=order.index)
+        return {
+            'status': worst,
+            'live_rows': live['rows'],
+            'window': self.window,
+            'reference_rows': self.reference['rows'],
+            'reference_generated_at': self.reference.get('generated_at'),
+            'features': features,
+        }
+
+
+class DriftMonitor:
+    """Histogrammes par modèle servi ; sections : {modèle: section de drift_reference.json}"""
+
+    def __init__(self, path, sections, window=10000):
+        self.path = path
+        self.sections = dict(sections)
+        self.window = window
+        self.sketches = {}
+        self.error = None
+        self.reload()
+
+    def reload(self):
+        """Relit les références (après un réentraînement) ; les histogrammes des sections modifiées repartent de zéro"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            self.error = f"Drift reference unavailable: {str(e)}"
+            return
+        sketches = {}
+        for model, section in self.sections.items():
+            reference = content.get(section)
+            if reference is None:
+                continue
+            previous = self.sketches.get(model)
+            if previous is not None and previous.reference == reference:
+                sketches[model] = previous
+            else:
+                sketches[model] = ModelSketch(reference, self.window)
+        self.sketches = sketches
+        self.error = None
+
+    def observe(self, model, features, matrix):
+        sketch = self.sketches.get(model)
+        if sketch is not None:
+            sketch.observe(features, matrix)
+
+    def report(self, models=None):
+        names = [m for m in (models or self.sections) if m in self.sections]
+        result = {}
+        for model in names:
+            sketch = self.sketches.get(model)
+            if sketch is None:
+                result[model] = {'status': 'no_reference', 'section': self.sections[model]}
+            else:
+                result[model] = dict(sketch.report(), section=self.sections[model])
+        return result
+
+    def psi_values(self):
+        """[(modèle, caractéristique, PSI)] pour /metrics"""
+        values = []
+        for model, sketch in self.sketches.items():
+            for name, entry in sketch.report()['features'].items():
+                if entry['psi'] is not None:
+                    values.append((model, name, entry['psi']))
+        return values
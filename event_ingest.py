@@ -0,0 +1,456 @@
+# Ingestion de sessions de stationnement terminées et mise à jour incrémentale des modèles.
+# Les sessions validées sont ajoutées à un journal sur disque borné (segments CSV au format de
+# cleaned_smart_parking_data.csv) ; un thread relit le journal par mini-lots, applique partial_fit aux
+# modèles supervisés et la moyenne cumulée aux centroïdes KMeans, puis réécrit les artefacts d'un bloc :
+# le registre de chaque worker les recharge comme après un réentraînement, sans bloquer les requêtes.
+import glob
+import json
+import os
+import threading
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+from compact_models import export_arrays, save_compact
+from fast_inference import CentroidIndex
+from feature_store import CSV_DTYPES, preprocess_frame
+from model_registry import dump_group_atomic, file_checksum
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+# Colonnes d'une session, dans l'ordre de cleaned_smart_parking_data.csv
+SESSION_COLUMNS = ['Timestamp', 'Parking_Spot_ID', 'User_Type', 'Weather_Precipitation', 'Nearby_Traffic_Level',
+                   'Entry_Time', 'Exit_Time', 'Electric_Vehicle', 'Reserved_Status', 'Payment_Amount',
+                   'Parking_Lot_Section', 'Payment_Status', 'Occupancy_Status', 'Vehicle_Type', 'Parking_Duration',
+                   'Spot_Size', 'Proximity_To_Exit', 'User_Parking_History', 'occupancy', 'Weather_Category',
+                   'Vehicle_Size']
+TIME_COLUMNS = ['Entry_Time', 'Exit_Time']
+BOOLEAN_VALUES = {True: True, False: False, 'true': True, 'false': False}
+
+SEGMENT_PATTERN = 'events-*.csv'
+
+# Cible utilisée par partial_fit pour chaque groupe supervisé
+GROUP_TARGETS = {'regression': 'Parking_Duration', 'classification': 'occupancy'}
+
+
+# ----------------------------------------------------------------------
+# Validation des sessions
+# ----------------------------------------------------------------------
+
+def category_lookup(dtype):
+    """Modalités acceptées, casse et espaces ignorés ('Cool' -> 'Cool ')"""
+    return {str(level).strip().lower(): level for level in dtype.categories}
+
+
+def validate_sessions(records):
+    """Sessions valides (types de cleaned_smart_parking_data.csv) et erreurs {indice: message}
+
+    Chaque enregistrement est contrôlé indépendamment : une session invalide n'empêche pas
+    l'ajout des autres.
+    """
+    errors = {}
+    kept = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors[i] = "Record must be a JSON object"
+            continue
+        missing = [col for col in SESSION_COLUMNS if col not in record]
+        if missing:
+            errors[i] = f"Missing column(s): {', '.join(missing)}"
+            continue
+        kept.append(i)
+    if not kept:
+        return pd.DataFrame(columns=SESSION_COLUMNS), errors
+
+    raw = pd.DataFrame([[records[i][col] for col in SESSION_COLUMNS] for i in kept],
+                       columns=SESSION_COLUMNS, dtype=object)
+    columns = {}
+    invalid = {}
+    for col in SESSION_COLUMNS:
+        values = raw[col]
+        dtype = CSV_DTYPES.get(col)
+        if col == 'Timestamp':
+            parsed = pd.to_datetime(values.astype(str), format='ISO8601', errors='coerce')
+            ok = parsed.notna().to_numpy()
+            columns[col] = parsed.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        elif col in TIME_COLUMNS:
+            parsed = pd.to_datetime(values.astype(str), format='%H:%M:%S', errors='coerce')
+            ok = parsed.notna().to_numpy()
+            columns[col] = parsed.dt.strftime('%H:%M:%S')
+        elif isinstance(dtype, pd.CategoricalDtype):
+            lookup = category_lookup(dtype)
+            mapped = values.map(lambda v: lookup.get(v.strip().lower()) if isinstance(v, str) else None)
+            ok = mapped.notna().to_numpy()
+            columns[col] = mapped
+        elif dtype == 'bool':
+            # Listes et objets JSON ne sont pas hachables : seuls les scalaires sont cherchés
+            mapped = values.map(lambda v: BOOLEAN_VALUES.get(v.strip().lower() if isinstance(v, str) else v)
+                                if isinstance(v, (bool, int, float, str)) else None)
+            ok = mapped.notna().to_numpy()
+            columns[col] = mapped
+        else:
+            numbers = pd.to_numeric(values.where(values.map(lambda v: not isinstance(v, bool))), errors='coerce')
+            ok = np.isfinite(numbers.to_numpy(dtype=float))
+            if dtype == 'int64':
+                ok &= np.mod(np.nan_to_num(numbers.to_numpy(dtype=float)), 1) == 0
+            columns[col] = numbers
+        for position in np.flatnonzero(~ok):
+            invalid.setdefault(kept[position], []).append(col)
+
+    for index, cols in invalid.items():
+        errors[index] = '; '.join(f"Invalid value for {col}" for col in cols)
+    valid = np.array([i not in invalid for i in kept], dtype=bool)
+    frame = pd.DataFrame({col: values[valid] for col, values in columns.items()}, columns=SESSION_COLUMNS)
+    frame = frame.astype({col: dtype for col, dtype in CSV_DTYPES.items() if col in frame.columns})
+    return frame.reset_index(drop=True), dict(sorted(errors.items()))
+
+
+# ----------------------------------------------------------------------
+# Journal sur disque
+# ----------------------------------------------------------------------
+
+class FileLock:
+    """Verrou exclusif partagé par les threads et, avec fcntl, par les workers gunicorn"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.Lock()
+        self.handle = None
+
+    def __enter__(self):
+        self.local.acquire()
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.handle = open(self.path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.local.release()
+
+
+class EventLog:
+    """Segments CSV numérotés par leur première ligne ; les plus anciens sont supprimés au-delà de max_rows"""
+
+    def __init__(self, directory, segment_rows=10000, max_rows=500000):
+        self.directory = directory
+        self.segment_rows = max(1, segment_rows)
+        self.max_rows = max(self.segment_rows, max_rows)
+        self.lock = FileLock(os.path.join(directory, '.lock'))
+
+    def segment_path(self, start):
+        return os.path.join(self.directory, f'events-{start:012d}.csv')
+
+    def segments(self):
+        """[(première ligne, chemin)] du plus ancien au plus récent"""
+        paths = glob.glob(os.path.join(self.directory, SEGMENT_PATTERN))
+        return sorted((int(os.path.basename(p)[len('events-'):-len('.csv')]), p) for p in paths)
+
+    @staticmethod
+    def count_rows(path):
+        with open(path, 'rb') as f:
+            return max(0, f.read().count(b'\n') - 1)  # sans l'en-tête
+
+    def bounds(self, segments):
+        """(première ligne conservée, prochaine ligne à écrire)"""
+        if not segments:
+            return 0, 0
+        start, path = segments[-1]
+        return segments[0][0], start + self.count_rows(path)
+
+    def append(self, frame):
+        """Ajoute des sessions validées ; renvoie la position (globale) de la première"""
+        with self.lock:
+            segments = self.segments()
+            first, end = self.bounds(segments)
+            position = 0
+            while position < len(frame):
+                start = segments[-1][0] if segments else end
+                room = self.segment_rows - (end - start)
+                if not segments or room <= 0:
+                    segments.append((end, self.segment_path(end)))
+                    start, room = end, self.segment_rows
+                part = frame.iloc[position:position + room]
+                path = segments[-1][1]
+                part.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+                position += len(part)
+                end += len(part)
+            # Borne du journal : suppression des segments les plus anciens (jamais du segment courant)
+            while len(segments) > 1 and end - segments[0][0] > self.max_rows:
+                os.remove(segments.pop(0)[1])
+            return end - len(frame)
+
+    def read(self, cursor, limit):
+        """Jusqu'à `limit` sessions à partir de la ligne `cursor` : (frame, nouveau curseur, lignes perdues)
+
+        Si le curseur pointe avant le plus ancien segment conservé (lecteur en retard sur la rotation),
+        la lecture reprend au début du journal et les lignes supprimées sont comptées comme perdues.
+        """
+        with self.lock:
+            segments = self.segments()
+            first, end = self.bounds(segments)
+            dropped = max(0, first - cursor)
+            cursor = max(cursor, first)
+            chunks = []
+            wanted = min(limit, end - cursor)
+            for i, (start, path) in enumerate(segments):
+                stop = segments[i + 1][0] if i + 1 < len(segments) else end
+                if stop <= cursor or wanted <= 0:
+                    continue
+                skip = cursor - start
+                rows = min(stop - cursor, wanted)
+                chunk = pd.read_csv(path, dtype=CSV_DTYPES, skiprows=range(1, skip + 1), nrows=rows)
+                chunks.append(chunk)
+                cursor += len(chunk)
+                wanted -= len(chunk)
+        frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=SESSION_COLUMNS)
+        return frame, cursor, dropped
+
+    def status(self):
+        segments = self.segments()
+        first, end = self.bounds(segments)
+        return {
+            "first_row": first,
+            "next_row": end,
+            "rows": end - first,
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(path) for _, path in segments),
+            "max_rows": self.max_rows
+        }
+
+
+# ----------------------------------------------------------------------
+# Mises à jour incrémentales
+# ----------------------------------------------------------------------
+
+def initial_counts(model, n_samples):
+    """Effectif de chaque centroïde à l'entraînement (poids des centroïdes dans la moyenne cumulée)"""
+    k = len(model.cluster_centers_)
+    if getattr(model, '_counts', None) is not None:  # MiniBatchKMeans
+        return np.asarray(model._counts, dtype=float)
+    if getattr(model, 'labels_', None) is not None:
+        return np.bincount(model.labels_, minlength=k).astype(float)
+    return np.full(k, max(1.0, n_samples / k))
+
+
+def update_centroids(scaler, model, X, counts):
+    """Scaler et centroïdes mis à jour par mini-lot ; renvoie les nouveaux effectifs
+
+    Chaque centroïde devient la moyenne cumulée des points qui lui ont été affectés (taux
+    d'apprentissage 1/effectif, comme MiniBatchKMeans). Les centroïdes sont d'abord ramenés à l'échelle
+    d'origine pour rester au même endroit quand le scaler change.
+    """
+    raw_centers = scaler.mean_ + scaler.scale_ * np.asarray(model.cluster_centers_, dtype=float)
+    scaler.partial_fit(X)
+    centers = (raw_centers - scaler.mean_) / scaler.scale_
+    labels = CentroidIndex(raw_centers, 1.0 / scaler.scale_).assign(np.asarray(X, dtype=float))[0][:, 0]
+    Z = scaler.transform(X)
+    k = len(centers)
+    batch_counts = np.bincount(labels, minlength=k).astype(float)
+    sums = np.zeros_like(centers)
+    np.add.at(sums, labels, Z)
+    counts = counts + batch_counts
+    moved = batch_counts > 0
+    centers[moved] += (sums[moved] - batch_counts[moved, np.newaxis] * centers[moved]) / counts[moved, np.newaxis]
+    model.cluster_centers_ = centers
+    return counts
+
+
+class IncrementalUpdater:
+    """Thread de fond : journal -> partial_fit des modèles supervisés et moyenne cumulée des centroïdes
+
+    Un seul processus applique les mises à jour (verrou sur updater.lock) ; les autres workers
+    voient les nouveaux fichiers par la surveillance du registre. Le scaler des modèles supervisés
+    reste figé : leurs coefficients sont exprimés dans son espace, le déplacer sans les convertir
+    fausserait les prédictions. Les groupes dont le modèle n'a pas de partial_fit (LinearRegression,
+    SVC, approximation Nystroem...) ne sont pas modifiés.
+    """
+
+    def __init__(self, log, specs, base_dir='.', min_rows=100, batch_rows=10000, compact_dir=None,
+                 on_publish=None):
+        self.log = log
+        self.specs = {spec.name: spec for spec in specs}
+        self.base_dir = base_dir
+        self.min_rows = max(1, min_rows)
+        self.batch_rows = max(self.min_rows, batch_rows)
+        self.compact_dir = compact_dir
+        self.on_publish = on_publish
+        self.state_path = os.path.join(log.directory, 'updater_state.json')
+        # Verrou inter-processus : /ingest/update peut être appelé dans un autre worker que le thread de fond
+        self.lock = FileLock(os.path.join(log.directory, '.update.lock'))
+        self._leader = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_error = None
+
+    def path(self, filename):
+        return os.path.join(self.base_dir, filename)
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        # Premier démarrage : les sessions déjà présentes dans le journal sont appliquées
+        return {"cursor": 0, "updates": 0, "applied": 0, "dropped": 0, "groups": {}}
+
+    def save_state(self, state):
+        os.makedirs(self.log.directory, exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def update_group(self, name, features_frame, state):
+        """Met à jour un groupe et réécrit ses fichiers ; renvoie None ou la raison de l'abandon"""
+        files = {role: self.path(filename) for role, filename in self.specs[name].files.items()}
+        if not all(os.path.exists(files[role]) for role in ('features', 'model', 'scaler')):
+            return "artefacts absents"
+        model = joblib.load(files['model'])
+        if name != 'kmeans' and not hasattr(model, 'partial_fit'):
+            return f"{type(model).__name__} sans partial_fit (réentraînement complet nécessaire)"
+        features = [str(f) for f in joblib.load(files['features'])]
+        missing = [f for f in features if f not in features_frame.columns]
+        if missing:
+            return f"caractéristiques absentes des sessions: {', '.join(missing)}"
+        scaler = joblib.load(files['scaler'])
+        X = features_frame[features].astype(float)
+        if not hasattr(scaler, 'feature_names_in_'):
+            X = X.to_numpy()  # scaler ajusté sur une matrice : pas de vérification des noms
+
+        group_state = state["groups"].get(name, {})
+        if name == 'kmeans':
+            # Effectifs repris de l'état si le modèle est celui que nous avons écrit, sinon réinitialisés
+            counts = group_state.get("counts")
+            if counts is None or group_state.get("checksum") != file_checksum(files['model']):
+                counts = initial_counts(model, scaler.n_samples_seen_)
+            counts = update_centroids(scaler, model, X, np.asarray(counts, dtype=float))
+            group_state["counts"] = counts.tolist()
+        else:
+            # Scaler inchangé : un pas de partial_fit dans l'espace où le modèle a été appris
+            model.partial_fit(scaler.transform(X), features_frame[GROUP_TARGETS[name]].to_numpy())
+
+        # Scaler et modèle publiés ensemble : le registre ne charge jamais l'un sans l'autre
+        dump_group_atomic({files['scaler']: scaler, files['model']: model})
+        if self.compact_dir is not None:
+            profiles = joblib.load(files['profiles']) if os.path.exists(files.get('profiles', '')) else None
+            save_compact(os.path.join(self.compact_dir, f'{name}.npz'),
+                         export_arrays(name, scaler, model, features, profiles))
+        group_state.update({
+            "checksum": file_checksum(files['model']),
+            "events": group_state.get("events", 0) + len(X),
+            "updated_at": time.strftime('%Y-%m-%dT%H:%M:%S')
+        })
+        state["groups"][name] = group_state
+        return None
+
+    def run_once(self, force=False):
+        """Applique les sessions en attente (au moins min_rows sauf force) ; renvoie un résumé ou None"""
+        with self.lock:
+            state = self.load_state()
+            pending = self.log.status()["next_row"] - state["cursor"]
+            if pending <= 0 or (pending < self.min_rows and not force):
+                return None
+            events, cursor, dropped = self.log.read(state["cursor"], self.batch_rows)
+            summary = {"events": len(events), "dropped": dropped, "updated": [], "skipped": {}}
+            if len(events):
+                features_frame = preprocess_frame(events)
+                for name in self.specs:
+                    reason = self.update_group(name, features_frame, state)
+                    if reason is None:
+                        summary["updated"].append(name)
+                    else:
+                        summary["skipped"][name] = reason
+            state.update({
+                "cursor": cursor,
+                "updates": state["updates"] + 1,
+                "applied": state["applied"] + len(events),
+                "dropped": state["dropped"] + dropped,
+                "last_update": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "last_summary": summary
+            })
+            self.save_state(state)
+        if summary["updated"] and self.on_publish is not None:
+            self.on_publish()
+        return summary
+
+    # ------------------------------------------------------------------
+    # Thread de fond
+    # ------------------------------------------------------------------
+
+    def acquire_leadership(self):
+        """Vrai si ce processus est (ou devient) celui qui applique les mises à jour"""
+        if fcntl is None or self._leader is not None:
+            return True
+        os.makedirs(self.log.directory, exist_ok=True)
+        handle = open(os.path.join(self.log.directory, 'updater.lock'), 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._leader = handle
+        return True
+
+    def release_leadership(self):
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+
+    def start(self, interval):
+        """Vérifie le journal toutes les `interval` secondes (0 = désactivé)"""
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                # Si le processus qui appliquait les mises à jour s'arrête, un autre prend le relais
+                if not self.acquire_leadership():
+                    continue
+                try:
+                    while True:
+                        summary = self.run_once()
+                        if summary is None or summary["events"] < self.batch_rows or self._stop.is_set():
+                            break
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Erreur de mise à jour incrémentale: {str(e)}")
+            self.release_leadership()
+
+        self._thread = threading.Thread(target=loop, name='incremental-updater', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.release_leadership()
+
+    def status(self):
+        state = self.load_state()
+        log = self.log.status()
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "leader": self._leader is not None,
+            "cursor": state["cursor"],
+            "pending": max(0, log["next_row"] - state["cursor"]),
+            "updates": state["updates"],
+            "applied": state["applied"],
+            "dropped": state["dropped"],
+            "last_update": state.get("last_update"),
+            "last_summary": state.get("last_summary"),
+            "groups": {name: {k: v for k, v in info.items() if k != 'counts'}
+                       for name, info in state["groups"].items()},
+            "last_error": self.last_error,
+            "log": log
+        }
@@ -0,0 +1,347 @@
+# Chemin d'inférence précompilé : sans DataFrame, avec le scaler fusionné dans le modèle
+import operator
+import threading
+import numpy as np
+
+# Régresseurs linéaires dont le StandardScaler peut être replié dans les coefficients
+LINEAR_REGRESSORS = {'LinearRegression', 'Ridge', 'Lasso', 'ElasticNet', 'SGDRegressor'}
+# Classifieurs linéaires binaires dont predict_proba vaut sigmoid(decision_function)
+LOGISTIC_CLASSIFIERS = {'LogisticRegression', 'SGDClassifier'}
+
+
+# Clé des erreurs qui portent sur l'enregistrement entier plutôt que sur une caractéristique
+RECORD_ERROR = '_record'
+# Chaînes acceptées pour les caractéristiques booléennes
+BOOLEAN_STRINGS = {'true': 1.0, 'false': 0.0, 'yes': 1.0, 'no': 0.0}
+
+
+class ValidationError(ValueError):
+    """Levée quand un enregistrement est invalide ; errors : {caractéristique: raison}, toutes à la fois"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(self.message())
+
+    def message(self):
+        missing = [feature for feature, reason in self.errors.items() if reason == 'missing']
+        parts = [f"Missing feature{'s' if len(missing) > 1 else ''}: {', '.join(missing)}"] if missing else []
+        parts += [f"Invalid value for {feature}: {reason}" if feature != RECORD_ERROR else reason
+                  for feature, reason in self.errors.items() if reason != 'missing']
+        return '; '.join(parts)
+
+
+def coerce_value(value):
+    """Convertit une valeur JSON en float ; renvoie (valeur, None) ou (None, raison)"""
+    if isinstance(value, bool):
+        return float(value), None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        text = value.strip().lower()
+        if text in BOOLEAN_STRINGS:
+            return BOOLEAN_STRINGS[text], None
+        try:
+            number = float(text)
+        except ValueError:
+            return None, 'not a number'
+    elif value is None:
+        return None, 'null'
+    else:
+        return None, 'not a number'
+    if number != number or number in (float('inf'), float('-inf')):
+        return None, 'not a finite number'
+    return number, None
+
+
+def scaler_parameters(scaler, n_features):
+    """Renvoie (mean, scale) d'un StandardScaler en tenant compte de with_mean/with_std"""
+    mean = np.asarray(scaler.mean_, dtype=float) if getattr(scaler, 'with_mean', True) else np.zeros(n_features)
+    if getattr(scaler, 'with_std', True) and scaler.scale_ is not None:
+        scale = np.asarray(scaler.scale_, dtype=float)
+    else:
+        scale = np.ones(n_features)
+    return mean, scale
+
+
+class FeatureVector:
+    """Schéma de requête compilé : ordre fixe des caractéristiques et ligne NumPy préallouée (une par thread)
+
+    Les valeurs numériques passent directement dans le tableau ; les booléens et les chaînes numériques
+    sont convertis, et un enregistrement invalide lève ValidationError avec toutes ses erreurs.
+    """
+
+    def __init__(self, features):
+        self.features = [str(f) for f in features]
+        self.size = len(self.features)
+        self._local = threading.local()
+        # Valeurs d'un enregistrement dans l'ordre du modèle, en un appel (tuple même pour une seule caractéristique)
+        getter = operator.itemgetter(*self.features) if self.features else (lambda record: ())
+        self._getter = getter if self.size != 1 else (lambda record: (getter(record),))
+
+    def errors(self, json_data):
+        """{caractéristique: raison} pour un enregistrement (vide s'il est valide)"""
+        if not isinstance(json_data, dict):
+            return {RECORD_ERROR: 'Record must be a JSON object'}
+        errors = {}
+        for feature in self.features:
+            if feature not in json_data:
+                errors[feature] = 'missing'
+                continue
+            _, reason = coerce_value(json_data[feature])
+            if reason:
+                errors[feature] = reason
+        return errors
+
+    def fill_row(self, values, json_data):
+        """Remplit values (une ligne) ou lève ValidationError"""
+        try:
+            for i, feature in enumerate(self.features):
+                values[i] = json_data[feature]
+            # Les chaînes numériques passent l'affectation : seules les valeurs non finies restent à exclure
+            if np.isfinite(values).all():
+                return values
+        except (KeyError, TypeError, ValueError):
+            pass
+        # Chemin lent : conversion des booléens et chaînes, et liste complète des erreurs
+        errors = self.errors(json_data)
+        if errors:
+            raise ValidationError(errors)
+        for i, feature in enumerate(self.features):
+            values[i] = coerce_value(json_data[feature])[0]
+        return values
+
+    def fill(self, json_data):
+        """Copie les valeurs JSON dans la ligne préallouée, dans l'ordre du modèle"""
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, self.size))
+        self.fill_row(row[0], json_data)
+        return row
+
+    def fill_batch(self, records):
+        """Renvoie (matrice des enregistrements valides, indices valides, {indice: message d'erreur})"""
+        try:
+            # Chemin rapide : tout le lot converti en un seul appel NumPy, seules les lignes non finies sont revues
+            matrix = np.array([self._getter(record) for record in records], dtype=float)
+            matrix = matrix.reshape(len(records), self.size)
+            valid = np.isfinite(matrix).all(axis=1)
+            pending = np.flatnonzero(~valid)
+        except (KeyError, TypeError, ValueError):
+            matrix = np.empty((len(records), self.size))
+            valid = np.ones(len(records), dtype=bool)
+            pending = range(len(records))
+        errors = {}
+        for i in pending:
+            try:
+                self.fill_row(matrix[i], records[i])
+                valid[i] = True
+            except ValidationError as e:
+                valid[i] = False
+                errors[i] = str(e)
+        valid_indices = np.flatnonzero(valid)
+        return matrix[valid] if errors else matrix, valid_indices.tolist(), errors
+
+
+class CompiledRegression:
+    """Scaler + régression ; pour un modèle linéaire, le scaler est replié dans les coefficients"""
+
+    def __init__(self, scaler, model, features):
+        self.vector = FeatureVector(features)
+        self.model = model
+        self.scaler = scaler
+        self.mean, self.scale = scaler_parameters(scaler, self.vector.size)
+        self.fused = type(model).__name__ in LINEAR_REGRESSORS
+        if self.fused:
+            # y = coef . (x - mean) / scale + b  =  (coef / scale) . x + (b - coef . mean / scale)
+            coef = np.ravel(model.coef_).astype(float)
+            self.weights = coef / self.scale
+            self.bias = float(np.ravel(model.intercept_)[0]) - float(self.weights @ self.mean)
+
+    def transform(self, X):
+        """Standardisation (identité quand le scaler est replié dans les coefficients)"""
+        return X if self.fused else (X - self.mean) / self.scale
+
+    def predict_transformed(self, X):
+        if self.fused:
+            return X @ self.weights + self.bias
+        return self.model.predict(X)
+
+    def predict(self, X):
+        return self.predict_transformed(self.transform(X))
+
+    def predict_record(self, json_data):
+        return float(self.predict(self.vector.fill(json_data))[0])
+
+
+def is_logistic(model):
+    """Vrai pour un classifieur linéaire binaire à sortie logistique (scaler repliable)"""
+    if type(model).__name__ not in LOGISTIC_CLASSIFIERS or len(getattr(model, 'classes_', ())) != 2:
+        return False
+    return getattr(model, 'loss', 'log_loss') in ('log_loss', 'log')
+
+
+def is_nystroem_logistic(model):
+    """Vrai pour un Pipeline Nystroem (noyau rbf) + classifieur logistique binaire (improve_classification.py)"""
+    steps = getattr(model, 'steps', None)
+    if not steps or len(steps) != 2:
+        return False
+    kernel_map, linear = steps[0][1], steps[1][1]
+    return type(kernel_map).__name__ == 'Nystroem' and kernel_map.kernel == 'rbf' and is_logistic(linear)
+
+
+def nystroem_parameters(model, n_features):
+    """Renvoie (composantes, gamma, poids, biais) ; la normalisation de Nystroem est repliée dans les poids"""
+    kernel_map, linear = model.steps[0][1], model.steps[1][1]
+    # decision = (K(x, C) @ normalization.T) @ coef + b  =  K(x, C) @ (normalization.T @ coef) + b
+    weights = kernel_map.normalization_.T @ np.ravel(linear.coef_).astype(float)
+    gamma = kernel_map.gamma if kernel_map.gamma is not None else 1.0 / n_features
+    return (np.asarray(kernel_map.components_, dtype=float), float(gamma), weights,
+            float(np.ravel(linear.intercept_)[0]))
+
+
+def rbf_kernel(X, centers, center_norms, gamma):
+    """exp(-gamma * ||x - c||²) pour chaque ligne de X et chaque centre"""
+    squared = np.einsum('ij,ij->i', X, X)[:, np.newaxis] + center_norms - 2.0 * (X @ centers.T)
+    return np.exp(-gamma * np.maximum(squared, 0.0))
+
+
+def logistic_output(decision, classes):
+    """(classes prédites, probabilités) d'une décision logistique binaire"""
+    positive = np.exp(-np.logaddexp(0.0, -decision))  # sigmoid sans débordement
+    return classes[(decision > 0).astype(int)], np.column_stack([1.0 - positive, positive])
+
+
+class CompiledClassifier:
+    """Scaler appliqué en NumPy puis classifieur scikit-learn sur un tableau déjà mis à l'échelle ;
+    pour un classifieur logistique binaire, le scaler est replié dans les coefficients, et l'approximation
+    Nystroem + logistique est évaluée en NumPy (coût fixe, indépendant du nombre de vecteurs de support)"""
+
+    def __init__(self, scaler, model, features):
+        self.vector = FeatureVector(features)
+        self.model = model
+        self.scaler = scaler
+        self.mean, self.scale = scaler_parameters(scaler, self.vector.size)
+        self.fused = is_logistic(model)
+        self.approx = is_nystroem_logistic(model)
+        if self.fused:
+            coef = np.ravel(model.coef_).astype(float)
+            self.weights = coef / self.scale
+            self.bias = float(np.ravel(model.intercept_)[0]) - float(self.weights @ self.mean)
+        elif self.approx:
+            self.components, self.gamma, self.weights, self.bias = nystroem_parameters(model, self.vector.size)
+            self.component_norms = np.einsum('ij,ij->i', self.components, self.components)
+        if self.fused or self.approx:
+            self.classes = np.asarray(model.classes_)
+
+    def transform(self, X):
+        return X if self.fused else (X - self.mean) / self.scale
+
+    def predict_transformed(self, X_scaled):
+        if self.fused:
+            return logistic_output(X_scaled @ self.weights + self.bias, self.classes)
+        if self.approx:
+            kernel = rbf_kernel(X_scaled, self.components, self.component_norms, self.gamma)
+            return logistic_output(kernel @ self.weights + self.bias, self.classes)
+        return self.model.predict(X_scaled), self.model.predict_proba(X_scaled)
+
+    def predict(self, X):
+        """Renvoie (classes prédites, probabilités) pour une matrice brute"""
+        return self.predict_transformed(self.transform(X))
+
+    def predict_record(self, json_data):
+        predictions, probabilities = self.predict(self.vector.fill(json_data))
+        return int(predictions[0]), probabilities[0]
+
+
+class CentroidIndex:
+    """Affectation au centroïde le plus proche en une seule passe
+
+    Les centroïdes sont exprimés dans l'espace standardisé à une translation près (la moyenne du scaler
+    disparaît des différences) et leurs normes sont précalculées : ||z - c||² = ||z||² - 2 z.c + ||c||².
+    """
+
+    def __init__(self, centroids, inv_scale):
+        self.inv_scale = np.asarray(inv_scale, dtype=float)
+        self.centers = np.asarray(centroids, dtype=float) * self.inv_scale
+        self.center_norms = np.einsum('ij,ij->i', self.centers, self.centers)
+        self.n_clusters = self.centers.shape[0]
+
+    def distances(self, X):
+        """Distances euclidiennes (espace standardisé) de chaque ligne à chaque centroïde"""
+        Z = X * self.inv_scale
+        squared = np.einsum('ij,ij->i', Z, Z)[:, np.newaxis] - 2.0 * (Z @ self.centers.T) + self.center_norms
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def assign(self, X, top_k=1):
+        """Renvoie (indices des top_k centroïdes les plus proches, du plus proche au plus lointain ; distances)"""
+        distances = self.distances(X)
+        k = max(1, min(top_k, self.n_clusters))
+        if k == 1:
+            return np.argmin(distances, axis=1)[:, np.newaxis], distances
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < self.n_clusters \
+            else np.broadcast_to(np.arange(self.n_clusters), distances.shape)
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(nearest, order, axis=1), distances
+
+
+class CompiledKMeans:
+    """KMeans avec centroïdes ramenés à l'échelle d'origine : la standardisation disparaît du calcul"""
+
+    def __init__(self, scaler, model, features, profiles=None):
+        self.vector = FeatureVector(features)
+        self.model = model
+        self.scaler = scaler
+        mean, scale = scaler_parameters(scaler, self.vector.size)
+        # ((x - mean) / scale - c) = (x - (mean + scale * c)) / scale
+        self.centroids = mean + scale * np.asarray(model.cluster_centers_, dtype=float)
+        self.index = CentroidIndex(self.centroids, 1.0 / scale)
+        self.n_clusters = self.index.n_clusters
+        # Libellé de chaque cluster, dans l'ordre des centroïdes
+        self.profiles = list(profiles) if profiles is not None else [f"Cluster {i}" for i in range(self.n_clusters)]
+
+    def transform(self, X):
+        """Identité : la standardisation est intégrée aux centroïdes"""
+        return X
+
+    def distances(self, X):
+        return self.index.distances(X)
+
+    def assign(self, X, top_k=1):
+        return self.index.assign(X, top_k)
+
+    def predict_record(self, json_data):
+        distances = self.distances(self.vector.fill(json_data))[0]
+        return int(np.argmin(distances)), distances
+
+
+class SharedFeatureVector:
+    """Union des caractéristiques de plusieurs modèles : le JSON est parcouru et validé une seule fois,
+    puis chaque modèle reçoit ses colonnes ; un modèle n'échoue que pour ses propres caractéristiques"""
+
+    def __init__(self, vectors):
+        features = []
+        for vector in vectors.values():
+            features += [feature for feature in vector.features if feature not in features]
+        self.vector = FeatureVector(features)
+        position = {feature: i for i, feature in enumerate(features)}
+        self.model_features = {name: vector.features for name, vector in vectors.items()}
+        self.columns = {name: np.array([position[f] for f in vector.features], dtype=int)
+                        for name, vector in vectors.items()}
+
+    def fill(self, json_data):
+        """Renvoie ({modèle: ligne (1, n)}, {modèle: ValidationError})"""
+        try:
+            row = self.vector.fill(json_data)
+            # L'indexation copie la ligne : la ligne préallouée du thread peut être réutilisée
+            return {name: row[:, columns] for name, columns in self.columns.items()}, {}
+        except ValidationError as e:
+            errors = e.errors
+        rows, failures = {}, {}
+        for name, features in self.model_features.items():
+            own = {feature: reason for feature, reason in errors.items()
+                   if feature in features or feature == RECORD_ERROR}
+            if own:
+                failures[name] = ValidationError(own)
+            else:
+                rows[name] = np.array([[coerce_value(json_data[feature])[0] for feature in features]])
+        return rows, failures
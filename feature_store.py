@@ -0,0 +1,257 @@
+# Matérialisation des caractéristiques : prétraitement unique du CSV et cache colonnaire
+# (un fichier .npy par colonne, mappable en mémoire), partagé par tous les scripts d'entraînement
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from model_registry import file_checksum
+
+# Modalités connues des variables catégorielles, dans l'ordre de get_dummies (tri lexicographique).
+# Des modalités fixes donnent les mêmes colonnes quel que soit le morceau de fichier lu. Une valeur
+# inconnue (lue comme manquante avec CSV_DTYPES) est refusée ou signalée par category_codes : sa ligne
+# de zéros serait confondue avec la première modalité, supprimée par drop_first.
+CATEGORY_LEVELS = {
+    'User_Type': ['registered', 'staff', 'visitor'],
+    'Weather_Precipitation': ['No', 'Yes'],
+    'Nearby_Traffic_Level': ['high', 'low', 'medium'],
+    'Payment_Status': ['overdue', 'paid', 'unpaid'],
+    'Occupancy_Status': ['occupied', 'vacant'],
+    'Vehicle_Type': ['car', 'electric vehicle', 'motorcycle'],
+    'Spot_Size': ['compact', 'oversized', 'standard'],
+    'Weather_Category': ['Cold ', 'Cool ', 'Hot ', 'Warm '],
+    'Vehicle_Size': ['Big ', 'Small '],
+    'Parking_Lot_Section': ['zone a', 'zone b', 'zone c', 'zone d'],
+    'Time_of_Day': ['Afternoon', 'Evening', 'Morning', 'Night'],
+}
+categorical_columns = list(CATEGORY_LEVELS)
+
+# Moment de la journée pour chaque heure (0-23), en indices dans CATEGORY_LEVELS['Time_of_Day']
+# Night: 21h-5h, Morning: 5h-12h, Afternoon: 12h-17h, Evening: 17h-21h
+HOUR_TO_TIME_OF_DAY = np.array([3] * 5 + [2] * 7 + [0] * 5 + [1] * 4 + [3] * 3, dtype=np.int8)
+
+# Types déclarés à la lecture du CSV (les colonnes temporelles restent des chaînes, analysées une seule fois)
+CSV_DTYPES = {
+    'Parking_Spot_ID': 'int64',
+    'Electric_Vehicle': 'bool',
+    'Reserved_Status': 'bool',
+    'Payment_Amount': 'float64',
+    'Parking_Duration': 'int64',
+    'Proximity_To_Exit': 'float64',
+    'User_Parking_History': 'float64',
+    'occupancy': pd.CategoricalDtype(['No', 'Yes']),
+}
+CSV_DTYPES.update({col: pd.CategoricalDtype(levels) for col, levels in CATEGORY_LEVELS.items()
+                   if col != 'Time_of_Day'})
+
+def note_invalid(invalid, mask, column):
+    """Ajoute column aux colonnes invalides de chaque ligne de mask ({position: [colonnes]})"""
+    for position in np.flatnonzero(mask):
+        invalid.setdefault(int(position), []).append(column)
+
+def parse_datetimes(values, column, date_format, invalid=None):
+    """Analyse une colonne de dates ; sans invalid, une valeur non analysable lève ValueError"""
+    if invalid is None:
+        return pd.to_datetime(values, format=date_format)
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    note_invalid(invalid, parsed.isna().to_numpy(), column)
+    return parsed
+
+def time_to_minutes(values, column='time', invalid=None):
+    """Convertit des heures 'HH:MM:SS' en minutes depuis minuit (une seule analyse)"""
+    parsed = parse_datetimes(values, column, '%H:%M:%S', invalid)
+    return parsed.dt.hour * 60 + parsed.dt.minute
+
+def category_codes(values, column, invalid=None):
+    """Codes des modalités de CATEGORY_LEVELS ; une valeur inconnue ou manquante lève ValueError,
+    ou est notée dans invalid"""
+    codes = np.asarray(values.cat.codes)
+    unknown = int((codes < 0).sum())
+    if unknown and invalid is not None:
+        note_invalid(invalid, codes < 0, column)
+    elif unknown:
+        raise ValueError(f"{column}: {unknown} valeur(s) inconnue(s) ou manquante(s) "
+                         f"(modalités connues: {', '.join(map(repr, CATEGORY_LEVELS[column]))})")
+    return codes
+
+def one_hot(codes, column, index):
+    """Équivalent de get_dummies(drop_first=True) à partir des codes d'une modalité fixe"""
+    levels = CATEGORY_LEVELS[column]
+    codes = np.asarray(codes)
+    return pd.DataFrame({f"{column}_{level}": codes == i for i, level in enumerate(levels) if i > 0},
+                        index=index)
+
+def preprocess_frame(df, invalid=None):
+    """Prétraitement vectorisé d'un dataframe brut (un fichier entier ou un morceau)
+
+    Une date, une heure ou une modalité invalide lève ValueError. Avec invalid (dict), elle y est notée
+    {position de la ligne: [colonnes]} et la ligne est gardée, avec des caractéristiques non significatives.
+    """
+    # Traitement des colonnes temporelles (chaque colonne n'est analysée qu'une fois)
+    timestamp = parse_datetimes(df['Timestamp'], 'Timestamp', 'ISO8601', invalid)
+
+    # Extraction des caractéristiques temporelles
+    df['Year'] = timestamp.dt.year
+    df['Month'] = timestamp.dt.month
+    df['Day'] = timestamp.dt.day
+    df['Hour'] = timestamp.dt.hour
+    df['Minute'] = timestamp.dt.minute
+    df['Second'] = timestamp.dt.second
+
+    # Création de caractéristiques plus significatives
+    df['Weekday'] = timestamp.dt.dayofweek  # 0-6 où 0 est lundi
+    df['Is_Weekend'] = (df['Weekday'] >= 5).astype('int64')
+    time_of_day = HOUR_TO_TIME_OF_DAY[df['Hour'].fillna(0).to_numpy(dtype=int)]
+
+    # Encodage One-Hot à partir des codes des colonnes catégorielles
+    dummies = [one_hot(category_codes(df[col], col, invalid), col, df.index)
+               for col in categorical_columns if col != 'Time_of_Day']
+    dummies.append(one_hot(time_of_day, 'Time_of_Day', df.index))
+    kept = df.drop(columns=[col for col in categorical_columns if col in df.columns])
+    df_encoded = pd.concat([kept] + dummies, axis=1)
+
+    # Conversion des temps en minutes
+    df_encoded['Entry_Time_Minutes'] = time_to_minutes(df['Entry_Time'], 'Entry_Time', invalid)
+    df_encoded['Exit_Time_Minutes'] = time_to_minutes(df['Exit_Time'], 'Exit_Time', invalid)
+
+    # Conversion de occupancy en binaire (pour la classification)
+    if 'occupancy' in df_encoded.columns:
+        codes = df_encoded['occupancy'].cat.codes
+        if (codes < 0).any():
+            raise ValueError("occupancy doit valoir 'Yes' ou 'No'")
+        df_encoded['occupancy'] = codes.astype('int64')
+
+    # Suppression des colonnes temporelles qui ne sont plus nécessaires
+    return df_encoded.drop(['Timestamp', 'Entry_Time', 'Exit_Time'], axis=1)
+
+def iter_preprocessed(file_path, chunksize=100000):
+    """Lit le CSV par morceaux de chunksize lignes et renvoie chaque morceau prétraité"""
+    for chunk in pd.read_csv(file_path, dtype=CSV_DTYPES, chunksize=chunksize):
+        yield preprocess_frame(chunk)
+
+# Charger et prétraiter les données
+def preprocess_data(file_path, chunksize=None):
+    """Charge et prétraite le CSV ; avec chunksize, la lecture se fait par morceaux"""
+    if chunksize:
+        return pd.concat(iter_preprocessed(file_path, chunksize), ignore_index=True)
+    return preprocess_frame(pd.read_csv(file_path, dtype=CSV_DTYPES))
+
+
+# Répertoire du cache ; une entrée par (contenu du CSV, version du prétraitement)
+CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', 'feature_cache')
+# Lignes prétraitées à la fois lors de la matérialisation
+MATERIALIZE_CHUNKSIZE = 100000
+
+
+def preprocessing_version():
+    """Empreinte du code de prétraitement : toute modification invalide le cache"""
+    digest = hashlib.sha256()
+    for obj in (note_invalid, parse_datetimes, time_to_minutes, category_codes, one_hot, preprocess_frame):
+        digest.update(inspect.getsource(obj).encode())
+    digest.update(repr(CATEGORY_LEVELS).encode())
+    digest.update(repr(CSV_DTYPES).encode())
+    digest.update(HOUR_TO_TIME_OF_DAY.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(data_path, cache_dir=None):
+    """Répertoire du cache pour ce fichier, nommé d'après son contenu et la version du prétraitement"""
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    key = hashlib.sha256(f"{file_checksum(data_path)}:{preprocessing_version()}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir or CACHE_DIR, f"{stem}-{key}")
+
+
+def read_manifest(path):
+    with open(os.path.join(path, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def write_cache(data_path, path, chunksize):
+    """Prétraite le CSV par morceaux et écrit chaque colonne dans son propre fichier .npy"""
+    parent = os.path.dirname(path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.building-', dir=parent)
+    try:
+        columns, dtypes, handles, rows = None, None, [], 0
+        # Les morceaux sont ajoutés en binaire brut, puis convertis en .npy une fois le nombre de lignes connu
+        for chunk in iter_preprocessed(data_path, chunksize):
+            if columns is None:
+                columns = list(chunk.columns)
+                dtypes = [chunk[col].dtype for col in columns]
+                handles = [open(os.path.join(tmp, f'col_{i:03d}.raw'), 'wb') for i in range(len(columns))]
+            for handle, col, dtype in zip(handles, columns, dtypes):
+                handle.write(np.ascontiguousarray(chunk[col].to_numpy(dtype=dtype)).tobytes())
+            rows += len(chunk)
+        for handle in handles:
+            handle.close()
+        for i, dtype in enumerate(dtypes or []):
+            raw_path = os.path.join(tmp, f'col_{i:03d}.raw')
+            target = np.lib.format.open_memmap(os.path.join(tmp, f'col_{i:03d}.npy'), mode='w+',
+                                               dtype=dtype, shape=(rows,))
+            if rows:
+                target[:] = np.memmap(raw_path, dtype=dtype, mode='r', shape=(rows,))
+            target.flush()
+            del target
+            os.remove(raw_path)
+        manifest = {
+            'source': os.path.abspath(data_path),
+            'source_checksum': file_checksum(data_path),
+            'preprocessing_version': preprocessing_version(),
+            'rows': rows,
+            'columns': columns or [],
+            'dtypes': [str(dtype) for dtype in dtypes or []],
+        }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Un autre processus a matérialisé le même cache entre-temps
+            if not os.path.exists(os.path.join(path, 'manifest.json')):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def materialize(data_path, cache_dir=None, chunksize=MATERIALIZE_CHUNKSIZE):
+    """Renvoie le répertoire du cache de data_path, en le construisant s'il n'existe pas"""
+    path = cache_path(data_path, cache_dir)
+    if not os.path.exists(os.path.join(path, 'manifest.json')):
+        print(f"Matérialisation des caractéristiques de {data_path}...")
+        write_cache(data_path, path, chunksize)
+    return path
+
+
+def feature_arrays(data_path, columns=None, cache_dir=None):
+    """Renvoie (noms de colonnes, tableaux mappés en mémoire en lecture seule)"""
+    path = materialize(data_path, cache_dir)
+    manifest = read_manifest(path)
+    positions = {col: i for i, col in enumerate(manifest['columns'])}
+    names = list(manifest['columns']) if columns is None else list(columns)
+    missing = [col for col in names if col not in positions]
+    if missing:
+        raise KeyError(f"Colonnes absentes du cache de caractéristiques: {', '.join(missing)}")
+    arrays = [np.load(os.path.join(path, f'col_{positions[col]:03d}.npy'), mmap_mode='r') for col in names]
+    return names, arrays
+
+
+def load_features(data_path, columns=None, cache_dir=None):
+    """Dataframe prétraité (toutes les colonnes ou seulement celles demandées), lu depuis le cache"""
+    names, arrays = feature_arrays(data_path, columns, cache_dir)
+    return pd.DataFrame({name: np.asarray(array) for name, array in zip(names, arrays)}, columns=names)
+
+
+def iter_feature_chunks(data_path, chunksize, columns=None, cache_dir=None):
+    """Parcourt le cache par tranches de chunksize lignes (mémoire bornée, sans réanalyse du CSV)"""
+    names, arrays = feature_arrays(data_path, columns, cache_dir)
+    rows = len(arrays[0]) if arrays else 0
+    for start in range(0, rows, chunksize):
+        stop = min(start + chunksize, rows)
+        yield pd.DataFrame({name: np.array(array[start:stop]) for name, array in zip(names, arrays)},
+                           columns=names, index=pd.RangeIndex(start, stop))
@@ -0,0 +1,43 @@
+# Configuration gunicorn : chargement unique des modèles dans le maître puis partage copie-à-l'écriture
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Plusieurs threads par worker (gthread) : nécessaire pour que le regroupement en micro-lots
+# (COALESCE_WINDOW_MS) reçoive des requêtes concurrentes dans un même processus
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# GUNICORN_PRELOAD=1 : l'application (et donc les modèles) est importée une seule fois avant le fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Les tableaux NumPy des modèles sont mappés depuis le disque plutôt que copiés en mémoire
+    os.environ.setdefault('MODEL_MMAP', '1')
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import improved_app
+    # Le maître ne sert pas de requêtes : seuls les workers surveillent les fichiers de modèles
+    improved_app.registry.stop_watcher()
+    improved_app.ingest_updater.stop()
+    if improved_app.shadow is not None:
+        improved_app.shadow.registry.stop_watcher()
+    # Sortir les objets déjà chargés du ramasse-miettes : sans cela, chaque collecte
+    # dans un worker réécrit leurs en-têtes et duplique les pages partagées
+    gc.freeze()
+    server.log.info("Modèles préchargés dans le maître (pid %s)", os.getpid())
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    import improved_app
+    # Les threads ne survivent pas au fork : on relance la surveillance dans chaque worker
+    improved_app.registry.start_watcher(improved_app.MODEL_WATCH_INTERVAL)
+    # Un seul worker à la fois applique les sessions ingérées (verrou dans le répertoire du journal)
+    improved_app.ingest_updater.start(improved_app.INGEST_UPDATE_INTERVAL)
+    if improved_app.shadow is not None:
+        improved_app.shadow.registry.start_watcher(improved_app.MODEL_WATCH_INTERVAL)
@@ -0,0 +1,175 @@
+# Recherche d'hyperparamètres par divisions successives (successive halving) avec cache disque
+# des scores de validation croisée : une relance ne recalcule que les cellules nouvelles
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, cross_val_score
+
+# Répertoire des résultats de validation croisée, un fichier JSON par jeu de données
+CACHE_DIR = os.environ.get('SEARCH_CACHE_DIR', 'search_cache')
+
+
+def data_fingerprint(X, y):
+    """Empreinte du jeu d'entraînement (valeurs et cible) : clé du fichier de cache"""
+    digest = hashlib.sha256()
+    for array in (np.ascontiguousarray(X, dtype=float), np.ascontiguousarray(y)):
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def stratified_order(y, random_state=42):
+    """Permutation dont chaque préfixe respecte les proportions des classes (sous-ensembles emboîtés)"""
+    y = np.asarray(y)
+    permutation = np.random.RandomState(random_state).permutation(len(y))
+    position = np.empty(len(y))
+    for label in np.unique(y):
+        members = permutation[y[permutation] == label]
+        position[members] = (np.arange(len(members)) + 0.5) / len(members)
+    return np.lexsort((np.arange(len(y)), position))
+
+
+class ScoreCache:
+    """Scores de validation croisée par (modèle, paramètres, nombre de lignes, folds), persistés en JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(name, params, n_samples, cv, scoring):
+        return f"{name}|{json.dumps(params, sort_keys=True, default=str)}|n={n_samples}|cv={cv}|{scoring}"
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+
+    def save(self):
+        """Écriture atomique : un fichier partiel n'est jamais relu"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.scores-', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def cv_scores(estimator, X, y, cv, scoring):
+    start = time.perf_counter()
+    scores = cross_val_score(estimator, X, y, cv=StratifiedKFold(cv), scoring=scoring, n_jobs=1)
+    return {'scores': [float(s) for s in scores], 'mean': float(np.mean(scores)),
+            'fit_seconds': time.perf_counter() - start}
+
+
+class CachedHalvingSearch:
+    """Divisions successives sur des sous-ensembles stratifiés de plus en plus grands
+
+    Chaque tour évalue les configurations restantes en validation croisée sur `n` lignes puis garde
+    le meilleur tiers (factor=3) ; le dernier tour utilise toutes les lignes. Les scores sont lus
+    et écrits dans un cache disque. Le meilleur estimateur est réajusté sur tout le jeu avec
+    `refit_params` (par ex. probability=True : la calibration de Platt n'est faite qu'une fois).
+    """
+
+    def __init__(self, estimator, param_grid, name=None, scoring='f1', cv=5, factor=3, refit_params=None,
+                 cache_dir=None, n_jobs=-1, verbose=1, random_state=42):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.name = name or type(estimator).__name__
+        self.scoring = scoring
+        self.cv = cv
+        self.factor = factor
+        self.refit_params = refit_params or {}
+        self.cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+        self.random_state = random_state
+        self.cache = None
+
+    def resources(self, y):
+        """Tailles des sous-ensembles : divisées par factor depuis n tant que la classe minoritaire
+        garde au moins 2 exemples par fold"""
+        n_samples = len(y)
+        minority = np.unique(y, return_counts=True)[1].min() / n_samples
+        min_samples = int(math.ceil(2 * self.cv / minority))
+        n_candidates = len(ParameterGrid(self.param_grid))
+        sizes = [n_samples]
+        max_rounds = max(1, math.ceil(math.log(max(n_candidates, 1), self.factor)))
+        while len(sizes) < max_rounds:
+            size = sizes[-1] // self.factor
+            if size < min_samples:
+                break
+            sizes.append(size)
+        return sizes[::-1]
+
+    def open_cache(self, X, y):
+        path = os.path.join(self.cache_dir, f"{data_fingerprint(X, y)}.json") if self.cache_dir else None
+        self.cache = ScoreCache(path)
+        return self.cache
+
+    def evaluate(self, estimator, name, candidates, X, y, n_samples):
+        """Scores moyens des candidats sur les n_samples premières lignes de l'ordre stratifié
+        (toutes les lignes, dans l'ordre d'origine, au dernier tour : mêmes folds que GridSearchCV)"""
+        rows = self.order[:n_samples] if n_samples < len(y) else np.arange(len(y))
+        base = estimator.get_params(deep=False)
+        keys = [ScoreCache.key(name, dict(base, **params), n_samples, self.cv, self.scoring) for params in candidates]
+        missing = [(key, params) for key, params in zip(keys, candidates) if self.cache.get(key) is None]
+        if missing:
+            results = Parallel(n_jobs=self.n_jobs)(
+                delayed(cv_scores)(clone(estimator).set_params(**params), X[rows], y[rows], self.cv, self.scoring)
+                for _, params in missing)
+            for (key, params), result in zip(missing, results):
+                self.cache.put(key, dict(result, params=params))
+            self.cache.save()
+        if self.verbose:
+            print(f"{name}: {len(candidates)} configurations sur {n_samples} lignes "
+                  f"({len(missing)} calculées, {len(candidates) - len(missing)} lues depuis le cache)")
+        return [self.cache.get(key)['mean'] for key in keys]
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y)
+        self.open_cache(X, y)
+        self.order = stratified_order(y, self.random_state)
+        candidates = list(ParameterGrid(self.param_grid))
+        self.cv_results_ = []
+        sizes = self.resources(y)
+        for i, n_samples in enumerate(sizes):
+            scores = self.evaluate(self.estimator, self.name, candidates, X, y, n_samples)
+            self.cv_results_.extend({'params': p, 'n_samples': n_samples, 'mean_score': s}
+                                    for p, s in zip(candidates, scores))
+            # Tri stable : à score égal, l'ordre de la grille départage (comme GridSearchCV)
+            ranked = sorted(range(len(candidates)), key=lambda j: -scores[j])
+            if i == len(sizes) - 1:
+                best = ranked[0]
+                self.best_params_ = candidates[best]
+                self.best_score_ = scores[best]
+            else:
+                keep = max(1, int(math.ceil(len(candidates) / self.factor)))
+                candidates = [candidates[j] for j in sorted(ranked[:keep])]
+
+        # Réajustement du seul gagnant, avec calibration éventuelle
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_, **self.refit_params)
+        self.best_estimator_.fit(X, y)
+        return self
+
+    def score_estimator(self, estimator, name, X, y):
+        """Score de validation croisée d'un autre estimateur sur toutes les lignes, via le même cache"""
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y)
+        if self.cache is None:
+            self.open_cache(X, y)
+            self.order = stratified_order(y, self.random_state)
+        return self.evaluate(estimator, name, [{}], X, y, len(y))[0]
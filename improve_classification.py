@@ -1,3 +1,6 @@
+import argparse
+import json
+import sys
 import pandas as pd
 import numpy as np
 import joblib
@@ -5,40 +8,23 @@ from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
 from sklearn.metrics import classification_report, confusion_matrix
 
-# Charger les données prétraitées
-print("Chargement des données...")
-df = pd.read_csv("cleaned_smart_parking_data.csv")
-
-# Prétraitement des données
-print("Prétraitement des données...")
-# Conversion de occupancy en binaire
-df['occupancy'] = df['occupancy'].map({'Yes': 1, 'No': 0}).astype(int)
-
-# Encodage One-Hot pour les variables catégorielles
-categorical_columns = ['User_Type', 'Weather_Precipitation', 'Nearby_Traffic_Level',
-                      'Payment_Status', 'Occupancy_Status', 'Vehicle_Type',
-                      'Spot_Size', 'Weather_Category', 'Vehicle_Size', 'Parking_Lot_Section']
-                      
-df_encoded = pd.get_dummies(df, columns=categorical_columns, drop_first=True)
-
-# Analyse de la distribution des classes
-print("\nDistribution des classes:")
-print(df_encoded['occupancy'].value_counts())
-print(f"Ratio de classes: {df_encoded['occupancy'].value_counts()[1] / df_encoded['occupancy'].value_counts()[0]:.4f}")
-
-# Utiliser plus de caractéristiques pour la classification
-print("\nEntraînement d'un modèle de classification amélioré...")
-
-# Séparation des features et de la cible
-X = df_encoded.drop('occupancy', axis=1)
-y = df_encoded['occupancy']
+from feature_store import load_features
+from fast_inference import CompiledClassifier
+from halving_search import CachedHalvingSearch
+from model_registry import dump_group_atomic
+from drift_monitor import save_reference
+from serving_cost import (BudgetExceeded, ServingBudget, add_budget_arguments, prediction_latency, print_reports,
+                          save_reports, serving_report)
 
 # Sélection de caractéristiques plus pertinentes (utilisons plus de caractéristiques)
 important_features = [
-    'User_Parking_History', 
-    'Payment_Amount', 
+    'User_Parking_History',
+    'Payment_Amount',
     'Proximity_To_Exit',
     'Parking_Duration',
     'Electric_Vehicle',
@@ -50,112 +36,272 @@ important_features = [
     'Is_Weekend'
 ]
 
-# Filtrer les caractéristiques qui existent réellement dans le dataset
-existing_features = [col for col in important_features if col in X.columns]
-print(f"\nUtilisation de {len(existing_features)} caractéristiques pour la classification:")
-print(", ".join(existing_features))
-
-X_selected = X[existing_features]
-
-# Standardisation
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X_selected)
-
-# Division des données
-X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.3, random_state=42, stratify=y)
-
-# Entraînement d'un modèle SVM avec hyperparamètres optimisés
+# Hyperparamètres explorés pour le modèle SVM
 param_grid = {
     'C': [0.1, 1, 10, 100],
     'gamma': ['scale', 'auto', 0.01, 0.1, 1],
     'class_weight': [None, 'balanced']
 }
 
-print("\nOptimisation des hyperparamètres du modèle SVM...")
-grid_search = GridSearchCV(
-    SVC(kernel='rbf', probability=True, random_state=42),
-    param_grid,
-    scoring='f1',
-    cv=5,
-    verbose=1,
-    n_jobs=-1
-)
-
-grid_search.fit(X_train, y_train)
-
-print("\nMeilleurs paramètres trouvés:")
-print(grid_search.best_params_)
-
-# Utiliser le meilleur modèle SVM
-svm_model = grid_search.best_estimator_
-
-# Évaluation sur l'ensemble de test
-y_pred = svm_model.predict(X_test)
-print("\nÉvaluation du modèle SVM:")
-print(confusion_matrix(y_test, y_pred))
-print(classification_report(y_test, y_pred))
-
-# Essayer également un modèle RandomForest
-print("\nEntraînement d'un modèle RandomForest...")
-rf_model = RandomForestClassifier(
-    n_estimators=100,
-    max_depth=10,
-    min_samples_split=5,
-    min_samples_leaf=2,
-    class_weight='balanced',
-    random_state=42
-)
-rf_model.fit(X_train, y_train)
-
-# Évaluation du RandomForest
-rf_pred = rf_model.predict(X_test)
-print("Évaluation du modèle RandomForest:")
-print(confusion_matrix(y_test, rf_pred))
-print(classification_report(y_test, rf_pred))
-
-# Comparer les deux modèles et choisir le meilleur
-svm_f1 = classification_report(y_test, y_pred, output_dict=True)['1']['f1-score']
-rf_f1 = classification_report(y_test, rf_pred, output_dict=True)['1']['f1-score']
-
-if rf_f1 > svm_f1:
-    print("\nLe modèle RandomForest est meilleur. Utilisation de RandomForest.")
-    best_model = rf_model
-    model_name = "RandomForest"
-else:
-    print("\nLe modèle SVM est meilleur. Utilisation de SVM.")
-    best_model = svm_model
-    model_name = "SVM"
-
-# Sauvegarde du meilleur modèle et des caractéristiques
-print("\nSauvegarde du modèle et des caractéristiques...")
-joblib.dump(existing_features, 'improved_classification_features.pkl')
-joblib.dump(best_model, 'improved_classification_model.pkl')
-joblib.dump(scaler, 'improved_classification_scaler.pkl')
-
-print(f"\nModèle amélioré ({model_name}) sauvegardé avec succès!")
-print(f"Nombre de caractéristiques utilisées: {len(existing_features)}")
-print("Caractéristiques utilisées:", ", ".join(existing_features))
-
-# Test du modèle avec quelques exemples
-print("\nTest du modèle avec quelques exemples:")
-
-# Générer quelques exemples variés
-examples = []
-# Valeurs faibles
-examples.append({feat: 1.0 for feat in existing_features})
-# Valeurs moyennes
-examples.append({feat: 5.0 for feat in existing_features})
-# Valeurs élevées
-examples.append({feat: 10.0 for feat in existing_features})
-
-for i, example in enumerate(examples):
-    example_df = pd.DataFrame([example])
-    example_scaled = scaler.transform(example_df)
-    prediction = best_model.predict(example_scaled)[0]
-    probability = best_model.predict_proba(example_scaled)[0]
-    
-    print(f"Exemple {i+1}:")
-    print(f"  Prédiction: {'Occupé' if prediction == 1 else 'Non occupé'}")
-    print(f"  Probabilité d'occupation: {probability[1]:.2%}")
-    print(f"  Probabilité de non-occupation: {probability[0]:.2%}")
-    print()
+# Composantes de l'approximation de Nystroem du SVM (0 = pas d'approximation)
+APPROX_COMPONENTS = 300
+
+def load_classification_data(data_path):
+    """Charge les données prétraitées (cache de caractéristiques partagé) et renvoie le dataframe encodé"""
+    # Même prétraitement que train_models.py : occupancy binaire, variables catégorielles
+    # encodées, Entry_Time_Minutes, Hour, Weekday, Is_Weekend, etc.
+    print("Chargement des données...")
+    df_encoded = load_features(data_path)
+
+    # Analyse de la distribution des classes
+    print("\nDistribution des classes:")
+    print(df_encoded['occupancy'].value_counts())
+    print(f"Ratio de classes: {df_encoded['occupancy'].value_counts()[1] / df_encoded['occupancy'].value_counts()[0]:.4f}")
+    return df_encoded
+
+def search_svm(X_train, y_train, n_jobs=-1, verbose=1, method='halving', cache_dir=None):
+    """Optimisation des hyperparamètres du modèle SVM
+
+    'halving' : divisions successives sans calibration pendant la recherche (predict ne dépend pas de
+    probability), scores mis en cache sur disque, seul le gagnant est calibré ; 'grid' : recherche
+    exhaustive GridSearchCV avec probability=True pour chaque ajustement. cache_dir='' désactive le cache.
+    """
+    if method == 'halving':
+        search = CachedHalvingSearch(
+            SVC(kernel='rbf', random_state=42),
+            param_grid,
+            name='SVC',
+            scoring='f1',
+            cv=5,
+            refit_params={'probability': True},
+            cache_dir=cache_dir,
+            n_jobs=n_jobs,
+            verbose=verbose
+        )
+        return search.fit(X_train, y_train)
+    grid_search = GridSearchCV(
+        SVC(kernel='rbf', probability=True, random_state=42),
+        param_grid,
+        scoring='f1',
+        cv=5,
+        verbose=verbose,
+        n_jobs=n_jobs
+    )
+    grid_search.fit(X_train, y_train)
+    return grid_search
+
+def random_forest():
+    return RandomForestClassifier(
+        n_estimators=100,
+        max_depth=10,
+        min_samples_split=5,
+        min_samples_leaf=2,
+        class_weight='balanced',
+        random_state=42
+    )
+
+def train_random_forest(X_train, y_train):
+    rf_model = random_forest()
+    rf_model.fit(X_train, y_train)
+    return rf_model
+
+def approximate_svm(svm_model, X_train, y_train, n_components=APPROX_COMPONENTS, random_state=42):
+    """Approximation du SVM RBF : carte de Nystroem (gamma du SVM) suivie d'une régression logistique
+
+    Prédire coûte O(n_components × caractéristiques), quel que soit le nombre de vecteurs de support ;
+    la régression logistique reprend le C et le class_weight retenus pour le SVM.
+    """
+    model = Pipeline([
+        ('nystroem', Nystroem(kernel='rbf', gamma=svm_model._gamma, n_components=min(n_components, len(X_train)),
+                              random_state=random_state)),
+        ('linear', LogisticRegression(C=svm_model.C, class_weight=svm_model.class_weight, max_iter=1000)),
+    ])
+    return model.fit(X_train, y_train)
+
+def compare_models(candidates, scaler, features, X_test, y_test):
+    """Précision, F1 et latence de chaque modèle sur l'ensemble de test (lignes non standardisées)"""
+    X_raw = scaler.inverse_transform(X_test)
+    y_true = np.asarray(y_test)
+    report = {}
+    for name, model in candidates.items():
+        compiled = CompiledClassifier(scaler, model, features)
+        predictions, _ = compiled.predict(X_raw)
+        scores = classification_report(y_true, predictions, output_dict=True, zero_division=0)
+        report[name] = dict(accuracy=scores['accuracy'], f1=scores['1']['f1-score'],
+                            **prediction_latency(compiled.predict, X_raw))
+    print(f"\n{'Modèle':<22}{'Précision':>10}{'F1':>8}{'1 ligne (ms)':>14}{'lot (ms/ligne)':>16}")
+    for name, r in report.items():
+        print(f"{name:<22}{r['accuracy']:>10.4f}{r['f1']:>8.4f}{r['single_ms']:>14.3f}{r['batch_row_ms']:>16.4f}")
+    return report
+
+def improve_classification(data_path, search_method='halving', approx_components=APPROX_COMPONENTS,
+                           output_prefix='improved_classification', budget=None):
+    """Entraîne un SVM optimisé et un RandomForest, puis sauvegarde le meilleur des deux
+
+    Le meilleur F1 est choisi parmi les candidats qui respectent le budget de service (latence,
+    mémoire) ; le coût de chaque candidat est écrit dans serving_report.json. Sans candidat
+    acceptable, rien n'est sauvegardé (BudgetExceeded).
+
+    Avec approx_components > 0, une approximation Nystroem du SVM est aussi entraînée et sauvegardée
+    ({output_prefix}_approx_*.pkl), avec un rapport précision/latence. Avec un autre préfixe que celui
+    servi par l'API, le modèle choisi reste un candidat (évaluation fantôme, SHADOW_MODELS).
+    """
+    df_encoded = load_classification_data(data_path)
+
+    # Utiliser plus de caractéristiques pour la classification
+    print("\nEntraînement d'un modèle de classification amélioré...")
+
+    # Séparation des features et de la cible
+    X = df_encoded.drop('occupancy', axis=1)
+    y = df_encoded['occupancy']
+
+    # Filtrer les caractéristiques qui existent réellement dans le dataset
+    existing_features = [col for col in important_features if col in X.columns]
+    print(f"\nUtilisation de {len(existing_features)} caractéristiques pour la classification:")
+    print(", ".join(existing_features))
+
+    X_selected = X[existing_features]
+
+    # Standardisation
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X_selected)
+
+    # Division des données
+    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.3, random_state=42, stratify=y)
+
+    # Entraînement d'un modèle SVM avec hyperparamètres optimisés
+    print("\nOptimisation des hyperparamètres du modèle SVM...")
+    grid_search = search_svm(X_train, y_train, method=search_method)
+
+    print("\nMeilleurs paramètres trouvés:")
+    print(grid_search.best_params_)
+
+    # Utiliser le meilleur modèle SVM
+    svm_model = grid_search.best_estimator_
+
+    # Évaluation sur l'ensemble de test
+    y_pred = svm_model.predict(X_test)
+    print("\nÉvaluation du modèle SVM:")
+    print(confusion_matrix(y_test, y_pred))
+    print(classification_report(y_test, y_pred))
+
+    # Essayer également un modèle RandomForest
+    print("\nEntraînement d'un modèle RandomForest...")
+    rf_model = train_random_forest(X_train, y_train)
+
+    # Évaluation du RandomForest
+    rf_pred = rf_model.predict(X_test)
+    print("Évaluation du modèle RandomForest:")
+    print(confusion_matrix(y_test, rf_pred))
+    print(classification_report(y_test, rf_pred))
+
+    # Comparer les deux modèles et choisir le meilleur
+    if isinstance(grid_search, CachedHalvingSearch):
+        # F1 en validation croisée sur l'ensemble d'entraînement, lus depuis le cache de la recherche
+        svm_f1 = grid_search.best_score_
+        rf_f1 = grid_search.score_estimator(random_forest(), 'RandomForest', X_train, y_train)
+        print(f"\nF1 en validation croisée - SVM: {svm_f1:.4f}, RandomForest: {rf_f1:.4f}")
+    else:
+        svm_f1 = classification_report(y_test, y_pred, output_dict=True)['1']['f1-score']
+        rf_f1 = classification_report(y_test, rf_pred, output_dict=True)['1']['f1-score']
+
+    # Coût de service de chaque candidat, mesuré sur le chemin d'inférence de l'API
+    budget = budget or ServingBudget()
+    X_raw_test = scaler.inverse_transform(X_test)
+    models = {"SVM": svm_model, "RandomForest": rf_model}
+    reports = {name: serving_report(CompiledClassifier(scaler, model, existing_features).predict, model, scaler,
+                                    X_raw_test, f1=float(f1))
+               for (name, model), f1 in zip(models.items(), (svm_f1, rf_f1))}
+    print_reports(reports)
+    eligible = budget.select(reports)
+    if not eligible:
+        save_reports(output_prefix, reports, budget)
+        raise BudgetExceeded("Aucun candidat ne respecte le budget de service, aucun modèle sauvegardé")
+
+    # Meilleur F1 parmi les candidats acceptables (SVM en cas d'égalité)
+    model_name = max(eligible, key=lambda name: eligible[name]['f1'])
+    best_model = models[model_name]
+    reports[model_name]['selected'] = True
+    print(f"\nLe modèle {model_name} est meilleur. Utilisation de {model_name}.")
+
+    # Sauvegarde du meilleur modèle et des caractéristiques
+    print("\nSauvegarde du modèle et des caractéristiques...")
+    dump_group_atomic({
+        f'{output_prefix}_features.pkl': existing_features,
+        f'{output_prefix}_model.pkl': best_model,
+        f'{output_prefix}_scaler.pkl': scaler,
+    })
+    # Référence de /drift (partagée par l'approximation, mêmes caractéristiques)
+    save_reference(output_prefix, scaler.inverse_transform(X_train), existing_features)
+
+    # Approximation à coût constant, servie par l'API avec OCCUPANCY_MODEL=approx
+    if approx_components:
+        print(f"\nApproximation du SVM (Nystroem, {approx_components} composantes + régression logistique)...")
+        approx_model = approximate_svm(svm_model, X_train, y_train, approx_components)
+        candidates = {f'SVM ({len(svm_model.support_vectors_)} VS)': svm_model,
+                      f'Nystroem ({approx_model[0].n_components})': approx_model}
+        if model_name == "RandomForest":
+            candidates['RandomForest'] = rf_model
+        report = compare_models(candidates, scaler, existing_features, X_test, y_test)
+        dump_group_atomic({
+            f'{output_prefix}_approx_features.pkl': existing_features,
+            f'{output_prefix}_approx_model.pkl': approx_model,
+            f'{output_prefix}_approx_scaler.pkl': scaler,
+        })
+        with open(f'{output_prefix}_approx.json', 'w', encoding='utf-8') as f:
+            json.dump({'saved_model': model_name, 'n_components': approx_model[0].n_components,
+                       'test_rows': len(y_test), 'models': report}, f, indent=2, ensure_ascii=False)
+        print(f"Approximation sauvegardée ({output_prefix}_approx_*.pkl, {output_prefix}_approx.json)")
+        reports['Nystroem'] = serving_report(CompiledClassifier(scaler, approx_model, existing_features).predict,
+                                             approx_model, scaler, X_raw_test)
+
+    report_path = save_reports(output_prefix, reports, budget)
+    print(f"Rapport de coût de service: {report_path}")
+
+    print(f"\nModèle amélioré ({model_name}) sauvegardé avec succès! ({output_prefix}_*.pkl)")
+    print(f"Nombre de caractéristiques utilisées: {len(existing_features)}")
+    print("Caractéristiques utilisées:", ", ".join(existing_features))
+
+    # Test du modèle avec quelques exemples
+    print("\nTest du modèle avec quelques exemples:")
+
+    # Générer quelques exemples variés
+    examples = []
+    # Valeurs faibles
+    examples.append({feat: 1.0 for feat in existing_features})
+    # Valeurs moyennes
+    examples.append({feat: 5.0 for feat in existing_features})
+    # Valeurs élevées
+    examples.append({feat: 10.0 for feat in existing_features})
+
+    for i, example in enumerate(examples):
+        example_df = pd.DataFrame([example])
+        example_scaled = scaler.transform(example_df)
+        prediction = best_model.predict(example_scaled)[0]
+        probability = best_model.predict_proba(example_scaled)[0]
+
+        print(f"Exemple {i+1}:")
+        print(f"  Prédiction: {'Occupé' if prediction == 1 else 'Non occupé'}")
+        print(f"  Probabilité d'occupation: {probability[1]:.2%}")
+        print(f"  Probabilité de non-occupation: {probability[0]:.2%}")
+        print()
+
+    return best_model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimisation du modèle de classification")
+    parser.add_argument('data', nargs='?', default="cleaned_smart_parking_data.csv")
+    parser.add_argument('--search', choices=['halving', 'grid'], default='halving',
+                        help="Divisions successives avec cache (défaut) ou recherche exhaustive")
+    parser.add_argument('--approx-components', type=int, default=APPROX_COMPONENTS,
+                        help="Composantes de l'approximation Nystroem du SVM (0 = désactivée)")
+    add_budget_arguments(parser)
+    parser.add_argument('--candidate', action='store_true',
+                        help="Sauvegarde sous improved_classification_candidate_*.pkl sans remplacer le modèle "
+                             "servi, pour l'évaluer en mode fantôme (SHADOW_MODELS)")
+    args = parser.parse_args()
+    prefix = 'improved_classification_candidate' if args.candidate else 'improved_classification'
+    try:
+        improve_classification(args.data, args.search, args.approx_components, prefix, ServingBudget.from_args(args))
+    except BudgetExceeded as e:
+        sys.exit(f"Erreur: {e}")
@@ -1,111 +1,172 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pandas as pd
-import joblib
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 from flask_cors import CORS
+from fast_inference import SharedFeatureVector, ValidationError
+from prediction_cache import PredictionCache
+from model_registry import ModelRegistry
+from model_specs import COMPACT_MODEL_DIR, MODEL_FORMAT, OCCUPANCY_MODEL, classification_prefix, model_specs
+from drift_monitor import REFERENCE_FILE, DriftMonitor
+from event_ingest import EventLog, IncrementalUpdater, validate_sessions
+from occupancy_cube import CUBE_FILE, DIMENSION_NAMES, OccupancyCube, QueryError
+from worker_stats import workers_memory
+from request_coalescer import coalescers_from_env
+from shadow_scoring import shadow_from_env
+from metrics import Metrics
 
 app = Flask(__name__)
 CORS(app)  # Pour permettre les requêtes cross-origin depuis votre frontend React
 
-# Utiliser les modèles améliorés 
-use_improved_models = True
-
-# Vérification de l'existence des fichiers de modèles
-required_files = [
-    'model_columns.pkl',
-    'regression_features.pkl',
-    'regression_model.pkl',
-    'regression_scaler.pkl'
-]
-
-# Ajouter le fichier du modèle KMeans
-required_files.append('kmeans_model.pkl')
-required_files.append('kmeans_scaler.pkl')
-required_files.append('kmeans_features.pkl')
-
-if use_improved_models:
-    required_files.extend([
-        'improved_classification_features.pkl',
-        'improved_classification_model.pkl',
-        'improved_classification_scaler.pkl'
-    ])
-else:
-    required_files.extend([
-        'classification_features.pkl',
-        'classification_model.pkl',
-        'classification_scaler.pkl'
-    ])
-
-models_ready = True
-
-for file in required_files:
-    if not os.path.exists(file):
-        models_ready = False
-        print(f"Fichier manquant: {file}")
-
-# Chargement des modèles si tous les fichiers sont présents
-# Variables globales pour les modèles
-model_columns = None
-regression_features = None
-regression_model = None  
-regression_scaler = None
-classification_features = None
-classification_model = None
-classification_scaler = None
-kmeans_model = None
-kmeans_scaler = None
-kmeans_features = None
-kmeans_ready = False
-
-if models_ready:
+# Nombre maximal d'enregistrements acceptés par un appel batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Clusters alternatifs (les plus proches après le cluster affecté) renvoyés par /predict/cluster
+CLUSTER_ALTERNATIVES = int(os.environ.get('CLUSTER_ALTERNATIVES', 2))
+
+# Cache des résultats de prédiction (désactivé sauf si PREDICTION_CACHE_SIZE > 0)
+prediction_cache = PredictionCache.from_env()
+
+# Compteurs et histogrammes de latence exposés sur /metrics
+metrics = Metrics()
+
+# Groupes de modèles (fichiers .pkl ou .npz selon MODEL_FORMAT, voir model_specs.py)
+MODEL_SPECS = model_specs()
+
+# MODEL_LAZY_LOAD=1 : chargement au premier appel ; MODEL_WATCH_INTERVAL : période de surveillance (0 = désactivée)
+# MODEL_MMAP=1 : tableaux NumPy mappés en mémoire (partagés entre workers gunicorn, voir gunicorn.conf.py)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+registry = ModelRegistry(
+    MODEL_SPECS,
+    lazy=os.environ.get('MODEL_LAZY_LOAD', '0') == '1',
+    parallel=os.environ.get('MODEL_PARALLEL_LOAD', '1') == '1',
+    mmap_mode='c' if os.environ.get('MODEL_MMAP', '0') == '1' else None,
+    snapshot_dir=os.environ.get('MODEL_SNAPSHOT_DIR')
+)
+
+# Les résultats en cache ne sont valables que pour les modèles qui les ont produits
+registry.add_listener(lambda name, group: prediction_cache.clear())
+
+for spec in MODEL_SPECS:
+    for role, file in spec.files.items():
+        if role not in spec.optional and not os.path.exists(file):
+            print(f"Fichier manquant: {file}")
+
+print("Chargement des modèles...")
+registry.load_all()
+if all(registry.is_ready(name) for name in registry.specs):
+    print("Tous les modèles ont été chargés avec succès!")
+elif not registry.lazy:
+    print("Certains modèles n'ont pas pu être chargés. Veuillez d'abord exécuter train_models.py")
+
+registry.start_watcher(MODEL_WATCH_INTERVAL)
+
+# Dérive des entrées : histogrammes du trafic comparés aux références écrites à l'entraînement
+# (section de drift_reference.json par modèle ; l'approximation Nystroem partage celle du SVM).
+# DRIFT_MONITOR=0 désactive la surveillance
+drift = None
+if os.environ.get('DRIFT_MONITOR', '1') == '1':
+    drift = DriftMonitor(
+        os.environ.get('DRIFT_REFERENCE_PATH', REFERENCE_FILE),
+        {'duration': 'regression', 'occupancy': classification_prefix, 'cluster': 'kmeans'},
+        window=int(os.environ.get('DRIFT_WINDOW', 10000))
+    )
+    # Un réentraînement réécrit la référence : relecture à chaque rechargement de modèle
+    registry.add_listener(lambda name, group: drift.reload())
+
+# Cube d'occupation servi par /stats : fichier précalculé (train_models.py ou occupancy_cube.py),
+# sinon calculé au démarrage depuis le jeu de données
+STATS_CUBE_PATH = os.environ.get('STATS_CUBE_PATH', CUBE_FILE)
+STATS_DATA_PATH = os.environ.get('STATS_DATA_PATH', 'cleaned_smart_parking_data.csv')
+
+def load_occupancy_cube():
     try:
-        # Chargement des colonnes et caractéristiques
-        print("Chargement des modèles...")
-        model_columns = joblib.load('model_columns.pkl')
-        print("model_columns chargé")
-        regression_features = joblib.load('regression_features.pkl')
-        print("regression_features chargé")
-        
-        # Chargement du modèle KMeans
-        try:
-            kmeans_model = joblib.load('kmeans_model.pkl')
-            print("kmeans_model chargé")
-            kmeans_scaler = joblib.load('kmeans_scaler.pkl')
-            print("kmeans_scaler chargé")
-            kmeans_features = joblib.load('kmeans_features.pkl')
-            print("kmeans_features chargé")
-            print("Modèle KMeans chargé avec succès!")
-            kmeans_ready = True
-        except Exception as e:
-            print(f"Erreur lors du chargement du modèle KMeans: {str(e)}")
-            kmeans_ready = False
-        
-        if use_improved_models:
-            classification_features = joblib.load('improved_classification_features.pkl')
-            print("classification_features chargé")
-            classification_model = joblib.load('improved_classification_model.pkl')
-            print("classification_model chargé")
-            classification_scaler = joblib.load('improved_classification_scaler.pkl')
-            print("classification_scaler chargé")
-            print("Modèles de classification améliorés chargés avec succès!")
-        else:
-            classification_features = joblib.load('classification_features.pkl')
-            classification_model = joblib.load('classification_model.pkl')
-            classification_scaler = joblib.load('classification_scaler.pkl')
-        
-        # Chargement des modèles et scalers de régression
-        regression_model = joblib.load('regression_model.pkl')
-        print("regression_model chargé")
-        regression_scaler = joblib.load('regression_scaler.pkl')
-        print("regression_scaler chargé")
-        
-        print("Tous les modèles ont été chargés avec succès!")
+        if os.path.exists(STATS_CUBE_PATH):
+            return OccupancyCube.load(STATS_CUBE_PATH)
+        if os.path.exists(STATS_DATA_PATH):
+            return OccupancyCube.from_csv(STATS_DATA_PATH)
     except Exception as e:
-        models_ready = False
-        print(f"ERREUR lors du chargement des modèles: {str(e)}")
-else:
-    print("Certains fichiers de modèles sont manquants. Veuillez d'abord exécuter train_models.py")
+        print(f"Erreur lors du chargement du cube d'occupation: {str(e)}")
+        return None
+    print(f"Cube d'occupation indisponible: ni {STATS_CUBE_PATH} ni {STATS_DATA_PATH}")
+    return None
+
+occupancy_cube = load_occupancy_cube()
+
+# Sessions reçues par /ingest : journal borné sur disque, appliqué aux modèles par un thread de fond
+# toutes les INGEST_UPDATE_INTERVAL secondes (0 = désactivé par défaut : le thread réécrit les
+# modèles servis, voir event_ingest.py)
+INGEST_UPDATE_INTERVAL = float(os.environ.get('INGEST_UPDATE_INTERVAL', 0))
+event_log = EventLog(
+    os.environ.get('INGEST_LOG_DIR', 'ingest_log'),
+    segment_rows=int(os.environ.get('INGEST_SEGMENT_ROWS', 10000)),
+    max_rows=int(os.environ.get('INGEST_LOG_MAX_ROWS', 500000))
+)
+# Les mises à jour partent toujours des .pkl ; en format compact, les .npz servis sont réexportés
+ingest_updater = IncrementalUpdater(
+    event_log,
+    model_specs('pickle', OCCUPANCY_MODEL),
+    min_rows=int(os.environ.get('INGEST_MIN_EVENTS', 100)),
+    batch_rows=int(os.environ.get('INGEST_UPDATE_BATCH', 10000)),
+    compact_dir=COMPACT_MODEL_DIR if MODEL_FORMAT == 'compact' else None,
+    on_publish=lambda: registry.reload_changed(settle=False)
+)
+ingest_updater.start(INGEST_UPDATE_INTERVAL)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = (('route', route), ('method', request.method), ('status', str(response.status_code)))
+    metrics.inc('api_requests_total', 'Nombre de requêtes par route', labels)
+    if response.status_code >= 400:
+        metrics.inc('api_request_errors_total', 'Nombre de réponses en erreur (4xx/5xx) par route', labels)
+    start = g.get('request_start')
+    if start is not None:
+        metrics.observe('api_request_duration_seconds', 'Latence des requêtes par route',
+                        (('route', route), ('method', request.method)), time.perf_counter() - start)
+    return response
+
+def collect_runtime_metrics():
+    """Métriques calculées à la lecture : chargement des modèles, cache et micro-lots"""
+    groups = registry.snapshot()
+    families = [
+        ('model_ready', 'gauge', 'Groupe de modèles chargé (1) ou non (0)',
+         [((('group', name),), int(name in groups)) for name in registry.specs]),
+        ('model_load_duration_seconds', 'gauge', 'Durée du dernier chargement de chaque groupe de modèles',
+         [((('group', name), ('version', group.version)), group.load_seconds) for name, group in groups.items()]),
+        ('model_loaded_timestamp_seconds', 'gauge', 'Date du dernier chargement de chaque groupe de modèles',
+         [((('group', name),), group.loaded_at) for name, group in groups.items()]),
+        ('model_reloads_total', 'counter', 'Nombre de rechargements à chaud par groupe',
+         [((('group', name),), registry.reload_count(name)) for name in registry.specs]),
+    ]
+    cache = prediction_cache.stats()
+    families.append(('prediction_cache_events_total', 'counter', 'Événements du cache de prédictions',
+                     [((('event', event),), cache[event]) for event in ('hits', 'misses', 'evictions', 'expirations')]))
+    families.append(('prediction_cache_entries', 'gauge', 'Entrées présentes dans le cache de prédictions',
+                     [((), cache['entries'])]))
+    if coalescers:
+        stats = {name: coalescer.stats() for name, coalescer in coalescers.items()}
+        families.append(('coalescer_batches_total', 'counter', 'Micro-lots exécutés par modèle',
+                         [((('model', name),), s['batches']) for name, s in stats.items()]))
+        families.append(('coalescer_requests_total', 'counter', 'Requêtes regroupées par modèle',
+                         [((('model', name),), s['requests']) for name, s in stats.items()]))
+    return families
+
+metrics.add_collector(collect_runtime_metrics)
+
+def collect_drift_metrics():
+    if drift is None:
+        return []
+    return [('input_drift_psi', 'gauge', 'Indice de stabilité (PSI) du trafic par rapport à la référence',
+             [((('model', model), ('feature', feature)), psi) for model, feature, psi in drift.psi_values()])]
+
+metrics.add_collector(collect_drift_metrics)
 
 
 @app.route('/')
@@ -114,55 +175,213 @@ def home():
 
 @app.route('/health', methods=['GET'])
 def health():
-    if models_ready:
-        return jsonify({"status": "ok", "message": "API is running and models are loaded"})
+    models = registry.status()
+    ready = {name: entry["ready"] for name, entry in models.items()}
+    # En mode paresseux, un groupe pas encore demandé n'est pas une erreur
+    not_loaded = [name for name, entry in models.items()
+                  if not entry["ready"] and ("error" in entry or not registry.lazy)]
+    # Rechargement échoué : l'ancienne version continue de servir
+    reload_failed = [name for name, entry in models.items() if entry["ready"] and "error" in entry]
+    if len(not_loaded) == len(models):
+        return jsonify({"status": "error", "message": "Models are not loaded", "models": ready})
+    elif not_loaded:
+        return jsonify({"status": "degraded", "message": f"Models not loaded: {', '.join(not_loaded)}", "models": ready})
+    elif reload_failed:
+        return jsonify({"status": "degraded", "message": f"Model reload failed: {', '.join(reload_failed)}", "models": ready})
     else:
-        return jsonify({"status": "error", "message": "Models are not loaded"})
+        return jsonify({"status": "ok", "message": "API is running and models are loaded", "models": ready})
+
+@app.route('/models', methods=['GET'])
+def models_status():
+    """Renvoie la version, la date et la durée de chargement de chaque groupe de modèles"""
+    return jsonify(registry.status())
+
+@app.route('/models/reload', methods=['POST'])
+def models_reload():
+    """Recharge immédiatement les groupes de modèles dont les fichiers ont changé"""
+    reloaded = registry.reload_changed(settle=False)
+    return jsonify({"reloaded": reloaded, "models": registry.status()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques au format texte Prometheus (par processus : chaque worker gunicorn a les siennes)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/workers', methods=['GET'])
+def workers_status():
+    """Renvoie la mémoire (RSS/PSS) du worker courant et, sous gunicorn, de tous les workers"""
+    return jsonify(workers_memory())
+
+@app.route('/coalescer/stats', methods=['GET'])
+def coalescer_stats():
+    """Renvoie l'histogramme des tailles de micro-lots et l'attente moyenne par modèle"""
+    return jsonify({
+        "enabled": bool(coalescers),
+        "models": {name: coalescer.stats() for name, coalescer in coalescers.items()}
+    })
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Renvoie les compteurs du cache de prédictions (hits, misses, évictions)"""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/stats', methods=['GET'])
+def occupancy_stats():
+    """Taux d'occupation, durée et montant moyens depuis le cube d'agrégats
+
+    Filtres : section, hour, weekday, weather (valeurs séparées par des virgules) ;
+    group_by : dimensions conservées (les autres sont additionnées).
+    """
+    if occupancy_cube is None:
+        return jsonify({"error": "Occupancy statistics not available"}), 503
+    filters = {name: request.args[name] for name in DIMENSION_NAMES if name in request.args}
+    group_by = [d.strip() for d in request.args.get('group_by', '').split(',') if d.strip()]
+    try:
+        results = occupancy_cube.query(filters, group_by)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"filters": filters, "group_by": group_by, "results": results})
+
+@app.route('/stats/dimensions', methods=['GET'])
+def occupancy_stats_dimensions():
+    """Dimensions et valeurs possibles du cube, nombre d'événements agrégés"""
+    if occupancy_cube is None:
+        return jsonify({"error": "Occupancy statistics not available"}), 503
+    return jsonify(occupancy_cube.summary())
+
+@app.route('/ingest', methods=['POST'])
+def ingest_sessions():
+    """Ajoute des sessions terminées (colonnes de cleaned_smart_parking_data.csv) au journal d'ingestion
+
+    Mêmes formats que les appels batch ; les sessions invalides sont rejetées individuellement.
+    """
+    try:
+        records = extract_batch_records(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} records)"}), 413
+
+    sessions, errors = validate_sessions(records)
+    if not len(sessions):
+        return jsonify({"error": "No valid session", "accepted": 0, "rejected": len(errors),
+                        "errors": [{"index": i, "error": message} for i, message in errors.items()]}), 400
+    try:
+        first_row = event_log.append(sessions)
+    except OSError as e:
+        return jsonify({"error": f"Ingestion log unavailable: {str(e)}"}), 503
+    # Les statistiques de ce processus sont à jour immédiatement (les autres workers au prochain démarrage)
+    if occupancy_cube is not None:
+        occupancy_cube.add_events(sessions)
+    return jsonify({
+        "accepted": len(sessions),
+        "rejected": len(errors),
+        "first_row": first_row,
+        "errors": [{"index": i, "error": message} for i, message in errors.items()]
+    })
+
+@app.route('/ingest/status', methods=['GET'])
+def ingest_status():
+    """Taille du journal, sessions en attente et dernières mises à jour incrémentales"""
+    return jsonify(ingest_updater.status())
+
+@app.route('/ingest/update', methods=['POST'])
+def ingest_update():
+    """Applique immédiatement les sessions en attente, sans attendre le thread de fond"""
+    try:
+        summary = ingest_updater.run_once(force=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"summary": summary, "models": registry.status()})
+
+@app.route('/drift', methods=['GET'])
+def drift_report():
+    """PSI, KS et moyennes du trafic récent par caractéristique, comparés aux données d'entraînement
+
+    Paramètre optionnel model : duration, occupancy ou cluster (séparés par des virgules).
+    """
+    if drift is None:
+        return jsonify({"enabled": False, "models": {}})
+    models = [m.strip() for m in request.args.get('model', '').split(',') if m.strip()] or None
+    unknown = [m for m in models or [] if m not in drift.sections]
+    if unknown:
+        return jsonify({"error": f"Unknown model: {', '.join(unknown)} (expected: {', '.join(drift.sections)})"}), 400
+    report = {"enabled": True, "models": drift.report(models)}
+    if drift.error is not None:
+        report["error"] = drift.error
+    return jsonify(report)
 
 @app.route('/features', methods=['GET'])
 def get_features():
     """Renvoie les caractéristiques nécessaires pour les prédictions"""
-    if not models_ready:
+    regression = registry.get('regression')
+    classification = registry.get('classification')
+    if regression is None or classification is None:
         return jsonify({"error": "Models not loaded"}), 503
     
     return jsonify({
-        "regression_features": regression_features.tolist(),
-        "classification_features": classification_features if isinstance(classification_features, list) else classification_features.tolist()
+        "regression_features": regression.compiled.vector.features,
+        "classification_features": classification.compiled.vector.features
     })
 
+def validation_error(error):
+    """Réponse 400 listant toutes les erreurs de l'enregistrement"""
+    return jsonify({"error": str(error), "details": error.errors}), 400
+
+def predict_single(model_name, group, predict_matrix):
+    """Valide un enregistrement unique puis interroge le cache avant le modèle"""
+    # Récupération des données envoyées par le client
+    with metrics.stage(model_name, 'json_parse'):
+        # Corps absent ou JSON invalide : None, rejeté par la validation avec une 400
+        json_data = request.get_json(silent=True)
+    compiled = group.compiled
+    
+    try:
+        with metrics.stage(model_name, 'feature_validation'):
+            row = compiled.vector.fill(json_data)
+    except ValidationError as e:
+        return validation_error(e)
+
+    result = predict_row(model_name, group, predict_matrix, row)
+    with metrics.stage(model_name, 'serialization'):
+        return jsonify(result)
+
+def predict_row(model_name, group, predict_matrix, row):
+    """Résultat d'une ligne validée : cache, puis micro-lot ou appel direct du modèle"""
+    compiled = group.compiled
+    # La version du groupe fait partie de la clé : un rechargement invalide les anciennes entrées
+    result = None
+    if prediction_cache.enabled:
+        with metrics.stage(model_name, 'cache_lookup'):
+            cache_key = prediction_cache.key(f"{model_name}:{group.version}", compiled.vector.features, row[0])
+            result = prediction_cache.get(cache_key)
+    else:
+        cache_key = None
+    if result is None:
+        coalescer = coalescers.get(model_name)
+        if coalescer is not None:
+            # Évaluation groupée avec les requêtes concurrentes du même modèle
+            result = coalescer.submit(group, row[0])
+        else:
+            result = predict_matrix(compiled, row)[0]
+        prediction_cache.put(cache_key, result)
+    if drift is not None:
+        drift.observe(model_name, compiled.vector.features, row)
+    if shadow is not None:
+        # Copie de la ligne déposée dans une file bornée : aucun calcul du candidat ici
+        shadow.submit(model_name, compiled.vector.features, row[0], result)
+    return result
+
 @app.route('/predict/duration', methods=['POST'])
 def predict_duration():
     """Endpoint pour prédire la durée de stationnement"""
-    if not models_ready:
+    group = registry.get('regression')
+    if group is None:
         return jsonify({"error": "Models not loaded"}), 503
     
     try:
-        # Récupération des données envoyées par le client
-        json_data = request.get_json()
-        
-        # Création d'un dataframe avec les caractéristiques requises
-        input_data = {}
-        for feature in regression_features:
-            if feature in json_data:
-                input_data[feature] = [json_data[feature]]
-            else:
-                return jsonify({"error": f"Missing feature: {feature}"}), 400
-        
-        input_df = pd.DataFrame(input_data)
-        
-        # Standardisation des données
-        input_scaled = regression_scaler.transform(input_df)
-        
-        # Prédiction de la durée
-        prediction = regression_model.predict(input_scaled)[0]
-        
-        # Arrondir la prédiction à 2 décimales
-        prediction = round(float(prediction), 2)
-        
-        return jsonify({
-            "prediction": prediction,
-            "unit": "hours"
-        })
+        # Prédiction de la durée (scaler replié dans le modèle, sans DataFrame)
+        return predict_single('duration', group, predict_duration_matrix)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -170,38 +389,13 @@ def predict_duration():
 @app.route('/predict/occupancy', methods=['POST'])
 def predict_occupancy():
     """Endpoint pour prédire l'occupation du parking"""
-    if not models_ready:
+    group = registry.get('classification')
+    if group is None:
         return jsonify({"error": "Models not loaded"}), 503
     
     try:
-        # Récupération des données envoyées par le client
-        json_data = request.get_json()
-        
-        # Création d'un dataframe avec les caractéristiques requises
-        input_data = {}
-        for feature in classification_features:
-            if feature in json_data:
-                input_data[feature] = [json_data[feature]]
-            else:
-                return jsonify({"error": f"Missing feature: {feature}"}), 400
-        
-        input_df = pd.DataFrame(input_data)
-        
-        # Standardisation des données
-        input_scaled = classification_scaler.transform(input_df)
-        
         # Prédiction de l'occupation et de la probabilité
-        prediction = int(classification_model.predict(input_scaled)[0])
-        probability = classification_model.predict_proba(input_scaled)[0]
-        
-        return jsonify({
-            "prediction": prediction,
-            "probability": {
-                "not_occupied": round(float(probability[0]), 3),
-                "occupied": round(float(probability[1]), 3) if len(probability) > 1 else 0
-            },
-            "label": "Occupied" if prediction == 1 else "Not Occupied"
-        })
+        return predict_single('occupancy', group, predict_occupancy_matrix)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -209,57 +403,263 @@ def predict_occupancy():
 @app.route('/predict/cluster', methods=['POST'])
 def predict_cluster():
     """Endpoint pour prédire le cluster comportemental de l'utilisateur"""
-    if not models_ready or not kmeans_ready:
+    group = registry.get('kmeans')
+    if group is None:
         return jsonify({"error": "KMeans model not loaded"}), 503
     
     try:
-        # Récupération des données envoyées par le client
-        json_data = request.get_json()
-        
-        # Création d'un dataframe avec les caractéristiques requises pour KMeans
-        input_data = {}
-        for feature in kmeans_features:
-            if feature in json_data:
-                input_data[feature] = [json_data[feature]]
-            else:
-                return jsonify({"error": f"Missing feature for clustering: {feature}"}), 400
-        
-        input_df = pd.DataFrame(input_data)
-        
-        # Standardisation des données
-        input_scaled = kmeans_scaler.transform(input_df)
-        
-        # Prédiction du cluster
-        cluster = int(kmeans_model.predict(input_scaled)[0])
-        
-        # Calculer la distance aux centroïdes pour estimer la confiance
-        distances = kmeans_model.transform(input_scaled)[0]
-        closest_distance = np.min(distances)
-        
-        # Définir les caractéristiques des clusters
-        cluster_profiles = [
-            "Court séjour, petit budget",
-            "Longue durée, prix élevé",
-            "Habitués, stationnement fréquent",
-            "Premium, proche des sorties"
-        ]
-        
-        # Assurer que nous avons suffisamment de descriptions pour le nombre de clusters
-        if cluster < len(cluster_profiles):
-            cluster_profile = cluster_profiles[cluster]
-        else:
-            cluster_profile = f"Profil d'utilisateur {cluster}"
-        
-        return jsonify({
-            "cluster": cluster,
-            "profile": cluster_profile,
-            "confidence": round(float(1.0 / (1.0 + closest_distance)), 3),
-            "distances": [round(float(d), 3) for d in distances.tolist()]
-        })
+        # Prédiction du cluster et distances aux centroïdes (calculées une seule fois)
+        return predict_single('cluster', group, predict_cluster_matrix)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ==========================================================
+# PRÉDICTIONS PAR LOT (batch)
+# ==========================================================
+
+def extract_batch_records(json_data):
+    """Normalise un payload batch en liste d'enregistrements
+
+    Formats acceptés :
+    - une liste d'objets : [{"feature": valeur, ...}, ...]
+    - un objet {"records": [...]}
+    - un format colonnaire : {"feature": [v1, v2, ...], ...}
+    """
+    if isinstance(json_data, list):
+        return json_data
+    if isinstance(json_data, dict):
+        if 'records' in json_data:
+            records = json_data['records']
+            if not isinstance(records, list):
+                raise ValueError("'records' must be a list")
+            return records
+        if json_data and all(isinstance(v, list) for v in json_data.values()):
+            lengths = {len(v) for v in json_data.values()}
+            if len(lengths) != 1:
+                raise ValueError("All columns must have the same length")
+            n_rows = lengths.pop()
+            columns = list(json_data.items())
+            return [{name: values[i] for name, values in columns} for i in range(n_rows)]
+    raise ValueError("Expected a list of records, {'records': [...]} or a columnar object")
+
+def run_batch(model_name, compiled, predict_matrix):
+    """Exécute une prédiction vectorisée sur tout le lot et fusionne les erreurs par enregistrement"""
+    try:
+        with metrics.stage(model_name, 'json_parse'):
+            records = extract_batch_records(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} records)"}), 413
+
+    try:
+        with metrics.stage(model_name, 'feature_validation'):
+            matrix, valid_indices, errors = compiled.vector.fill_batch(records)
+        if drift is not None and valid_indices:
+            drift.observe(model_name, compiled.vector.features, matrix)
+        results = [None] * len(records)
+        if valid_indices:
+            for i, result in zip(valid_indices, predict_matrix(compiled, matrix)):
+                results[i] = result
+        for i, message in errors.items():
+            results[i] = {"error": message}
+        for i, result in enumerate(results):
+            result["index"] = i
+
+        with metrics.stage(model_name, 'serialization'):
+            return jsonify({
+                "count": len(records),
+                "succeeded": len(valid_indices),
+                "failed": len(errors),
+                "results": results
+            })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def predict_duration_matrix(compiled, matrix):
+    with metrics.stage('duration', 'scaler_transform'):
+        matrix = compiled.transform(matrix)
+    with metrics.stage('duration', 'model_predict'):
+        predictions = compiled.predict_transformed(matrix)
+    with metrics.stage('duration', 'postprocess'):
+        return duration_results(predictions)
+
+def duration_results(predictions):
+    return [{"prediction": p, "unit": "hours"} for p in np.round(predictions, 2).tolist()]
+
+def predict_occupancy_matrix(compiled, matrix):
+    with metrics.stage('occupancy', 'scaler_transform'):
+        matrix = compiled.transform(matrix)
+    with metrics.stage('occupancy', 'model_predict'):
+        predictions, probabilities = compiled.predict_transformed(matrix)
+    with metrics.stage('occupancy', 'postprocess'):
+        return occupancy_results(predictions, probabilities)
+
+def occupancy_results(predictions, probabilities):
+    # Arrondi et conversion en types Python en une opération par tableau, pas par élément
+    probabilities = np.round(probabilities, 3).tolist()
+    results = []
+    for prediction, probability in zip(np.asarray(predictions, dtype=int).tolist(), probabilities):
+        results.append({
+            "prediction": prediction,
+            "probability": {
+                "not_occupied": probability[0],
+                "occupied": probability[1] if len(probability) > 1 else 0
+            },
+            "label": "Occupied" if prediction == 1 else "Not Occupied"
+        })
+    return results
+
+def predict_cluster_matrix(compiled, matrix):
+    with metrics.stage('cluster', 'scaler_transform'):
+        matrix = compiled.transform(matrix)
+    with metrics.stage('cluster', 'model_predict'):
+        # Une seule évaluation des distances : cluster, confiance et alternatives en découlent
+        nearest, distances = compiled.assign(matrix, CLUSTER_ALTERNATIVES + 1)
+    with metrics.stage('cluster', 'postprocess'):
+        return cluster_results(nearest, distances, compiled.profiles)
+
+def cluster_results(nearest, distances, profiles):
+    """nearest : indices des centroïdes les plus proches par ligne, le cluster affecté en premier"""
+    nearest_distance = distances[np.arange(len(distances)), nearest[:, 0]]
+    confidences = np.round(1.0 / (1.0 + nearest_distance), 3).tolist()
+    results = []
+    for ranked, row, confidence in zip(nearest.tolist(), np.round(distances, 3).tolist(), confidences):
+        cluster = ranked[0]
+        results.append({
+            "cluster": cluster,
+            "profile": profiles[cluster],
+            "confidence": confidence,
+            "distances": row,
+            "alternatives": [{"cluster": c, "profile": profiles[c], "distance": row[c]} for c in ranked[1:]]
+        })
+    return results
+
+# Regroupement des requêtes concurrentes en micro-lots (désactivé sauf si COALESCE_WINDOW_MS > 0)
+coalescers = coalescers_from_env({
+    'duration': predict_duration_matrix,
+    'occupancy': predict_occupancy_matrix,
+    'cluster': predict_cluster_matrix
+})
+
+# Évaluation fantôme des modèles candidats listés dans SHADOW_MODELS (voir shadow_scoring.py).
+# Mêmes résultats que les handlers, sans les métriques d'étapes du chemin servi
+shadow = shadow_from_env({
+    'duration': lambda compiled, matrix: duration_results(compiled.predict_transformed(compiled.transform(matrix))),
+    'occupancy': lambda compiled, matrix: occupancy_results(*compiled.predict_transformed(compiled.transform(matrix))),
+    'cluster': lambda compiled, matrix: cluster_results(*compiled.assign(compiled.transform(matrix),
+                                                                         CLUSTER_ALTERNATIVES + 1),
+                                                        compiled.profiles),
+}, metrics)
+if shadow is not None:
+    shadow.registry.start_watcher(MODEL_WATCH_INTERVAL)
+
+@app.route('/shadow/stats', methods=['GET'])
+def shadow_stats():
+    """Désaccords et latence des modèles candidats, échantillons notés et abandonnés"""
+    if shadow is None:
+        return jsonify({"enabled": False, "models": {}})
+    return jsonify(shadow.stats())
+
+@app.route('/predict/duration/batch', methods=['POST'])
+def predict_duration_batch():
+    """Endpoint pour prédire la durée de stationnement d'un lot d'enregistrements"""
+    group = registry.get('regression')
+    if group is None:
+        return jsonify({"error": "Models not loaded"}), 503
+    return run_batch('duration', group.compiled, predict_duration_matrix)
+
+@app.route('/predict/occupancy/batch', methods=['POST'])
+def predict_occupancy_batch():
+    """Endpoint pour prédire l'occupation d'un lot d'enregistrements"""
+    group = registry.get('classification')
+    if group is None:
+        return jsonify({"error": "Models not loaded"}), 503
+    return run_batch('occupancy', group.compiled, predict_occupancy_matrix)
+
+@app.route('/predict/cluster/batch', methods=['POST'])
+def predict_cluster_batch():
+    """Endpoint pour prédire le cluster comportemental d'un lot d'utilisateurs"""
+    group = registry.get('kmeans')
+    if group is None:
+        return jsonify({"error": "KMeans model not loaded"}), 503
+    return run_batch('cluster', group.compiled, predict_cluster_matrix)
+
+# ==========================================================
+# PRÉDICTION COMBINÉE (/predict/all)
+# ==========================================================
+
+# Modèle -> (groupe du registre, prédiction vectorisée)
+PREDICTORS = {
+    'duration': ('regression', predict_duration_matrix),
+    'occupancy': ('classification', predict_occupancy_matrix),
+    'cluster': ('kmeans', predict_cluster_matrix),
+}
+
+# PREDICT_ALL_THREADS > 1 : les trois modèles de /predict/all sont évalués en parallèle. Utile seulement
+# quand un modèle lent libère le GIL (SVC scikit-learn) sur plusieurs cœurs ; sinon l'évaluation en
+# séquence, quelques microsecondes par modèle, coûte moins que la synchronisation des threads
+PREDICT_ALL_THREADS = int(os.environ.get('PREDICT_ALL_THREADS', 1))
+predict_all_pool = ThreadPoolExecutor(PREDICT_ALL_THREADS, thread_name_prefix='predict-all') \
+    if PREDICT_ALL_THREADS > 1 else None
+
+# Schéma commun, recompilé quand un groupe est rechargé : (groupes utilisés, SharedFeatureVector)
+shared_schema = (None, None)
+
+def shared_features(groups):
+    global shared_schema
+    key, schema = shared_schema
+    current = tuple(id(group) for group in groups.values())
+    if key != current:
+        schema = SharedFeatureVector({name: group.compiled.vector for name, group in groups.items()})
+        shared_schema = (current, schema)
+    return schema
+
+def predict_model(name, group, row):
+    try:
+        return predict_row(name, group, PREDICTORS[name][1], row)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.route('/predict/all', methods=['POST'])
+def predict_all():
+    """Durée, occupation et cluster pour un même enregistrement, en un seul aller-retour
+
+    L'union des caractéristiques est lue et validée une fois ; chaque modèle échoue indépendamment
+    (modèle non chargé, caractéristique qui lui manque, erreur d'évaluation).
+    """
+    with metrics.stage('all', 'json_parse'):
+        json_data = request.get_json(silent=True)
+
+    results = {}
+    groups = {}
+    for name, (group_name, _) in PREDICTORS.items():
+        group = registry.get(group_name)
+        if group is None:
+            results[name] = {"error": f"Model {group_name} not loaded"}
+        else:
+            groups[name] = group
+    if groups:
+        with metrics.stage('all', 'feature_validation'):
+            rows, failures = shared_features(groups).fill(json_data)
+        for name, error in failures.items():
+            results[name] = {"error": str(error), "details": error.errors}
+        if predict_all_pool is not None and len(rows) > 1:
+            futures = {name: predict_all_pool.submit(predict_model, name, groups[name], row)
+                       for name, row in rows.items()}
+            results.update({name: future.result() for name, future in futures.items()})
+        else:
+            results.update({name: predict_model(name, groups[name], row) for name, row in rows.items()})
+
+    # 200 dès qu'un modèle a répondu ; sinon 400 si la requête est en cause, 503 si aucun modèle n'est chargé
+    status = 200
+    if all("error" in result for result in results.values()):
+        status = 400 if any("details" in result for result in results.values()) else 503
+    with metrics.stage('all', 'serialization'):
+        return jsonify({name: results[name] for name in PREDICTORS}), status
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,103 @@
+# Métriques de l'API au format texte Prometheus (compteurs, histogrammes de latence par route et par étape)
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Bornes des histogrammes de latence (secondes) : de 10 µs à 10 s
+LATENCY_BUCKETS = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {cumulative}"
+        yield f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {self.count}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+class Metrics:
+    """Compteurs et histogrammes en mémoire, propres à chaque processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # nom -> (type, aide, {labels: valeur ou Histogram})
+        self._families = {}
+        self._collectors = []
+
+    def _family(self, name, kind, help_text):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help_text, {})
+        return family[2]
+
+    def inc(self, name, help_text, labels=(), value=1):
+        with self._lock:
+            series = self._family(name, 'counter', help_text)
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, help_text, labels, value):
+        with self._lock:
+            series = self._family(name, 'histogram', help_text)
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, model, stage):
+        """Chronomètre une étape interne d'un handler de prédiction"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('predict_stage_duration_seconds', 'Durée des étapes internes des prédictions',
+                         (('model', model), ('stage', stage)), time.perf_counter() - start)
+
+    def add_collector(self, collector):
+        """collector() renvoie une liste de (nom, type, aide, [(labels, valeur), ...]) calculée à la lecture"""
+        self._collectors.append(collector)
+
+    def render(self):
+        """Exposition au format texte Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, series) in sorted(self._families.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    if kind == 'histogram':
+                        lines.extend(value.lines(name, labels))
+                    else:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,429 @@
+# Registre des modèles : chargement indépendant par groupe, surveillance des artefacts et rechargement à chaud
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import joblib
+
+try:
+    import fcntl
+except ImportError:  # Windows : seul le renommage atomique protège les lectures
+    fcntl = None
+
+# Le dépicklage importe les modules scikit-learn à la volée ; des imports concurrents de
+# modules interdépendants échouent ("partially initialized module"), on les sérialise donc.
+# Les lectures, checksums et compilations restent parallèles.
+UNPICKLE_LOCK = threading.Lock()
+
+# Verrou consultatif d'un répertoire d'artefacts : les écrivains remplacent les fichiers d'un groupe
+# sous verrou exclusif, le registre les lit sous verrou partagé
+ARTIFACT_LOCK_FILE = '.artifacts.lock'
+
+# Âge minimal (secondes) d'une copie mappée avant suppression : une copie juste créée (ou retrouvée)
+# par un autre processus peut être sur le point d'être chargée
+SNAPSHOT_GRACE_SECONDS = 60
+
+
+class ModelSpec:
+    """Description d'un groupe de modèles : fichiers requis et fonction de compilation"""
+
+    def __init__(self, name, files, build=None, optional=(), loader=None):
+        self.name = name
+        # rôle -> nom de fichier, ex. {'model': 'kmeans_model.pkl', ...}
+        self.files = dict(files)
+        self.build = build
+        # rôles dont le fichier peut manquer (l'artefact vaut alors None)
+        self.optional = set(optional)
+        # loader(chemin) remplace joblib.load (fichiers non picklés, lus entièrement en mémoire)
+        self.loader = loader
+
+
+class ModelGroup:
+    """Version chargée (immuable) d'un groupe de modèles"""
+
+    def __init__(self, name, artifacts, compiled, fingerprint, load_seconds):
+        self.name = name
+        self.artifacts = artifacts
+        self.compiled = compiled
+        self.fingerprint = fingerprint
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        # fichier -> nom de la copie mappée (MODEL_MMAP)
+        self.snapshots = {}
+        digest = hashlib.sha256()
+        for filename in sorted(fingerprint):
+            # Les fichiers optionnels absents (None) n'entrent pas dans la version
+            if fingerprint[filename] is not None:
+                digest.update(fingerprint[filename]['sha256'].encode())
+        self.version = digest.hexdigest()[:12]
+
+    def __getitem__(self, role):
+        return self.artifacts[role]
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def artifact_lock(directory, exclusive=False):
+    """Verrou sur les artefacts de `directory` (sans effet sans fcntl ou si le répertoire est en lecture seule)"""
+    handle = None
+    if fcntl is not None:
+        try:
+            handle = open(os.path.join(directory or '.', ARTIFACT_LOCK_FILE), 'a')
+        except OSError:
+            handle = None
+    if handle is None:
+        yield
+        return
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        handle.close()
+
+
+def dump_group_atomic(values):
+    """Écrit {chemin: objet} comme un tout : le registre ne voit jamais un fichier partiel ni un mélange
+    d'anciens et de nouveaux fichiers
+
+    Tous les fichiers temporaires sont écrits avant le premier renommage ; les renommages se font
+    sous le verrou exclusif du répertoire, que le registre prend en lecture pendant un chargement.
+    Les chemins doivent être dans un même répertoire.
+    """
+    directory = os.path.dirname(next(iter(values))) or '.'
+    written = []
+    try:
+        for path, value in values.items():
+            tmp = os.path.join(os.path.dirname(path) or '.', f".{os.path.basename(path)}.tmp")
+            joblib.dump(value, tmp)
+            written.append((tmp, path))
+        with artifact_lock(directory, exclusive=True):
+            for tmp, path in written:
+                os.replace(tmp, path)
+    except BaseException:
+        for tmp, _ in written:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+
+
+def dump_atomic(value, path):
+    """joblib.dump dans un fichier temporaire puis renommage (le registre ne lit jamais un fichier partiel)"""
+    dump_group_atomic({path: value})
+
+
+def snapshot_file(path, snapshot_dir):
+    """Copie un artefact dans un fichier immuable nommé d'après son contenu
+
+    Un fichier mappé en mémoire ne doit jamais être tronqué (joblib.dump réécrit
+    sur place, ce qui provoquerait un SIGBUS) : on mappe donc une copie dont le
+    nom dépend du checksum. Deux processus qui chargent la même version partagent
+    ainsi les mêmes pages du cache disque.
+    Renvoie (chemin de la copie, sha256).
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix='.tmp')
+    try:
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b''):
+                digest.update(block)
+                dst.write(block)
+        checksum = digest.hexdigest()
+        target = os.path.join(snapshot_dir, f"{checksum[:16]}-{os.path.basename(path)}")
+        try:
+            # Copie déjà présente : la rafraîchir la protège de l'élagage des autres processus
+            os.utime(target)
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target, checksum
+
+
+def prune_snapshots(snapshot_dir, filenames, keep, grace=SNAPSHOT_GRACE_SECONDS):
+    """Supprime les copies des versions qui ne sont plus publiées ; renvoie les noms supprimés
+
+    Seules les copies de `filenames` (fichiers du registre) sont concernées. Sous POSIX, supprimer
+    un fichier mappé ne touche pas aux pages déjà mappées : les requêtes en cours et les workers
+    qui servent encore l'ancienne version ne sont pas affectés.
+    """
+    try:
+        entries = os.listdir(snapshot_dir)
+    except FileNotFoundError:
+        return []
+    basenames = {os.path.basename(f) for f in filenames}
+    limit = time.time() - grace
+    removed = []
+    for entry in entries:
+        prefix, _, basename = entry.partition('-')
+        is_snapshot = len(prefix) == 16 and basename in basenames
+        # Copies temporaires abandonnées (processus interrompu pendant la copie)
+        is_leftover = entry.endswith('.tmp')
+        if entry in keep or not (is_snapshot or is_leftover):
+            continue
+        path = os.path.join(snapshot_dir, entry)
+        try:
+            if os.stat(path).st_mtime < limit:
+                os.remove(path)
+                removed.append(entry)
+        except OSError:  # supprimée entre-temps, ou encore mappée sous Windows
+            continue
+    return removed
+
+
+class ModelRegistry:
+    """Charge chaque groupe de modèles séparément et le remplace atomiquement quand ses fichiers changent
+
+    Les requêtes récupèrent un ModelGroup une seule fois via get() et l'utilisent
+    jusqu'au bout : un rechargement publie un nouvel objet sans toucher à
+    l'ancien, qui reste valide pour les requêtes en cours.
+    """
+
+    def __init__(self, specs, base_dir='.', lazy=False, parallel=True, mmap_mode=None, snapshot_dir=None):
+        self.specs = {spec.name: spec for spec in specs}
+        self.base_dir = base_dir
+        self.lazy = lazy
+        self.parallel = parallel
+        # mmap_mode='c' : les grands tableaux NumPy sont mappés (copie à l'écriture) au lieu d'être copiés
+        self.mmap_mode = mmap_mode or None
+        self.snapshot_dir = snapshot_dir or os.path.join(tempfile.gettempdir(), 'model-snapshots')
+        self._groups = {}
+        # nom -> (message, état des fichiers lors de l'échec)
+        self._errors = {}
+        self._pending = {}
+        self._reloads = {name: 0 for name in self.specs}
+        self._locks = {name: threading.RLock() for name in self.specs}
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Chargement
+    # ------------------------------------------------------------------
+
+    def path(self, filename):
+        return os.path.join(self.base_dir, filename)
+
+    def add_listener(self, callback):
+        """callback(name, group) est appelé après chaque publication d'une nouvelle version"""
+        self._listeners.append(callback)
+
+    def stat_files(self, name):
+        """Renvoie {fichier: (mtime, taille) ou None si optionnel et absent} ou lève FileNotFoundError"""
+        spec = self.specs[name]
+        stats = {}
+        for role, filename in spec.files.items():
+            try:
+                st = os.stat(self.path(filename))
+            except FileNotFoundError:
+                if role not in spec.optional:
+                    raise
+                stats[filename] = None
+                continue
+            stats[filename] = (st.st_mtime, st.st_size)
+        return stats
+
+    def load_group(self, name):
+        """Charge un groupe depuis le disque sans le publier"""
+        spec = self.specs[name]
+        start = time.perf_counter()
+        fingerprint = {}
+        artifacts = {}
+        snapshots = {}
+        # Verrou partagé : un écrivain (dump_group_atomic) ne remplace pas une partie du groupe pendant la lecture
+        with artifact_lock(self.base_dir):
+            for role, filename in spec.files.items():
+                path = self.path(filename)
+                if role in spec.optional and not os.path.exists(path):
+                    artifacts[role] = None
+                    fingerprint[filename] = None
+                    continue
+                st = os.stat(path)
+                if spec.loader is not None:
+                    checksum = file_checksum(path)
+                    artifacts[role] = spec.loader(path)
+                elif self.mmap_mode:
+                    path, checksum = snapshot_file(path, self.snapshot_dir)
+                    snapshots[filename] = os.path.basename(path)
+                    with UNPICKLE_LOCK:
+                        artifacts[role] = joblib.load(path, mmap_mode=self.mmap_mode)
+                else:
+                    checksum = file_checksum(path)
+                    with UNPICKLE_LOCK:
+                        artifacts[role] = joblib.load(path)
+                fingerprint[filename] = {'mtime': st.st_mtime, 'size': st.st_size, 'sha256': checksum}
+        compiled = spec.build(artifacts) if spec.build else None
+        group = ModelGroup(name, artifacts, compiled, fingerprint, time.perf_counter() - start)
+        group.snapshots = snapshots
+        return group
+
+    def _load_and_publish(self, name):
+        with self._locks[name]:
+            try:
+                group = self.load_group(name)
+            except Exception as e:
+                try:
+                    stats = self.stat_files(name)
+                except OSError:
+                    stats = None
+                self._errors[name] = (str(e), stats)
+                self._pending.pop(name, None)
+                print(f"Erreur lors du chargement du groupe {name}: {str(e)}")
+                return None
+            self._publish(name, group)
+            print(f"Groupe {name} chargé (version {group.version}, {group.load_seconds:.3f}s)")
+        if self.mmap_mode:
+            self.prune_snapshots()
+        return group
+
+    def _publish(self, name, group):
+        previous = self._groups.get(name)
+        # Une simple affectation : les requêtes en cours gardent leur référence à l'ancienne version
+        self._groups[name] = group
+        self._errors.pop(name, None)
+        self._pending.pop(name, None)
+        if previous is not None:
+            self._reloads[name] += 1
+        for callback in self._listeners:
+            callback(name, group)
+
+    def prune_snapshots(self):
+        """Supprime les copies mappées qu'aucune version publiée par ce registre n'utilise"""
+        keep = {entry for group in self._groups.values() for entry in group.snapshots.values()}
+        filenames = [filename for spec in self.specs.values() for filename in spec.files.values()]
+        return prune_snapshots(self.snapshot_dir, filenames, keep)
+
+    def load_all(self):
+        """Charge tous les groupes (en parallèle si demandé) ; un groupe défaillant n'affecte pas les autres"""
+        if self.lazy:
+            return
+        names = list(self.specs)
+        if self.parallel and len(names) > 1:
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                list(pool.map(self._load_and_publish, names))
+        else:
+            for name in names:
+                self._load_and_publish(name)
+
+    def get(self, name):
+        """Renvoie la version courante d'un groupe (chargée au premier appel en mode paresseux)"""
+        group = self._groups.get(name)
+        if group is None and self.lazy and name not in self._errors:
+            with self._locks[name]:
+                group = self._groups.get(name) or self._load_and_publish(name)
+        return group
+
+    def snapshot(self):
+        """Versions actuellement publiées {nom: ModelGroup}"""
+        return dict(self._groups)
+
+    def reload_count(self, name):
+        return self._reloads[name]
+
+    def is_ready(self, name):
+        return self._groups.get(name) is not None
+
+    # ------------------------------------------------------------------
+    # Surveillance et rechargement à chaud
+    # ------------------------------------------------------------------
+
+    def changed_groups(self):
+        """Groupes dont les fichiers sur disque diffèrent de la version publiée"""
+        changed = []
+        for name in self.specs:
+            group = self._groups.get(name)
+            try:
+                stats = self.stat_files(name)
+            except OSError:
+                continue
+            # Après un échec, nouvelle tentative seulement si les fichiers ont encore changé
+            if name in self._errors and self._errors[name][1] == stats:
+                continue
+            if group is None:
+                if name in self._errors:
+                    changed.append((name, stats))
+                continue
+            if any(self.file_changed(filename, stat, group.fingerprint.get(filename))
+                   for filename, stat in stats.items()):
+                changed.append((name, stats))
+            else:
+                # Fichiers revenus à la version publiée : l'échec précédent n'est plus d'actualité
+                self._errors.pop(name, None)
+        return changed
+
+    def file_changed(self, filename, stat, recorded):
+        """Vrai si le fichier diffère de la version publiée (apparition ou disparition comprises)"""
+        if stat is None or recorded is None:
+            return (stat is None) != (recorded is None)
+        if stat == (recorded['mtime'], recorded['size']):
+            return False
+        return file_checksum(self.path(filename)) != recorded['sha256']
+
+    def reload_changed(self, settle=True):
+        """Recharge les groupes modifiés
+
+        Avec settle=True, un changement doit être observé deux fois de suite à
+        l'identique avant d'être rechargé, pour ne pas lire un groupe à moitié
+        réécrit par un script d'entraînement.
+        """
+        reloaded = []
+        for name, stats in self.changed_groups():
+            if settle and self._pending.get(name) != stats:
+                self._pending[name] = stats
+                continue
+            if self._load_and_publish(name) is not None:
+                reloaded.append(name)
+        return reloaded
+
+    def start_watcher(self, interval):
+        """Démarre un thread qui vérifie les artefacts toutes les `interval` secondes"""
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload_changed()
+                except Exception as e:
+                    print(f"Erreur de surveillance des modèles: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def status(self):
+        """Version, date et durée de chargement de chaque groupe"""
+        report = {}
+        for name, spec in self.specs.items():
+            group = self._groups.get(name)
+            entry = {
+                "ready": group is not None,
+                "files": sorted(spec.files.values()),
+                "reloads": self._reloads[name]
+            }
+            if group is not None:
+                entry.update({
+                    "version": group.version,
+                    "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(group.loaded_at)),
+                    "load_seconds": round(group.load_seconds, 4)
+                })
+            if name in self._errors:
+                entry["error"] = self._errors[name][0]
+            report[name] = entry
+        return report
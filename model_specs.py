@@ -0,0 +1,98 @@
+# Groupes de modèles servis par l'API : fichiers à charger et construction du chemin d'inférence.
+# Partagé par improved_app.py et batch_score.py (mêmes artefacts, mêmes vérifications)
+import os
+
+from fast_inference import CompiledRegression, CompiledClassifier, CompiledKMeans
+from compact_models import COMPACT_DIR, CompactRegression, CompactClassifier, CompactKMeans, load_arrays
+from model_registry import ModelSpec
+
+# Utiliser les modèles améliorés
+use_improved_models = True
+
+# Définir les caractéristiques des clusters (utilisées quand train_kmeans.py n'a pas écrit kmeans_profiles.pkl)
+CLUSTER_PROFILES = [
+    "Court séjour, petit budget",
+    "Longue durée, prix élevé",
+    "Habitués, stationnement fréquent",
+    "Premium, proche des sorties"
+]
+
+def cluster_profiles(saved_profiles, n_clusters):
+    """Profils générés à l'entraînement s'ils correspondent au nombre de clusters, sinon profils par défaut"""
+    if saved_profiles is not None and len(saved_profiles) == n_clusters:
+        return [str(p) for p in saved_profiles]
+    # Assurer que nous avons suffisamment de descriptions pour le nombre de clusters
+    return [CLUSTER_PROFILES[i] if i < len(CLUSTER_PROFILES) else f"Profil d'utilisateur {i}"
+            for i in range(n_clusters)]
+
+def build_kmeans(artifacts):
+    profiles = cluster_profiles(artifacts['profiles'], len(artifacts['model'].cluster_centers_))
+    return CompiledKMeans(artifacts['scaler'], artifacts['model'], artifacts['features'], profiles)
+
+def build_compact_kmeans(artifacts):
+    data = artifacts['model']
+    saved = data['profiles'].tolist() if 'profiles' in data else None
+    return CompactKMeans(data, cluster_profiles(saved, len(data['centroids'])))
+
+# Construction du chemin d'inférence de chaque groupe, selon le format des artefacts
+PICKLE_BUILDERS = {
+    'regression': lambda a: CompiledRegression(a['scaler'], a['model'], a['features']),
+    'classification': lambda a: CompiledClassifier(a['scaler'], a['model'], a['features']),
+    'kmeans': build_kmeans,
+}
+COMPACT_BUILDERS = {
+    'regression': lambda a: CompactRegression(a['model']),
+    'classification': lambda a: CompactClassifier(a['model']),
+    'kmeans': build_compact_kmeans,
+}
+
+classification_prefix = 'improved_classification' if use_improved_models else 'classification'
+
+# MODEL_FORMAT=compact : modèles exportés par compact_models.py (.npz), évalués en NumPy sans scikit-learn
+MODEL_FORMAT = os.environ.get('MODEL_FORMAT', 'pickle')
+COMPACT_MODEL_DIR = os.environ.get('COMPACT_MODEL_DIR', COMPACT_DIR)
+
+# OCCUPANCY_MODEL=approx : approximation Nystroem du SVM entraînée par improve_classification.py,
+# latence constante quel que soit le nombre de vecteurs de support ('exact' par défaut)
+OCCUPANCY_MODEL = os.environ.get('OCCUPANCY_MODEL', 'exact')
+
+def model_specs(model_format=MODEL_FORMAT, occupancy_model=OCCUPANCY_MODEL, compact_dir=COMPACT_MODEL_DIR):
+    """Groupes regression, classification et kmeans pour le format demandé ('pickle' ou 'compact')"""
+    if occupancy_model not in ('exact', 'approx'):
+        raise ValueError(f"OCCUPANCY_MODEL inconnu: {occupancy_model} (attendu 'exact' ou 'approx')")
+    if model_format == 'compact':
+        occupancy_compact = 'classification_approx.npz' if occupancy_model == 'approx' else 'classification.npz'
+        return [
+            compact_spec('regression', 'regression', os.path.join(compact_dir, 'regression.npz')),
+            compact_spec('classification', 'classification', os.path.join(compact_dir, occupancy_compact)),
+            compact_spec('kmeans', 'kmeans', os.path.join(compact_dir, 'kmeans.npz')),
+        ]
+    if model_format != 'pickle':
+        raise ValueError(f"MODEL_FORMAT inconnu: {model_format} (attendu 'pickle' ou 'compact')")
+    occupancy_prefix = f'{classification_prefix}_approx' if occupancy_model == 'approx' else classification_prefix
+    return [
+        ModelSpec('regression', {
+            'columns': 'model_columns.pkl',
+            'features': 'regression_features.pkl',
+            'model': 'regression_model.pkl',
+            'scaler': 'regression_scaler.pkl'
+        }, build=PICKLE_BUILDERS['regression']),
+        pickle_spec('classification', 'classification', occupancy_prefix),
+        pickle_spec('kmeans', 'kmeans', 'kmeans'),
+    ]
+
+def pickle_spec(name, kind, prefix):
+    """Groupe `name` lu dans {prefix}_features/model/scaler.pkl et construit comme un groupe `kind`"""
+    files = {role: f'{prefix}_{role}.pkl' for role in ('features', 'model', 'scaler')}
+    if kind == 'kmeans':
+        files['profiles'] = f'{prefix}_profiles.pkl'
+    return ModelSpec(name, files, build=PICKLE_BUILDERS[kind], optional=('profiles',) if kind == 'kmeans' else ())
+
+def compact_spec(name, kind, path):
+    return ModelSpec(name, {'model': path}, build=COMPACT_BUILDERS[kind], loader=load_arrays)
+
+def artifact_spec(name, kind, source):
+    """Groupe à partir d'un fichier .npz ou d'un préfixe de fichiers .pkl (modèles candidats)"""
+    if source.endswith('.npz'):
+        return compact_spec(name, kind, source)
+    return pickle_spec(name, kind, source)
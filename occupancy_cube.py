@@ -0,0 +1,184 @@
+# Cube d'agrégats d'occupation : section × heure × jour de la semaine × météo
+# Chaque cellule garde des sommes (événements, occupés, durée, montant) : une requête additionne des
+# cellules sans relire les lignes brutes, et un nouvel événement met à jour une seule cellule
+import argparse
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from feature_store import CATEGORY_LEVELS, CSV_DTYPES
+
+CUBE_VERSION = 1
+CUBE_FILE = 'occupancy_cube.npz'
+
+# Dimensions du cube, dans l'ordre des axes : (nom dans l'API, libellés)
+DIMENSIONS = [
+    ('section', CATEGORY_LEVELS['Parking_Lot_Section']),
+    ('hour', list(range(24))),
+    ('weekday', list(range(7))),  # 0 = lundi, comme la caractéristique Weekday
+    ('weather', CATEGORY_LEVELS['Weather_Category']),
+]
+DIMENSION_NAMES = [name for name, _ in DIMENSIONS]
+SHAPE = tuple(len(levels) for _, levels in DIMENSIONS)
+
+# Sommes stockées par cellule
+MEASURES = ['count', 'occupied', 'duration_sum', 'payment_sum']
+
+# Colonnes brutes lues pour construire ou mettre à jour le cube
+EVENT_COLUMNS = ['Timestamp', 'Parking_Lot_Section', 'Weather_Category', 'occupancy', 'Parking_Duration',
+                 'Payment_Amount']
+
+
+def level_label(level):
+    return level.strip() if isinstance(level, str) else level
+
+
+def event_cells(frame):
+    """Indice de cellule (à plat) de chaque événement, -1 si une dimension est inconnue"""
+    timestamp = pd.to_datetime(frame['Timestamp'], format='ISO8601')
+    codes = [
+        pd.Categorical(frame['Parking_Lot_Section'], categories=DIMENSIONS[0][1]).codes,
+        timestamp.dt.hour.to_numpy(),
+        timestamp.dt.dayofweek.to_numpy(),
+        pd.Categorical(frame['Weather_Category'], categories=DIMENSIONS[3][1]).codes,
+    ]
+    known = np.logical_and.reduce([code >= 0 for code in codes])
+    cells = np.ravel_multi_index([np.where(known, code, 0) for code in codes], SHAPE)
+    return np.where(known, cells, -1)
+
+
+class QueryError(ValueError):
+    """Paramètre de requête invalide (réponse 400, message en anglais comme le reste de l'API)"""
+
+
+class OccupancyCube:
+    """Sommes par cellule, mises à jour sous verrou ; les requêtes travaillent sur des tableaux de cellules"""
+
+    def __init__(self, sums=None, skipped=0):
+        self.sums = sums if sums is not None else {m: np.zeros(SHAPE) for m in MEASURES}
+        self.skipped = skipped
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Construction et mises à jour
+    # ------------------------------------------------------------------
+
+    def add_events(self, frame):
+        """Ajoute des événements bruts ; renvoie le nombre d'événements comptés"""
+        missing = [col for col in EVENT_COLUMNS if col not in frame.columns]
+        if missing:
+            raise ValueError(f"Colonnes absentes: {', '.join(missing)}")
+        cells = event_cells(frame)
+        occupied = pd.Categorical(frame['occupancy'], categories=['No', 'Yes']).codes
+        duration = pd.to_numeric(frame['Parking_Duration'], errors='coerce').to_numpy(dtype=float)
+        payment = pd.to_numeric(frame['Payment_Amount'], errors='coerce').to_numpy(dtype=float)
+        valid = (cells >= 0) & (occupied >= 0) & np.isfinite(duration) & np.isfinite(payment)
+        cells = cells[valid]
+        n_cells = int(np.prod(SHAPE))
+        deltas = {
+            'count': np.bincount(cells, minlength=n_cells),
+            'occupied': np.bincount(cells, weights=occupied[valid], minlength=n_cells),
+            'duration_sum': np.bincount(cells, weights=duration[valid], minlength=n_cells),
+            'payment_sum': np.bincount(cells, weights=payment[valid], minlength=n_cells),
+        }
+        with self.lock:
+            for measure, delta in deltas.items():
+                self.sums[measure] += delta.reshape(SHAPE)
+            self.skipped += int((~valid).sum())
+        return int(valid.sum())
+
+    @classmethod
+    def from_csv(cls, path, chunksize=100000):
+        """Construit le cube en lisant le CSV par morceaux (mémoire bornée)"""
+        cube = cls()
+        dtypes = {col: CSV_DTYPES[col] for col in EVENT_COLUMNS if col in CSV_DTYPES}
+        for chunk in pd.read_csv(path, usecols=EVENT_COLUMNS, dtype=dtypes, chunksize=chunksize):
+            cube.add_events(chunk)
+        return cube
+
+    def save(self, path=CUBE_FILE):
+        """Écriture atomique au format .npz (sans pickle)"""
+        with self.lock:
+            arrays = {measure: values.copy() for measure, values in self.sums.items()}
+            skipped = self.skipped
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=np.int64(CUBE_VERSION), skipped=np.int64(skipped), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=CUBE_FILE):
+        with np.load(path, allow_pickle=False) as npz:
+            if int(npz['version']) != CUBE_VERSION or npz['count'].shape != SHAPE:
+                raise ValueError(f"{path}: cube incompatible, le reconstruire avec occupancy_cube.py")
+            return cls({measure: npz[measure].astype(float) for measure in MEASURES}, int(npz['skipped']))
+
+    # ------------------------------------------------------------------
+    # Requêtes
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def parse_filter(dimension, raw):
+        """Indices retenus pour une dimension à partir de 'v1,v2' (libellés ou valeurs, casse ignorée)"""
+        levels = dict(DIMENSIONS)[dimension]
+        lookup = {str(level_label(level)).lower(): i for i, level in enumerate(levels)}
+        indices = []
+        for value in str(raw).split(','):
+            key = value.strip().lower()
+            if key not in lookup:
+                choices = ', '.join(str(level_label(level)) for level in levels)
+                raise QueryError(f"Unknown value for {dimension}: '{value.strip()}' (expected one of: {choices})")
+            indices.append(lookup[key])
+        return sorted(set(indices))
+
+    def query(self, filters=None, group_by=()):
+        """Agrégats des cellules filtrées, regroupés selon group_by (les autres dimensions sont additionnées)
+
+        filters : {dimension: 'v1,v2'} ; coût proportionnel au nombre de cellules retenues.
+        """
+        filters = filters or {}
+        unknown = [d for d in list(filters) + list(group_by) if d not in DIMENSION_NAMES]
+        if unknown:
+            raise QueryError(f"Unknown dimensions: {', '.join(unknown)} (expected: {', '.join(DIMENSION_NAMES)})")
+        selection = [self.parse_filter(d, filters[d]) if d in filters else list(range(size))
+                     for d, size in zip(DIMENSION_NAMES, SHAPE)]
+        kept = [axis for axis, name in enumerate(DIMENSION_NAMES) if name in group_by]
+        summed = tuple(axis for axis in range(len(SHAPE)) if axis not in kept)
+        index = np.ix_(*selection)
+        with self.lock:
+            totals = {measure: values[index].sum(axis=summed) for measure, values in self.sums.items()}
+
+        groups = []
+        for position in np.ndindex(*[len(selection[axis]) for axis in kept]):
+            cell = {m: float(totals[m][position]) for m in MEASURES}
+            group = {DIMENSION_NAMES[axis]: level_label(dict(DIMENSIONS)[DIMENSION_NAMES[axis]][selection[axis][i]])
+                     for axis, i in zip(kept, position)}
+            count = cell['count']
+            group.update({
+                'count': int(count),
+                'occupancy_rate': round(cell['occupied'] / count, 4) if count else None,
+                'avg_duration': round(cell['duration_sum'] / count, 3) if count else None,
+                'avg_payment': round(cell['payment_sum'] / count, 3) if count else None,
+            })
+            groups.append(group)
+        return groups
+
+    def summary(self):
+        with self.lock:
+            events = int(self.sums['count'].sum())
+            skipped = self.skipped
+        return {'events': events, 'skipped': skipped, 'cells': int(np.prod(SHAPE)),
+                'dimensions': {name: [level_label(level) for level in levels] for name, levels in DIMENSIONS}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précalcul du cube d'occupation servi par /stats")
+    parser.add_argument('data', nargs='?', default='cleaned_smart_parking_data.csv')
+    parser.add_argument('--output', default=CUBE_FILE)
+    args = parser.parse_args()
+    cube = OccupancyCube.from_csv(args.data)
+    cube.save(args.output)
+    info = cube.summary()
+    print(f"Cube écrit dans {args.output}: {info['events']} événements, {info['cells']} cellules "
+          f"({info['skipped']} lignes ignorées)")
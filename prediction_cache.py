@@ -0,0 +1,132 @@
+# Cache en mémoire des résultats de prédiction (LRU + TTL + plafond mémoire)
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def parse_quantization(spec):
+    """Analyse 'Feature=pas,Feature2=pas' en dictionnaire {feature: pas}"""
+    steps = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        feature, _, step = item.partition('=')
+        steps[feature.strip()] = float(step)
+    return steps
+
+
+class PredictionCache:
+    """Cache opt-in indexé par le vecteur de caractéristiques validé
+
+    Les entrées expirent après `ttl` secondes ; au-delà de `max_entries` ou de
+    `max_bytes`, les entrées les moins récemment utilisées sont évincées. Un pas
+    de quantification par caractéristique permet de regrouper des valeurs proches
+    sous la même clé (le résultat mis en cache est alors celui de la première
+    requête du groupe).
+    """
+
+    def __init__(self, max_entries=0, ttl=300.0, max_bytes=16 * 1024 * 1024, quantization=None):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self.quantization = dict(quantization or {})
+        self._entries = OrderedDict()
+        self._steps = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.clears = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 0)),
+            ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 300)),
+            max_bytes=int(float(os.environ.get('PREDICTION_CACHE_MAX_MB', 16)) * 1024 * 1024),
+            quantization=parse_quantization(os.environ.get('PREDICTION_CACHE_QUANTIZATION'))
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, model_name, features, values):
+        """Construit la clé d'un vecteur validé (None si le cache est désactivé)"""
+        if not self.enabled:
+            return None
+        features = tuple(features)
+        steps = self._steps.get(features)
+        if steps is None:
+            steps = np.array([self.quantization.get(f, 0.0) for f in features], dtype=float)
+            self._steps[features] = steps
+        if steps.any():
+            values = np.where(steps > 0, np.round(values / np.where(steps > 0, steps, 1.0)), values)
+        return model_name, np.asarray(values, dtype=float).tobytes()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if key is None:
+            return
+        size = sys.getsizeof(key[1]) + len(json.dumps(value))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Vide le cache (appelé à chaque rechargement de modèles)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.clears += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "quantization": self.quantization,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "clears": self.clears
+            }
@@ -0,0 +1,122 @@
+# Regroupement des requêtes concurrentes en micro-lots (une file par modèle)
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+# Bornes supérieures des classes de l'histogramme des tailles de lot
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+class MicroBatcher:
+    """Accumule les requêtes d'un modèle pendant une courte fenêtre et les évalue en un seul appel vectorisé
+
+    Le premier élément reçu ouvre une fenêtre de `window_ms` millisecondes ; le lot
+    part dès que la fenêtre expire ou que `max_batch` éléments sont en attente.
+    Chaque appelant reçoit son propre résultat via un Future.
+    """
+
+    def __init__(self, name, predict_matrix, window_ms=2.0, max_batch=64, timeout=30.0):
+        self.name = name
+        # predict_matrix(compiled, matrix) -> liste de résultats, un par ligne
+        self.predict_matrix = predict_matrix
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.wait_seconds = 0.0
+
+    def _ensure_started(self):
+        # Démarrage paresseux : sous gunicorn --preload, le thread doit naître dans le worker, pas dans le maître
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'coalescer-{self.name}', daemon=True)
+                self._thread.start()
+
+    def submit(self, group, values):
+        """Soumet une ligne (déjà validée) et attend le résultat de son lot"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((group, np.array(values, dtype=float), future, time.perf_counter()))
+        return future.result(timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        # Un rechargement peut survenir pendant la fenêtre : on ne mélange pas deux versions de modèle
+        by_group = {}
+        for item in batch:
+            by_group.setdefault(id(item[0]), []).append(item)
+        for items in by_group.values():
+            compiled = items[0][0].compiled
+            try:
+                results = self.predict_matrix(compiled, np.vstack([item[1] for item in items]))
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += len(items)
+                for item in items:
+                    item[2].set_exception(e)
+                continue
+            for item, result in zip(items, results):
+                item[2].set_result(result)
+            self._record(len(items), sum(started - item[3] for item in items))
+
+    def _record(self, size, waited):
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if size <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._stats_lock:
+            self.histogram[bucket] += 1
+            self.requests += size
+            self.batches += 1
+            self.wait_seconds += waited
+
+    def stats(self):
+        with self._stats_lock:
+            # Liste ordonnée (un dictionnaire serait trié par clé lors de la sérialisation JSON)
+            histogram = [{"max_size": bound, "batches": count}
+                         for bound, count in zip(BATCH_SIZE_BUCKETS + [None], self.histogram)]
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "mean_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+                "mean_queue_wait_ms": round(self.wait_seconds / self.requests * 1000.0, 3) if self.requests else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "batch_size_histogram": histogram
+            }
+
+
+def coalescers_from_env(predictors):
+    """Crée un MicroBatcher par modèle listé dans COALESCE_MODELS si COALESCE_WINDOW_MS > 0"""
+    window_ms = float(os.environ.get('COALESCE_WINDOW_MS', 0))
+    if window_ms <= 0:
+        return {}
+    max_batch = int(os.environ.get('COALESCE_MAX_BATCH', 64))
+    names = [n.strip() for n in os.environ.get('COALESCE_MODELS', 'occupancy,cluster').split(',') if n.strip()]
+    return {name: MicroBatcher(name, predictors[name], window_ms, max_batch)
+            for name in names if name in predictors}
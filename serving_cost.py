@@ -0,0 +1,174 @@
+# Coût de service des modèles entraînés : latence du chemin d'inférence de l'API, taille du pickle,
+# mémoire après chargement et structure (vecteurs de support, nœuds d'arbres...), avec un budget
+# optionnel qui écarte les candidats trop coûteux avant leur sauvegarde
+import io
+import json
+import os
+import time
+import tracemalloc
+import joblib
+import numpy as np
+
+REPORT_FILE = 'serving_report.json'
+
+# Taille du lot mesuré (latence d'un appel batch de l'API)
+BATCH_ROWS = 1000
+
+
+class BudgetExceeded(ValueError):
+    """Aucun candidat ne respecte le budget de service : rien n'est sauvegardé"""
+
+
+def prediction_latency(predict, X, repeats=300, batch_rows=BATCH_ROWS):
+    """Latences (ms) de predict(X) : une ligne (médiane et p99) et un lot de batch_rows lignes"""
+    X = np.asarray(X, dtype=float)
+    predict(X[:1])  # préchauffage (allocations, caches)
+    single = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        predict(row)
+        single.append(time.perf_counter() - start)
+    batch = X[np.arange(batch_rows) % len(X)]
+    start = time.perf_counter()
+    predict(batch)
+    elapsed = time.perf_counter() - start
+    return {
+        'single_ms': round(float(np.median(single) * 1000), 6),
+        'single_p99_ms': round(float(np.percentile(single, 99) * 1000), 6),
+        'batch_ms': round(elapsed * 1000, 6),
+        'batch_row_ms': round(elapsed * 1000 / batch_rows, 6),
+    }
+
+
+def model_structure(model):
+    """Taille structurelle du modèle : ce qui fait varier le coût d'une prédiction"""
+    structure = {'type': type(model).__name__}
+    steps = getattr(model, 'steps', None)
+    if steps is not None:  # Pipeline : structure de chaque étape
+        structure['steps'] = [model_structure(step) for _, step in steps]
+        return structure
+    if hasattr(model, 'support_vectors_'):
+        structure['support_vectors'] = int(len(model.support_vectors_))
+    if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+        nodes = [int(tree.tree_.node_count) for tree in model.estimators_]
+        structure.update(trees=len(nodes), tree_nodes=int(sum(nodes)),
+                         max_depth=max(int(tree.tree_.max_depth) for tree in model.estimators_))
+    if hasattr(model, 'components_') and hasattr(model, 'n_components'):
+        structure['components'] = int(len(model.components_))
+    if hasattr(model, 'coef_'):
+        structure['coefficients'] = int(np.size(model.coef_))
+    if hasattr(model, 'cluster_centers_'):
+        structure['centroids'] = int(len(model.cluster_centers_))
+    return structure
+
+
+def artifact_footprint(*artifacts):
+    """(taille des pickles, mémoire allouée en les rechargeant), en Mo"""
+    buffer = io.BytesIO()
+    joblib.dump(artifacts, buffer)
+    size = buffer.tell()
+    buffer.seek(0)
+    tracemalloc.start()
+    try:
+        loaded = joblib.load(buffer)
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del loaded
+    return size / 1e6, allocated / 1e6
+
+
+def serving_report(predict, model, scaler, X, **extra):
+    """Rapport de coût d'un candidat ; predict(X) est le chemin d'inférence de l'API sur des lignes brutes"""
+    pickle_mb, memory_mb = artifact_footprint(model, scaler)
+    report = dict(extra)
+    report.update(prediction_latency(predict, X))
+    report.update(pickle_mb=pickle_mb, memory_mb=memory_mb, structure=model_structure(model))
+    return report
+
+
+class ServingBudget:
+    """Plafonds de service (None = pas de limite)"""
+
+    LIMITS = [
+        ('max_p99_ms', 'single_p99_ms', "latence p99 d'une ligne", 'ms'),
+        ('max_batch_ms', 'batch_ms', f"latence d'un lot de {BATCH_ROWS} lignes", 'ms'),
+        ('max_memory_mb', 'memory_mb', 'mémoire', 'Mo'),
+        ('max_pickle_mb', 'pickle_mb', 'taille du pickle', 'Mo'),
+    ]
+
+    def __init__(self, max_p99_ms=None, max_batch_ms=None, max_memory_mb=None, max_pickle_mb=None):
+        self.max_p99_ms = max_p99_ms
+        self.max_batch_ms = max_batch_ms
+        self.max_memory_mb = max_memory_mb
+        self.max_pickle_mb = max_pickle_mb
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.max_p99_ms, args.max_batch_ms, args.max_memory_mb, args.max_pickle_mb)
+
+    def as_dict(self):
+        return {option: getattr(self, option) for option, _, _, _ in self.LIMITS}
+
+    def violations(self, report):
+        """Dépassements du rapport, sous forme de messages (liste vide si le candidat est acceptable)"""
+        exceeded = []
+        for option, key, label, unit in self.LIMITS:
+            limit = getattr(self, option)
+            if limit is not None and report[key] > limit:
+                exceeded.append(f"{label} {report[key]:.3f} {unit} > {limit} {unit}")
+        return exceeded
+
+    def check(self, name, report):
+        """Ajoute le verdict au rapport et lève BudgetExceeded si le seul candidat dépasse le budget"""
+        report['budget_violations'] = self.violations(report)
+        if report['budget_violations']:
+            raise BudgetExceeded(f"{name} hors budget: {'; '.join(report['budget_violations'])}")
+
+    def select(self, candidates):
+        """Candidats {nom: rapport} qui respectent le budget, dans l'ordre d'origine"""
+        kept = {}
+        for name, report in candidates.items():
+            report['budget_violations'] = self.violations(report)
+            if report['budget_violations']:
+                print(f"Candidat {name} écarté: {'; '.join(report['budget_violations'])}")
+            else:
+                kept[name] = report
+        return kept
+
+
+def add_budget_arguments(parser):
+    group = parser.add_argument_group("budget de service (candidats au-delà écartés)")
+    group.add_argument('--max-p99-ms', type=float, default=None, help="Latence p99 maximale d'une ligne (ms)")
+    group.add_argument('--max-batch-ms', type=float, default=None,
+                       help=f"Latence maximale d'un lot de {BATCH_ROWS} lignes (ms)")
+    group.add_argument('--max-memory-mb', type=float, default=None, help="Mémoire maximale du modèle chargé (Mo)")
+    group.add_argument('--max-pickle-mb', type=float, default=None, help="Taille maximale du pickle (Mo)")
+
+
+def print_reports(reports):
+    print(f"\n{'Modèle':<28}{'1 ligne (ms)':>13}{'p99 (ms)':>10}{f'lot {BATCH_ROWS} (ms)':>15}"
+          f"{'pickle (Mo)':>13}{'mémoire (Mo)':>14}")
+    for name, r in reports.items():
+        print(f"{name:<28}{r['single_ms']:>13.3f}{r['single_p99_ms']:>10.3f}{r['batch_ms']:>15.2f}"
+              f"{r['pickle_mb']:>13.3f}{r['memory_mb']:>14.3f}")
+
+
+def save_reports(section, reports, budget=None, path=REPORT_FILE, output_dir='.'):
+    """Écrit la section d'un script dans serving_report.json sans toucher aux sections des autres scripts"""
+    path = os.path.join(output_dir, path)
+    content = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            content = json.load(f)
+    content[section] = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'budget': budget.as_dict() if budget is not None else None,
+        'models': reports,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(content, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
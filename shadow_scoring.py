@@ -0,0 +1,220 @@
+# Évaluation fantôme (shadow) de modèles candidats sur le trafic réel, hors du chemin de la requête :
+# la réponse servie ne change pas, la ligne validée est déposée dans une file bornée et des threads
+# de fond la notent avec le candidat, puis comptent les désaccords et la latence
+import os
+import queue
+import random
+import threading
+import time
+import numpy as np
+
+from model_registry import ModelRegistry
+from model_specs import artifact_spec
+
+# Groupe servi par chaque endpoint de prédiction (le candidat est construit de la même façon)
+MODEL_GROUPS = {'duration': 'regression', 'occupancy': 'classification', 'cluster': 'kmeans'}
+
+
+def parse_candidates(spec):
+    """Analyse 'occupancy=improved_classification_candidate,cluster=candidats/kmeans.npz'"""
+    candidates = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, source = item.partition('=')
+        name, source = name.strip(), source.strip()
+        if name not in MODEL_GROUPS or not source:
+            raise ValueError(f"SHADOW_MODELS: '{item.strip()}' (attendu modèle=préfixe ou fichier .npz, "
+                             f"modèle parmi {', '.join(MODEL_GROUPS)})")
+        candidates[name] = source
+    return candidates
+
+
+def compare_results(model_name, live, shadow, tolerance):
+    """(désaccord, écart absolu) entre la réponse servie et celle du candidat"""
+    if model_name == 'duration':
+        diff = abs(live['prediction'] - shadow['prediction'])
+        return diff > tolerance, diff
+    if model_name == 'occupancy':
+        diff = abs(live['probability']['occupied'] - shadow['probability']['occupied'])
+        return live['prediction'] != shadow['prediction'], diff
+    return live['cluster'] != shadow['cluster'], abs(live['confidence'] - shadow['confidence'])
+
+
+class ShadowStats:
+    """Compteurs d'un modèle candidat"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.errors = 0
+        self.disagreements = 0
+        self.diff_sum = 0.0
+        self.diff_max = 0.0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.queue_wait_sum = 0.0
+        self.last_error = None
+
+    def as_dict(self):
+        scored = self.scored
+        return {
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "scored": scored,
+            "errors": self.errors,
+            "disagreements": self.disagreements,
+            "disagreement_rate": round(self.disagreements / scored, 4) if scored else None,
+            "mean_abs_diff": round(self.diff_sum / scored, 4) if scored else None,
+            "max_abs_diff": round(self.diff_max, 4),
+            "mean_latency_ms": round(self.latency_sum / scored * 1000.0, 3) if scored else None,
+            "max_latency_ms": round(self.latency_max * 1000.0, 3),
+            "mean_queue_wait_ms": round(self.queue_wait_sum / scored * 1000.0, 3) if scored else None,
+            "last_error": self.last_error
+        }
+
+
+class ShadowScorer:
+    """File bornée + threads de fond : un échantillon est abandonné plutôt que de ralentir la requête
+
+    registry : registre des candidats, un groupe par modèle servi ('duration', 'occupancy', 'cluster').
+    predictors : {modèle: predict_matrix(compiled, matrix) -> résultats}, sans instrumentation du
+    chemin servi pour ne pas mélanger les latences des candidats à celles de /metrics.
+    """
+
+    def __init__(self, registry, predictors, queue_size=1000, workers=1, sample_rate=1.0, tolerance=1.0,
+                 metrics=None):
+        self.registry = registry
+        self.predictors = predictors
+        self.queue_size = max(1, int(queue_size))
+        self.workers = max(1, int(workers))
+        self.sample_rate = float(sample_rate)
+        self.tolerance = float(tolerance)
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {name: ShadowStats() for name in registry.specs}
+
+    def _ensure_started(self):
+        # Démarrage paresseux : sous gunicorn --preload, les threads doivent naître dans le worker
+        if len(self._threads) == self.workers and all(t.is_alive() for t in self._threads):
+            return
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'shadow-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, model_name, features, values, live_result):
+        """Dépose une ligne validée et la réponse servie ; ne bloque jamais (faux si l'échantillon est ignoré)"""
+        stats = self._stats.get(model_name)
+        if stats is None or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return False
+        self._ensure_started()
+        item = (model_name, features, np.array(values, dtype=float), live_result, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                stats.dropped += 1
+            self._count(model_name, 'dropped')
+            return False
+        with self._stats_lock:
+            stats.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._score(*item)
+            finally:
+                self._queue.task_done()
+
+    def _score(self, model_name, features, values, live_result, enqueued):
+        started = time.perf_counter()
+        stats = self._stats[model_name]
+        try:
+            group = self.registry.get(model_name)
+            if group is None:
+                raise RuntimeError("Candidate model not loaded")
+            compiled = group.compiled
+            if compiled.vector.features == features:
+                row = values[np.newaxis, :]
+            else:
+                # Caractéristiques différentes : le candidat relit les valeurs par nom
+                row = compiled.vector.fill(dict(zip(features, values.tolist())))
+            predict_start = time.perf_counter()
+            result = self.predictors[model_name](compiled, row)[0]
+            latency = time.perf_counter() - predict_start
+            disagree, diff = compare_results(model_name, live_result, result, self.tolerance)
+        except Exception as e:
+            with self._stats_lock:
+                stats.errors += 1
+                stats.last_error = str(e)
+            self._count(model_name, 'error')
+            return
+        with self._stats_lock:
+            stats.scored += 1
+            stats.disagreements += int(disagree)
+            stats.diff_sum += diff
+            stats.diff_max = max(stats.diff_max, diff)
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            stats.queue_wait_sum += started - enqueued
+        self._count(model_name, 'disagree' if disagree else 'agree')
+        if self.metrics is not None:
+            self.metrics.observe('shadow_predict_duration_seconds', 'Latence de prédiction des modèles candidats',
+                                 (('model', model_name),), latency)
+
+    def _count(self, model_name, outcome):
+        if self.metrics is not None:
+            self.metrics.inc('shadow_samples_total', 'Échantillons de trafic envoyés aux modèles candidats',
+                             (('model', model_name), ('outcome', outcome)))
+
+    def drain(self, timeout=None):
+        """Attend que la file soit vide (scripts et vérifications) ; vrai si elle l'est"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def stats(self):
+        candidates = self.registry.status()
+        with self._stats_lock:
+            models = {name: dict(stats.as_dict(), candidate=candidates.get(name))
+                      for name, stats in self._stats.items()}
+        return {
+            "enabled": True,
+            "queue_size": self.queue_size,
+            "queue_depth": self._queue.qsize(),
+            "workers": self.workers,
+            "sample_rate": self.sample_rate,
+            "duration_tolerance": self.tolerance,
+            "models": models
+        }
+
+
+def shadow_from_env(predictors, metrics=None, base_dir='.'):
+    """ShadowScorer pour les candidats de SHADOW_MODELS, None si la variable est vide"""
+    candidates = parse_candidates(os.environ.get('SHADOW_MODELS', ''))
+    if not candidates:
+        return None
+    specs = [artifact_spec(name, MODEL_GROUPS[name], source) for name, source in candidates.items()]
+    registry = ModelRegistry(specs, base_dir=base_dir, parallel=False)
+    registry.load_all()
+    return ShadowScorer(
+        registry,
+        predictors,
+        queue_size=int(os.environ.get('SHADOW_QUEUE_SIZE', 1000)),
+        workers=int(os.environ.get('SHADOW_WORKERS', 1)),
+        sample_rate=float(os.environ.get('SHADOW_SAMPLE_RATE', 1.0)),
+        tolerance=float(os.environ.get('SHADOW_DURATION_TOLERANCE', 1.0)),
+        metrics=metrics
+    )
@@ -0,0 +1,34 @@
+# Les modules de l'application sont à la racine du dépôt (pas de paquet installable)
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def client(tmp_path_factory):
+    """Client de test de l'API, chargée avec les modèles du dépôt ; journal d'ingestion temporaire,
+    sans surveillance des fichiers ni mises à jour de fond"""
+    environ = {
+        'MODEL_WATCH_INTERVAL': '0',
+        'INGEST_UPDATE_INTERVAL': '0',
+        'INGEST_LOG_DIR': str(tmp_path_factory.mktemp('ingest_log')),
+    }
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import improved_app
+    finally:
+        os.chdir(cwd)
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return improved_app.app.test_client()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LinearRegression, LogisticRegression, SGDClassifier, SGDRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from compact_models import export_arrays, load_compact, save_compact
+
+FEATURES = ['Payment_Amount', 'Proximity_To_Exit', 'User_Parking_History', 'Day']
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.uniform(0, 50, 400),
+        rng.uniform(0, 20, 400),
+        rng.integers(0, 30, 400),
+        rng.integers(1, 32, 400),
+    ]).astype(float)
+    duration = 0.1 * X[:, 0] - 0.3 * X[:, 1] + 0.05 * X[:, 2] + rng.normal(0, 1, 400)
+    occupancy = (X[:, 0] / 50 + X[:, 2] / 30 + rng.normal(0, 0.3, 400) > 1).astype(int)
+    scaler = StandardScaler().fit(X)
+    return X, scaler, duration, occupancy
+
+
+def round_trip(tmp_path, kind, scaler, model, profiles=None):
+    """Export .npz puis rechargement par le runtime NumPy"""
+    path = str(tmp_path / f'{kind}.npz')
+    save_compact(path, export_arrays(kind, scaler, model, FEATURES, profiles))
+    return load_compact(path)
+
+
+@pytest.mark.parametrize('model', [
+    LinearRegression(),
+    SGDRegressor(random_state=0),
+    RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0),
+], ids=lambda m: type(m).__name__)
+def test_regression_parity(tmp_path, data, model):
+    X, scaler, duration, _ = data
+    model.fit(scaler.transform(X), duration)
+    compact = round_trip(tmp_path, 'regression', scaler, model)
+    np.testing.assert_allclose(compact.predict(X), model.predict(scaler.transform(X)), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('model', [
+    LogisticRegression(),
+    SGDClassifier(loss='log_loss', random_state=0),
+    RandomForestClassifier(n_estimators=5, max_depth=6, random_state=0),
+    SVC(probability=True, random_state=0),
+    SVC(kernel='linear', probability=True, random_state=0),
+    Pipeline([('nystroem', Nystroem(gamma=0.25, n_components=50, random_state=0)),
+              ('linear', LogisticRegression(max_iter=1000))]),
+], ids=lambda m: type(m).__name__ + getattr(m, 'kernel', ''))
+def test_classification_parity(tmp_path, data, model):
+    X, scaler, _, occupancy = data
+    model.fit(scaler.transform(X), occupancy)
+    compact = round_trip(tmp_path, 'classification', scaler, model)
+    predictions, probabilities = compact.predict(X)
+    np.testing.assert_array_equal(predictions, model.predict(scaler.transform(X)))
+    np.testing.assert_allclose(probabilities, model.predict_proba(scaler.transform(X)), atol=1e-6)
+
+
+def test_kmeans_parity(tmp_path, data):
+    X, scaler, _, _ = data
+    model = KMeans(n_clusters=4, n_init=3, random_state=0).fit(scaler.transform(X))
+    profiles = [f"Profil {i}" for i in range(4)]
+    compact = round_trip(tmp_path, 'kmeans', scaler, model, profiles)
+    labels = compact.assign(X)[0][:, 0]
+    np.testing.assert_array_equal(labels, model.predict(scaler.transform(X)))
+    np.testing.assert_allclose(compact.distances(X), model.transform(scaler.transform(X)), rtol=1e-9, atol=1e-9)
+    assert compact.profiles == profiles
+
+
+def test_predict_record_matches_matrix(tmp_path, data):
+    X, scaler, duration, _ = data
+    model = LinearRegression().fit(scaler.transform(X), duration)
+    compact = round_trip(tmp_path, 'regression', scaler, model)
+    record = dict(zip(FEATURES, X[0].tolist()))
+    assert compact.predict_record(record) == pytest.approx(float(model.predict(scaler.transform(X[:1]))[0]))
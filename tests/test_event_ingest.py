@@ -0,0 +1,183 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.linear_model import SGDClassifier, SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from conftest import ROOT
+from event_ingest import SESSION_COLUMNS, EventLog, IncrementalUpdater, validate_sessions
+from feature_store import CSV_DTYPES, preprocess_frame
+from model_specs import pickle_spec
+
+FEATURES = ['Payment_Amount', 'Proximity_To_Exit', 'User_Parking_History', 'Reserved_Status']
+
+
+@pytest.fixture(scope='module')
+def sessions():
+    """Sessions au format de /ingest (colonnes du CSV, valeurs JSON)"""
+    frame = pd.read_csv(os.path.join(ROOT, 'cleaned_smart_parking_data.csv'), dtype=CSV_DTYPES)
+    return frame[SESSION_COLUMNS].to_dict('records')
+
+
+# ----------------------------------------------------------------------
+# Validation et journal
+# ----------------------------------------------------------------------
+
+def test_valid_sessions_are_accepted(sessions):
+    frame, errors = validate_sessions(sessions[:20])
+    assert errors == {}
+    assert len(frame) == 20
+    assert list(frame.columns) == SESSION_COLUMNS
+
+
+def test_invalid_sessions_are_rejected_individually(sessions):
+    good = sessions[0]
+    missing = {k: v for k, v in good.items() if k != 'Payment_Amount'}
+    records = [
+        good,
+        missing,
+        dict(good, Payment_Amount='abc'),
+        dict(good, User_Type='robot', Entry_Time='25:00:00'),
+        dict(good, Parking_Duration=2.5),
+        dict(good, Electric_Vehicle='maybe'),
+        'not a session',
+        dict(good, User_Type=' Visitor '),
+    ]
+    frame, errors = validate_sessions(records)
+    assert errors == {
+        1: "Missing column(s): Payment_Amount",
+        2: "Invalid value for Payment_Amount",
+        3: "Invalid value for User_Type; Invalid value for Entry_Time",
+        4: "Invalid value for Parking_Duration",
+        5: "Invalid value for Electric_Vehicle",
+        6: "Record must be a JSON object",
+    }
+    assert len(frame) == 2
+    # Modalités normalisées : casse et espaces ignorés
+    assert frame['User_Type'].tolist() == [good['User_Type'], 'visitor']
+
+
+def test_unknown_category_level_is_refused(sessions):
+    frame = pd.DataFrame(sessions[:5]).astype({col: dtype for col, dtype in CSV_DTYPES.items()
+                                               if col in SESSION_COLUMNS})
+    preprocess_frame(frame.copy())
+    frame['User_Type'] = pd.Categorical(['visitor', 'contractor', 'staff', 'visitor', 'staff'],
+                                        dtype=CSV_DTYPES['User_Type'])
+    with pytest.raises(ValueError, match='User_Type'):
+        preprocess_frame(frame.copy())
+    # Mode signalement (batch_score.py) : seule la ligne inconnue est notée
+    invalid = {}
+    preprocess_frame(frame, invalid)
+    assert invalid == {1: ['User_Type']}
+
+
+def test_event_log_rotates_and_prunes(tmp_path, sessions):
+    log = EventLog(str(tmp_path / 'log'), segment_rows=10, max_rows=30)
+    frame, _ = validate_sessions(sessions[:45])
+    assert log.append(frame) == 0
+    status = log.status()
+    # 5 segments écrits, les plus anciens supprimés au-delà de 30 lignes (le segment courant est gardé)
+    assert (status['first_row'], status['next_row'], status['segments']) == (20, 45, 3)
+    events, cursor, dropped = log.read(0, 100)
+    assert (len(events), cursor, dropped) == (25, 45, 20)
+    assert events['Payment_Amount'].tolist() == pytest.approx([s['Payment_Amount'] for s in sessions[20:45]])
+
+
+def test_ingest_endpoint_accepts_and_rejects(client, sessions):
+    response = client.post('/ingest', json=[sessions[0], dict(sessions[1], Payment_Amount=None), sessions[2]])
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body['accepted'] == 2
+    assert body['rejected'] == 1
+    assert client.post('/ingest', data='{oops', content_type='application/json').status_code == 400
+
+
+def test_ingest_endpoint_rejects_unhashable_booleans(client, sessions):
+    response = client.post('/ingest', json=[sessions[0], dict(sessions[1], Electric_Vehicle=[True],
+                                                              Reserved_Status={'value': False})])
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body['accepted'] == 1
+    assert body['rejected'] == 1
+    assert body['errors'] == [{'index': 1, 'error': "Invalid value for Electric_Vehicle; "
+                                                    "Invalid value for Reserved_Status"}]
+
+
+# ----------------------------------------------------------------------
+# Mises à jour incrémentales
+# ----------------------------------------------------------------------
+
+def train_groups(directory, sessions, eta0=None):
+    """Groupes SGD et KMeans entraînés sur les 500 premières sessions, au format des scripts"""
+    frame = preprocess_frame(validate_sessions(sessions[:500])[0])
+    X = frame[FEATURES].astype(float).to_numpy()
+    groups = {}
+    for name, model, target in [
+        ('regression', SGDRegressor(random_state=0, max_iter=50), frame['Parking_Duration']),
+        ('classification', SGDClassifier(loss='log_loss', random_state=0, max_iter=50), frame['occupancy']),
+        ('kmeans', KMeans(n_clusters=3, n_init=3, random_state=0), None),
+    ]:
+        scaler = StandardScaler().fit(X)
+        if target is None:
+            model.fit(scaler.transform(X))
+        else:
+            model.fit(scaler.transform(X), target.to_numpy())
+            if eta0 is not None:
+                # Pas d'apprentissage négligeable : seul l'effet d'un changement de scaler reste visible
+                model.set_params(learning_rate='constant', eta0=eta0)
+        for role, value in (('features', FEATURES), ('model', model), ('scaler', scaler)):
+            joblib.dump(value, os.path.join(directory, f'{name}_{role}.pkl'))
+        groups[name] = (scaler, model)
+    return X, groups
+
+
+def predictions(directory, name, X):
+    scaler = joblib.load(os.path.join(directory, f'{name}_scaler.pkl'))
+    model = joblib.load(os.path.join(directory, f'{name}_model.pkl'))
+    Z = scaler.transform(X)
+    if name == 'classification':
+        return model.predict_proba(Z)[:, 1]
+    return model.predict(Z)
+
+
+def apply_sessions(directory, records):
+    log = EventLog(os.path.join(directory, 'log'))
+    log.append(validate_sessions(records)[0])
+    specs = [pickle_spec(name, name, name) for name in ('regression', 'classification', 'kmeans')]
+    updater = IncrementalUpdater(log, specs, base_dir=directory, min_rows=1)
+    return updater.run_once(force=True)
+
+
+def test_update_keeps_old_row_predictions(tmp_path, sessions):
+    directory = str(tmp_path)
+    # Petit pas constant : le pas par défaut de SGDClassifier fait osciller un modèle à faible signal
+    X, _ = train_groups(directory, sessions, eta0=1e-4)
+    before = {name: predictions(directory, name, X) for name in ('regression', 'classification', 'kmeans')}
+    summary = apply_sessions(directory, sessions[500:])
+    assert sorted(summary['updated']) == ['classification', 'kmeans', 'regression']
+    after = {name: predictions(directory, name, X) for name in ('regression', 'classification', 'kmeans')}
+    # Même distribution : les prédictions sur les lignes d'entraînement bougent peu
+    np.testing.assert_allclose(after['regression'], before['regression'], rtol=0.01)
+    np.testing.assert_allclose(after['classification'], before['classification'], atol=0.02)
+    assert (after['kmeans'] == before['kmeans']).mean() > 0.95
+
+
+def test_supervised_scalers_stay_frozen(tmp_path, sessions):
+    directory = str(tmp_path)
+    X, groups = train_groups(directory, sessions, eta0=1e-12)
+    before = {name: predictions(directory, name, X) for name in ('regression', 'classification')}
+    # Sessions décalées : un scaler mis à jour déplacerait toutes les prédictions
+    shifted = [dict(s, Payment_Amount=s['Payment_Amount'] * 3 + 10) for s in sessions[500:]]
+    apply_sessions(directory, shifted)
+    for name in ('regression', 'classification'):
+        scaler = joblib.load(os.path.join(directory, f'{name}_scaler.pkl'))
+        np.testing.assert_array_equal(scaler.mean_, groups[name][0].mean_)
+        np.testing.assert_allclose(predictions(directory, name, X), before[name], atol=1e-6)
+    # Le scaler KMeans suit les sessions, ses centroïdes restent au même endroit dans l'espace d'origine
+    kmeans_scaler = joblib.load(os.path.join(directory, 'kmeans_scaler.pkl'))
+    assert kmeans_scaler.n_samples_seen_ == 1000
+    assert kmeans_scaler.mean_[0] > groups['kmeans'][0].mean_[0]
@@ -0,0 +1,95 @@
+import numpy as np
+
+import prediction_cache
+from prediction_cache import PredictionCache, parse_quantization
+
+FEATURES = ['Payment_Amount', 'Proximity_To_Exit']
+
+
+class FakeClock:
+    """Remplace le module time de prediction_cache : l'expiration ne dépend plus de l'horloge réelle"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def make_key(cache, *values):
+    return cache.key('duration', FEATURES, np.array(values, dtype=float))
+
+
+def test_disabled_cache_has_no_keys():
+    cache = PredictionCache(max_entries=0)
+    assert make_key(cache, 1.0, 2.0) is None
+    cache.put(None, {"prediction": 1.0})
+    assert cache.get(None) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2)
+    a, b, c = make_key(cache, 1, 1), make_key(cache, 2, 2), make_key(cache, 3, 3)
+    cache.put(a, {"prediction": 1})
+    cache.put(b, {"prediction": 2})
+    # a devient le plus récent : b est évincé à l'ajout de c
+    assert cache.get(a) == {"prediction": 1}
+    cache.put(c, {"prediction": 3})
+    assert cache.get(b) is None
+    assert cache.get(a) == {"prediction": 1}
+    assert cache.get(c) == {"prediction": 3}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prediction_cache, 'time', clock)
+    cache = PredictionCache(max_entries=10, ttl=5)
+    key = make_key(cache, 1, 1)
+    cache.put(key, {"prediction": 1})
+    clock.now += 4.9
+    assert cache.get(key) == {"prediction": 1}
+    clock.now += 0.2
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+    assert stats["bytes"] == 0
+
+
+def test_memory_cap_evicts_oldest_entries():
+    cache = PredictionCache(max_entries=1000)
+    first = make_key(cache, 0, 0)
+    cache.put(first, {"prediction": 0})
+    entry_bytes = cache.stats()["bytes"]
+    cache = PredictionCache(max_entries=1000, max_bytes=3 * entry_bytes)
+    keys = [make_key(cache, i, i) for i in range(5)]
+    for i, key in enumerate(keys):
+        cache.put(key, {"prediction": i})
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["bytes"] <= 3 * entry_bytes
+    assert stats["evictions"] == 2
+    assert cache.get(keys[0]) is None and cache.get(keys[1]) is None
+    assert cache.get(keys[4]) == {"prediction": 4}
+
+
+def test_replacing_a_key_keeps_byte_count_consistent():
+    cache = PredictionCache(max_entries=10)
+    key = make_key(cache, 1, 1)
+    cache.put(key, {"prediction": 1})
+    before = cache.stats()["bytes"]
+    cache.put(key, {"prediction": 2})
+    assert cache.stats()["bytes"] == before
+    assert cache.get(key) == {"prediction": 2}
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+
+
+def test_quantization_groups_close_values():
+    cache = PredictionCache(max_entries=10, quantization=parse_quantization('Payment_Amount=0.5'))
+    assert make_key(cache, 10.1, 3) == make_key(cache, 9.9, 3)
+    assert make_key(cache, 10.1, 3) != make_key(cache, 10.1, 3.01)
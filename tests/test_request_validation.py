@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from fast_inference import RECORD_ERROR, FeatureVector, SharedFeatureVector, ValidationError
+
+FEATURES = ['Day', 'Proximity_To_Exit', 'Payment_Amount', 'User_Parking_History']
+RECORD = {'Day': 15, 'Proximity_To_Exit': 5.0, 'Payment_Amount': 12.5, 'User_Parking_History': 3}
+
+
+def rejection(vector, record):
+    with pytest.raises(ValidationError) as info:
+        vector.fill(record)
+    return info.value
+
+
+def test_valid_record_is_written_in_model_order():
+    vector = FeatureVector(FEATURES)
+    row = vector.fill(dict(reversed(list(RECORD.items()))))
+    np.testing.assert_array_equal(row, [[15.0, 5.0, 12.5, 3.0]])
+
+
+def test_booleans_and_numeric_strings_are_coerced():
+    vector = FeatureVector(FEATURES)
+    row = vector.fill(dict(RECORD, Day='15', Proximity_To_Exit=True, User_Parking_History=' yes '))
+    np.testing.assert_array_equal(row, [[15.0, 1.0, 12.5, 1.0]])
+
+
+@pytest.mark.parametrize('value, reason', [
+    (None, 'null'),
+    ('abc', 'not a number'),
+    ([1, 2], 'not a number'),
+    ({'value': 1}, 'not a number'),
+    (float('nan'), 'not a finite number'),
+    (float('inf'), 'not a finite number'),
+    ('-inf', 'not a finite number'),
+])
+def test_invalid_values_are_rejected(value, reason):
+    error = rejection(FeatureVector(FEATURES), dict(RECORD, Payment_Amount=value))
+    assert error.errors == {'Payment_Amount': reason}
+    assert str(error) == f"Invalid value for Payment_Amount: {reason}"
+
+
+def test_all_errors_are_reported_at_once():
+    record = {'Day': 'x', 'Payment_Amount': None}
+    error = rejection(FeatureVector(FEATURES), record)
+    assert error.errors == {'Day': 'not a number', 'Proximity_To_Exit': 'missing',
+                            'Payment_Amount': 'null', 'User_Parking_History': 'missing'}
+    assert str(error).startswith("Missing features: Proximity_To_Exit, User_Parking_History; ")
+
+
+@pytest.mark.parametrize('record', [None, [], 'text', 42])
+def test_non_object_records_are_rejected(record):
+    error = rejection(FeatureVector(FEATURES), record)
+    assert error.errors == {RECORD_ERROR: 'Record must be a JSON object'}
+
+
+def test_batch_keeps_valid_rows_and_reports_invalid_ones():
+    vector = FeatureVector(FEATURES)
+    records = [RECORD, dict(RECORD, Day=None), 'oops', dict(RECORD, Day='20')]
+    matrix, valid, errors = vector.fill_batch(records)
+    assert valid == [0, 3]
+    np.testing.assert_array_equal(matrix[:, 0], [15.0, 20.0])
+    assert errors == {1: "Invalid value for Day: null", 2: "Record must be a JSON object"}
+
+
+def test_shared_vector_fails_only_models_missing_their_features():
+    shared = SharedFeatureVector({'duration': FeatureVector(FEATURES),
+                                  'cluster': FeatureVector(['Payment_Amount', 'User_Parking_History'])})
+    rows, failures = shared.fill({'Payment_Amount': 10, 'User_Parking_History': 2})
+    assert set(failures) == {'duration'}
+    assert failures['duration'].errors == {'Day': 'missing', 'Proximity_To_Exit': 'missing'}
+    np.testing.assert_array_equal(rows['cluster'], [[10.0, 2.0]])
+
+
+# ----------------------------------------------------------------------
+# Réponses de l'API
+# ----------------------------------------------------------------------
+
+def duration_record(client):
+    features = client.get('/features').get_json()['regression_features']
+    return {feature: 1.0 for feature in features}
+
+
+def test_api_rejects_invalid_record_with_details(client):
+    record = duration_record(client)
+    feature = next(iter(record))
+    response = client.post('/predict/duration', json=dict(record, **{feature: 'abc'}))
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['details'] == {feature: 'not a number'}
+    assert body['error'] == f"Invalid value for {feature}: not a number"
+
+
+@pytest.mark.parametrize('data, content_type', [
+    ('{not json', 'application/json'),
+    ('', 'application/json'),
+    ('Day=1', 'application/x-www-form-urlencoded'),
+])
+def test_api_rejects_malformed_body(client, data, content_type):
+    response = client.post('/predict/duration', data=data, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json()['details'] == {RECORD_ERROR: 'Record must be a JSON object'}
+
+
+def test_api_accepts_valid_record(client):
+    response = client.post('/predict/duration', json=duration_record(client))
+    assert response.status_code == 200
+    assert response.get_json()['unit'] == 'hours'
+
+
+def test_api_batch_reports_errors_per_record(client):
+    record = duration_record(client)
+    response = client.post('/predict/duration/batch', json=[record, dict(record, **{next(iter(record)): None})])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['count'], body['succeeded'], body['failed']) == (2, 1, 1)
+    assert 'prediction' in body['results'][0]
+    assert body['results'][1]['error'].endswith(': null')
+    assert body['results'][1]['index'] == 1
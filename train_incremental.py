@@ -0,0 +1,315 @@
+# Apprentissage incrémental hors mémoire : le CSV est lu par morceaux et les modèles
+# sont ajustés par partial_fit, la mémoire ne dépend que de la taille d'un morceau
+import argparse
+import json
+import os
+import sys
+import time
+import joblib
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.linear_model import SGDRegressor, SGDClassifier
+from sklearn.cluster import MiniBatchKMeans
+
+from feature_store import feature_arrays, iter_feature_chunks
+from fast_inference import CompiledRegression, CompiledClassifier, CompiledKMeans
+from model_registry import dump_group_atomic
+from drift_monitor import save_reference
+from serving_cost import (BATCH_ROWS, BudgetExceeded, ServingBudget, add_budget_arguments, print_reports,
+                          save_reports, serving_report)
+from train_kmeans import kmeans_features, cluster_profiles
+from improve_classification import important_features
+
+DATA_PATH = "cleaned_smart_parking_data.csv"
+
+# Caractéristiques de régression utilisées quand aucune sélection n'a encore été sauvegardée
+DEFAULT_REGRESSION_FEATURES = ['Day', 'Proximity_To_Exit', 'Payment_Amount', 'User_Parking_History']
+
+# Lignes d'entraînement tirées uniformément pendant la passe 1 (mémoire bornée) : référence de /drift
+# et mesure du coût de service
+SAMPLE_ROWS = 100000
+
+
+def saved_features(path, default):
+    """Réutilise la liste de caractéristiques déjà sauvegardée (la sélection demande tout le jeu de données)"""
+    if os.path.exists(path):
+        return [str(f) for f in joblib.load(path)]
+    return list(default)
+
+
+def chosen_k(output_dir, default=4):
+    """Nombre de clusters retenu par le dernier balayage de train_kmeans.py (kmeans_sweep.json)"""
+    path = os.path.join(output_dir, 'kmeans_sweep.json')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return int(json.load(f)['chosen_k'])
+    return default
+
+
+def holdout_mask(start, n_rows, every):
+    """Lignes réservées à l'évaluation : une ligne sur `every`, selon sa position dans le fichier"""
+    if not every:
+        return np.zeros(n_rows, dtype=bool)
+    return (np.arange(start, start + n_rows) % every) == 0
+
+
+class IncrementalTask:
+    """Scaler + modèle ajustés morceau par morceau, avec les fichiers .pkl attendus par l'API"""
+
+    def __init__(self, name, prefix, features, model, target=None, fit_params=None, batch_size=None):
+        self.name = name
+        self.prefix = prefix
+        self.features = features
+        self.target = target
+        self.model = model
+        self.fit_params = fit_params or {}
+        self.batch_size = batch_size
+        self.scaler = StandardScaler()
+        self.class_counts = {}
+        self.sample = np.empty((0, len(features)))
+        self.sample_keys = np.empty(0)
+        self.reset_evaluation()
+
+    def matrix(self, chunk):
+        return chunk[self.features].to_numpy(dtype=float)
+
+    def fit_scaler(self, chunk, rng=None, sample_rows=SAMPLE_ROWS):
+        if not len(chunk):
+            return
+        X = self.matrix(chunk)
+        self.scaler.partial_fit(X)
+        if rng is not None:
+            self.add_to_sample(X, rng, sample_rows)
+        if isinstance(self.model, SGDClassifier):
+            for label, count in chunk[self.target].value_counts().items():
+                self.class_counts[label] = self.class_counts.get(label, 0) + int(count)
+
+    def add_to_sample(self, X, rng, sample_rows):
+        """Échantillon uniforme de taille bornée : les lignes de plus petites clés aléatoires sont gardées"""
+        keys = np.concatenate([self.sample_keys, rng.random_sample(len(X))])
+        rows = np.concatenate([self.sample, X])
+        if len(keys) > sample_rows:
+            kept = np.argpartition(keys, sample_rows)[:sample_rows]
+            keys, rows = keys[kept], rows[kept]
+        self.sample_keys, self.sample = keys, rows
+
+    def compiled(self):
+        """Chemin d'inférence de l'API pour ce modèle (mesure du coût de service)"""
+        if self.target is None:
+            kmeans = CompiledKMeans(self.scaler, self.model, self.features,
+                                    cluster_profiles(self.model.cluster_centers_, self.features))
+            return lambda rows: kmeans.assign(rows)[0]
+        if isinstance(self.model, SGDRegressor):
+            return CompiledRegression(self.scaler, self.model, self.features).predict
+        return CompiledClassifier(self.scaler, self.model, self.features).predict
+
+    def serving_report(self):
+        return serving_report(self.compiled(), self.model, self.scaler, self.sample[:BATCH_ROWS])
+
+    def balance_classes(self):
+        """Poids de classes 'balanced' calculés sur la passe 1 (partial_fit n'accepte pas 'balanced')"""
+        if not self.class_counts:
+            return
+        total = sum(self.class_counts.values())
+        self.model.set_params(class_weight={int(label): total / (len(self.class_counts) * count)
+                                            for label, count in self.class_counts.items()})
+
+    def fit(self, chunk, rng):
+        if not len(chunk):
+            return
+        order = rng.permutation(len(chunk))
+        X = self.scaler.transform(self.matrix(chunk))[order]
+        y = chunk[self.target].to_numpy()[order] if self.target else None
+        step = self.batch_size or len(X)
+        for start in range(0, len(X), step):
+            if y is None:
+                self.model.partial_fit(X[start:start + step])
+            else:
+                self.model.partial_fit(X[start:start + step], y[start:start + step], **self.fit_params)
+
+    def reset_evaluation(self):
+        self.totals = {}
+
+    def add(self, key, value):
+        self.totals[key] = self.totals.get(key, 0.0) + float(value)
+
+    def evaluate(self, chunk):
+        """Accumule les statistiques d'évaluation d'un morceau réservé"""
+        if not len(chunk):
+            return
+        X = self.scaler.transform(self.matrix(chunk))
+        self.add('n', len(X))
+        if self.target is None:
+            self.add('inertia', (np.min(self.model.transform(X), axis=1) ** 2).sum())
+            return
+        y = chunk[self.target].to_numpy(dtype=float)
+        predictions = self.model.predict(X)
+        if isinstance(self.model, SGDRegressor):
+            self.add('abs_error', np.abs(predictions - y).sum())
+            self.add('sq_error', ((predictions - y) ** 2).sum())
+            self.add('y', y.sum())
+            self.add('y2', (y ** 2).sum())
+        else:
+            self.add('correct', (predictions == y).sum())
+            self.add('tp', ((predictions == 1) & (y == 1)).sum())
+            self.add('fp', ((predictions == 1) & (y == 0)).sum())
+            self.add('fn', ((predictions == 0) & (y == 1)).sum())
+
+    def report(self):
+        t = self.totals
+        n = t.get('n', 0)
+        if not n:
+            return {}
+        if self.target is None:
+            return {'inertie_moyenne': t['inertia'] / n}
+        if isinstance(self.model, SGDRegressor):
+            variance = t['y2'] - t['y'] ** 2 / n
+            return {'mae': t['abs_error'] / n, 'r2': 1 - t['sq_error'] / variance if variance else 0.0}
+        precision_denominator = t['tp'] + t['fp']
+        recall_denominator = t['tp'] + t['fn']
+        precision = t['tp'] / precision_denominator if precision_denominator else 0.0
+        recall = t['tp'] / recall_denominator if recall_denominator else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {'accuracy': t['correct'] / n, 'f1': f1}
+
+    def save(self, output_dir):
+        path = lambda role: os.path.join(output_dir, f'{self.prefix}_{role}.pkl')
+        artifacts = {path('features'): self.features, path('model'): self.model, path('scaler'): self.scaler}
+        if self.target is None:
+            # Profils recalculés pour ces centroïdes (ceux d'un entraînement précédent ne correspondent plus)
+            artifacts[path('profiles')] = cluster_profiles(self.model.cluster_centers_, self.features)
+        # Groupe publié d'un bloc : le registre de l'API ne mélange jamais ancien et nouveau fichiers
+        dump_group_atomic(artifacts)
+
+
+def build_tasks(output_dir, models, classification_prefix='improved_classification', n_clusters=4, random_state=42):
+    tasks = []
+    if 'regression' in models:
+        tasks.append(IncrementalTask(
+            'regression', 'regression',
+            saved_features(os.path.join(output_dir, 'regression_features.pkl'), DEFAULT_REGRESSION_FEATURES),
+            SGDRegressor(random_state=random_state), target='Parking_Duration'))
+    if 'classification' in models:
+        tasks.append(IncrementalTask(
+            'classification', classification_prefix,
+            saved_features(os.path.join(output_dir, f'{classification_prefix}_features.pkl'), important_features),
+            SGDClassifier(loss='log_loss', random_state=random_state), target='occupancy',
+            fit_params={'classes': np.array([0, 1])}))
+    if 'kmeans' in models:
+        tasks.append(IncrementalTask(
+            'kmeans', 'kmeans', list(kmeans_features),
+            MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=3, batch_size=1024),
+            batch_size=1024))
+    return tasks
+
+
+def split_chunks(data_path, chunksize, holdout_every, columns):
+    """Renvoie (morceau d'entraînement, morceau réservé) pour chaque tranche du cache de caractéristiques"""
+    for chunk in iter_feature_chunks(data_path, chunksize, columns):
+        mask = holdout_mask(chunk.index[0], len(chunk), holdout_every)
+        yield chunk[~mask], chunk[mask]
+
+
+def train_incremental(data_path, output_dir='.', chunksize=100000, epochs=5, holdout_every=10,
+                      models=('regression', 'classification', 'kmeans'), random_state=42, n_clusters=None,
+                      budget=None):
+    """Entraîne les modèles demandés par passes successives sur le fichier et sauvegarde les .pkl
+
+    Comme les scripts complets, écrit le coût de service (serving_report.json, section train_incremental)
+    et la référence de /drift ; si un modèle dépasse le budget, aucun n'est sauvegardé (BudgetExceeded).
+    """
+    n_clusters = n_clusters or chosen_k(output_dir)
+    tasks = build_tasks(output_dir, models, n_clusters=n_clusters, random_state=random_state)
+    for task in tasks:
+        print(f"{task.name}: {len(task.features)} caractéristiques ({', '.join(task.features)})")
+
+    # Le CSV n'est analysé qu'une fois (cache de caractéristiques), puis seules les colonnes utiles sont lues
+    all_columns, _ = feature_arrays(data_path)
+    needed = []
+    for task in tasks:
+        missing = [col for col in task.features + [task.target] if col and col not in all_columns]
+        if missing:
+            raise ValueError(f"{task.name}: colonnes absentes des données: {', '.join(missing)}")
+        needed += [col for col in task.features + [task.target] if col and col not in needed]
+
+    # Passe 1 : statistiques des scalers et échantillon des lignes d'entraînement
+    print("Passe 1 : ajustement des scalers...")
+    start_time = time.perf_counter()
+    rows = 0
+    sample_rng = np.random.RandomState(random_state)
+    for train_chunk, _ in split_chunks(data_path, chunksize, holdout_every, needed):
+        rows += len(train_chunk)
+        for task in tasks:
+            task.fit_scaler(train_chunk, sample_rng)
+    print(f"{rows} lignes d'entraînement ({time.perf_counter() - start_time:.1f}s)")
+    for task in tasks:
+        task.balance_classes()
+
+    # Passes suivantes : partial_fit des modèles, morceau par morceau
+    rng = np.random.RandomState(random_state)
+    for epoch in range(epochs):
+        start_time = time.perf_counter()
+        for train_chunk, _ in split_chunks(data_path, chunksize, holdout_every, needed):
+            for task in tasks:
+                task.fit(train_chunk, rng)
+        print(f"Époque {epoch + 1}/{epochs} terminée ({time.perf_counter() - start_time:.1f}s)")
+
+    # Évaluation sur les lignes réservées
+    if holdout_every:
+        print("Évaluation sur les lignes réservées...")
+        for _, holdout_chunk in split_chunks(data_path, chunksize, holdout_every, needed):
+            for task in tasks:
+                task.evaluate(holdout_chunk)
+        for task in tasks:
+            scores = ', '.join(f"{k}={v:.4f}" for k, v in task.report().items())
+            print(f"- {task.name}: {scores}")
+
+    # Coût de service avant sauvegarde : un modèle hors budget ne remplace pas les modèles servis
+    budget = budget or ServingBudget()
+    os.makedirs(output_dir, exist_ok=True)
+    reports = {task.prefix: task.serving_report() for task in tasks}
+    print_reports(reports)
+    try:
+        for task in tasks:
+            budget.check(task.prefix, reports[task.prefix])
+    finally:
+        save_reports('train_incremental', reports, budget, output_dir=output_dir)
+
+    print("Sauvegarde des modèles...")
+    joblib.dump(all_columns, os.path.join(output_dir, 'model_columns.pkl'))
+    for task in tasks:
+        task.save(output_dir)
+        # Référence de /drift du nouveau modèle (sinon le trafic serait comparé à l'ancien)
+        save_reference(task.prefix, task.sample, task.features, output_dir=output_dir)
+        print(f"- {task.prefix}_model.pkl, {task.prefix}_scaler.pkl, {task.prefix}_features.pkl")
+    print("Terminé! Les modèles incrémentaux ont été entraînés et sauvegardés avec succès.")
+    return {task.name: task.model for task in tasks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement incrémental (par morceaux) des trois modèles")
+    parser.add_argument('data', nargs='?', default=DATA_PATH)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--chunksize', type=int, default=100000, help="Lignes lues par morceau")
+    parser.add_argument('--epochs', type=int, default=5, help="Nombre de passes partial_fit sur le fichier")
+    parser.add_argument('--holdout-every', type=int, default=10,
+                        help="Une ligne sur N est réservée à l'évaluation (0 = aucune)")
+    parser.add_argument('--models', default='regression,classification,kmeans')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clusters', type=int, default=None,
+                        help="Nombre de clusters (par défaut celui de kmeans_sweep.json, sinon 4)")
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    unknown = set(models) - {'regression', 'classification', 'kmeans'}
+    if unknown:
+        parser.error(f"modèles inconnus: {', '.join(sorted(unknown))}")
+    try:
+        train_incremental(args.data, args.output_dir, args.chunksize, args.epochs, args.holdout_every,
+                          models, args.seed, args.clusters, ServingBudget.from_args(args))
+    except BudgetExceeded as e:
+        sys.exit(f"Erreur: {e}")
+
+
+if __name__ == "__main__":
+    main()
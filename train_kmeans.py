@@ -1,67 +1,215 @@
+import argparse
+import json
+import os
+import sys
+import time
 import pandas as pd
 import numpy as np
-import joblib
+from joblib import Parallel, delayed
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
 
-# Charger les données
-print("Chargement des données...")
-df = pd.read_csv('./cleaned_smart_parking_data.csv')
+from feature_store import load_features
+from fast_inference import CompiledKMeans
+from model_registry import dump_group_atomic
+from drift_monitor import save_reference
+from serving_cost import (BATCH_ROWS, BudgetExceeded, ServingBudget, add_budget_arguments,
+                           print_reports, save_reports, serving_report)
 
 # Sélectionner les caractéristiques pour le clustering
 kmeans_features = ['Parking_Duration', 'Payment_Amount', 'User_Parking_History', 'Proximity_To_Exit']
 
-# Vérifier les valeurs manquantes
-print(f"Valeurs manquantes: {df[kmeans_features].isnull().sum().sum()}")
+# Au-delà de ce nombre de lignes, MiniBatchKMeans remplace KMeans
+MINIBATCH_THRESHOLD = 100000
 
-# Préparer les données
-X = df[kmeans_features].copy()
+# Libellés des profils selon le signe du centre standardisé : (valeur élevée, valeur faible)
+FEATURE_DESCRIPTIONS = {
+    'Parking_Duration': ("Longue durée", "Court séjour"),
+    'Payment_Amount': ("Prix élevé", "Petit budget"),
+    'User_Parking_History': ("Habitués", "Usagers occasionnels"),
+    'Proximity_To_Exit': ("Loin de la sortie", "Proche de la sortie"),
+}
 
-# Standardiser les caractéristiques
-print("Standardisation des données...")
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+def make_kmeans(k, n_rows, random_state=42):
+    if n_rows > MINIBATCH_THRESHOLD:
+        return MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3, batch_size=4096)
+    return KMeans(n_clusters=k, random_state=random_state, n_init=10)
+
+def evaluate_k(X_scaled, k, sample_size, random_state=42):
+    """Ajuste un modèle à k clusters ; silhouette estimée sur au plus sample_size lignes"""
+    start = time.perf_counter()
+    kmeans = make_kmeans(k, len(X_scaled), random_state)
+    labels = kmeans.fit_predict(X_scaled)
+    sample = sample_size if sample_size and len(X_scaled) > sample_size else None
+    silhouette = silhouette_score(X_scaled, labels, sample_size=sample, random_state=random_state)
+    return {
+        'k': k,
+        'silhouette': float(silhouette),
+        'inertia': float(kmeans.inertia_),
+        'fit_seconds': round(time.perf_counter() - start, 3),
+    }
 
 # Déterminer le nombre optimal de clusters
-print("Détermination du nombre optimal de clusters...")
-silhouette_scores = []
-inertia = []
-k_range = range(2, 10)
+def sweep_k(X_scaled, k_range=range(2, 10), sample_size=10000, fit_size=None, n_jobs=-1, random_state=42):
+    """Évalue chaque k dans un pool de processus et renvoie une liste de {k, silhouette, inertia, fit_seconds}
 
-for k in k_range:
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(X_scaled)
-    silhouette_scores.append(silhouette_score(X_scaled, labels))
-    inertia.append(kmeans.inertia_)
-
-# Choisir le nombre optimal de clusters (ici on choisit arbitrairement 4)
-optimal_k = 4
-print(f"Nombre optimal de clusters: {optimal_k}")
-
-# Entraîner le modèle final
-print(f"Entraînement du modèle KMeans avec {optimal_k} clusters...")
-final_kmeans = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-final_kmeans.fit(X_scaled)
-
-# Analyser les clusters
-cluster_centers = scaler.inverse_transform(final_kmeans.cluster_centers_)
-centers_df = pd.DataFrame(cluster_centers, columns=kmeans_features)
-centers_df.index.name = 'Cluster'
-
-print("Centres des clusters (échelle originale):")
-print(centers_df)
-
-# Évaluer les tailles des clusters
-cluster_counts = np.bincount(final_kmeans.labels_)
-print("Tailles des clusters:")
-for i, count in enumerate(cluster_counts):
-    print(f"Cluster {i}: {count} utilisateurs")
-
-# Sauvegarder le modèle et le scaler
-print("Sauvegarde du modèle KMeans...")
-joblib.dump(final_kmeans, 'kmeans_model.pkl')
-joblib.dump(scaler, 'kmeans_scaler.pkl')
-joblib.dump(kmeans_features, 'kmeans_features.pkl')
-
-print("Terminé! Le modèle KMeans a été entraîné et sauvegardé avec succès.")
+    fit_size limite les lignes utilisées pour ajuster les candidats (échantillon aléatoire) ; l'inertie
+    est alors ramenée au nombre total de lignes.
+    """
+    n_rows = len(X_scaled)
+    if fit_size and n_rows > fit_size:
+        rows = np.random.RandomState(random_state).choice(n_rows, fit_size, replace=False)
+        X_fit = X_scaled[np.sort(rows)]
+    else:
+        X_fit = X_scaled
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_k)(X_fit, k, sample_size, random_state) for k in k_range)
+    for result in results:
+        result['inertia'] *= n_rows / len(X_fit)
+    return results
+
+def elbow_k(results):
+    """Coude de la courbe d'inertie : point le plus éloigné de la corde entre le premier et le dernier k"""
+    ks = np.array([r['k'] for r in results], dtype=float)
+    inertia = np.array([r['inertia'] for r in results])
+    if len(ks) < 3 or inertia[0] == inertia[-1]:
+        return int(ks[0])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertia[0] - inertia) / (inertia[0] - inertia[-1])
+    return int(ks[np.argmax(y - x)])
+
+def choose_k(results, criterion='silhouette', fixed_k=4):
+    """Choix de k : 'silhouette' (maximum), 'elbow' (coude de l'inertie) ou 'fixed' (fixed_k)"""
+    if criterion == 'fixed':
+        return fixed_k
+    if criterion == 'elbow':
+        return elbow_k(results)
+    if criterion == 'silhouette':
+        return max(results, key=lambda r: r['silhouette'])['k']
+    raise ValueError(f"Critère de choix de k inconnu: {criterion}")
+
+def cluster_profiles(scaled_centers, features):
+    """Nomme chaque cluster d'après ses deux caractéristiques les plus marquées (centres standardisés)"""
+    profiles = []
+    for center in scaled_centers:
+        parts = []
+        for j in np.argsort(-np.abs(center))[:2]:
+            high, low = FEATURE_DESCRIPTIONS.get(features[j], (f"{features[j]} élevé", f"{features[j]} faible"))
+            parts.append(high if center[j] >= 0 else low)
+        profiles.append(parts[0] + ''.join(f", {part[0].lower()}{part[1:]}" for part in parts[1:]))
+    # Deux clusters au même libellé : on les distingue par leur numéro
+    return [f"{p} ({i})" if profiles.count(p) > 1 else p for i, p in enumerate(profiles)]
+
+def train_kmeans(data_path, criterion='silhouette', fixed_k=4, k_range=range(2, 10), sample_size=10000,
+                 fit_size=None, n_jobs=-1, output_dir='.', budget=None):
+    """Entraîne et sauvegarde le modèle KMeans, son scaler, ses caractéristiques, ses profils et le rapport du balayage
+
+    Le coût de service est écrit dans serving_report.json ; hors budget, rien n'est sauvegardé (BudgetExceeded).
+    """
+    # Charger les données
+    print("Chargement des données...")
+    df = load_features(data_path, kmeans_features)
+
+    # Vérifier les valeurs manquantes
+    print(f"Valeurs manquantes: {df[kmeans_features].isnull().sum().sum()}")
+
+    # Préparer les données
+    X = df[kmeans_features].copy()
+
+    # Standardiser les caractéristiques
+    print("Standardisation des données...")
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    results = []
+    if criterion != 'fixed':
+        print("Détermination du nombre optimal de clusters...")
+        results = sweep_k(X_scaled, k_range, sample_size, fit_size, n_jobs)
+        for r in results:
+            print(f"k={r['k']}: silhouette={r['silhouette']:.4f}, inertie={r['inertia']:.1f} ({r['fit_seconds']}s)")
+    optimal_k = choose_k(results, criterion, fixed_k)
+    print(f"Nombre optimal de clusters ({criterion}): {optimal_k}")
+
+    # Entraîner le modèle final
+    print(f"Entraînement du modèle KMeans avec {optimal_k} clusters...")
+    final_kmeans = make_kmeans(optimal_k, len(X_scaled))
+    final_kmeans.fit(X_scaled)
+
+    # Analyser les clusters
+    cluster_centers = scaler.inverse_transform(final_kmeans.cluster_centers_)
+    centers_df = pd.DataFrame(cluster_centers, columns=kmeans_features)
+    centers_df.index.name = 'Cluster'
+    profiles = cluster_profiles(final_kmeans.cluster_centers_, kmeans_features)
+    centers_df['Profil'] = profiles
+
+    print("Centres des clusters (échelle originale):")
+    print(centers_df)
+
+    # Évaluer les tailles des clusters
+    cluster_counts = np.bincount(final_kmeans.labels_, minlength=optimal_k)
+    print("Tailles des clusters:")
+    for i, count in enumerate(cluster_counts):
+        print(f"Cluster {i}: {count} utilisateurs")
+
+    # Coût de service (affectation sur le chemin de l'API) avant de remplacer le modèle servi
+    budget = budget or ServingBudget()
+    compiled = CompiledKMeans(scaler, final_kmeans, kmeans_features, profiles)
+    reports = {'kmeans': serving_report(lambda rows: compiled.assign(rows)[0], final_kmeans, scaler,
+                                        X.to_numpy(dtype=float)[:BATCH_ROWS])}
+    print_reports(reports)
+    try:
+        budget.check('kmeans', reports['kmeans'])
+    finally:
+        save_reports('train_kmeans', reports, budget, output_dir=output_dir)
+
+    # Sauvegarder le modèle et le scaler
+    print("Sauvegarde du modèle KMeans...")
+    # Écriture groupée : le registre de l'API ne recharge jamais un nouveau modèle avec un ancien scaler
+    dump_group_atomic({
+        os.path.join(output_dir, 'kmeans_model.pkl'): final_kmeans,
+        os.path.join(output_dir, 'kmeans_scaler.pkl'): scaler,
+        os.path.join(output_dir, 'kmeans_features.pkl'): kmeans_features,
+        os.path.join(output_dir, 'kmeans_profiles.pkl'): profiles,
+    })
+    save_reference('kmeans', X, kmeans_features, output_dir=output_dir)
+
+    # Rapport du balayage, à côté du modèle
+    report = {
+        'criterion': criterion,
+        'chosen_k': optimal_k,
+        'rows': len(X_scaled),
+        'silhouette_sample_size': sample_size,
+        'fit_size': fit_size,
+        'candidates': results,
+        'clusters': [
+            {'cluster': i, 'profile': profiles[i], 'size': int(cluster_counts[i]),
+             'center': {f: float(v) for f, v in zip(kmeans_features, cluster_centers[i])}}
+            for i in range(optimal_k)
+        ],
+    }
+    with open(os.path.join(output_dir, 'kmeans_sweep.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print("Terminé! Le modèle KMeans a été entraîné et sauvegardé avec succès.")
+    return final_kmeans
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement du modèle de clustering KMeans")
+    parser.add_argument('data', nargs='?', default='./cleaned_smart_parking_data.csv')
+    parser.add_argument('--criterion', choices=['silhouette', 'elbow', 'fixed'], default='silhouette',
+                        help="Choix automatique de k (silhouette maximale ou coude de l'inertie) ou k fixe")
+    parser.add_argument('--k', type=int, default=4, help="Nombre de clusters avec --criterion fixed")
+    parser.add_argument('--k-min', type=int, default=2)
+    parser.add_argument('--k-max', type=int, default=9)
+    parser.add_argument('--sample-size', type=int, default=10000, help="Lignes utilisées pour la silhouette")
+    parser.add_argument('--fit-size', type=int, default=None, help="Lignes utilisées pour ajuster chaque candidat")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Processus du balayage")
+    parser.add_argument('--output-dir', default='.')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    try:
+        train_kmeans(args.data, args.criterion, args.k, range(args.k_min, args.k_max + 1), args.sample_size,
+                     args.fit_size, args.n_jobs, args.output_dir, ServingBudget.from_args(args))
+    except BudgetExceeded as e:
+        sys.exit(f"Erreur: {e}")
@@ -1,4 +1,8 @@
-import pandas as pd
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
 import joblib
 from sklearn.model_selection import train_test_split
@@ -6,90 +10,104 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LinearRegression
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
-from sklearn.feature_selection import SelectKBest, f_regression, mutual_info_classif, RFE
-
-# Charger et prétraiter les données
-def preprocess_data(file_path):
-    df = pd.read_csv(file_path)
-    
-    # Traitement des colonnes temporelles
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Entry_Time'] = pd.to_datetime(df['Entry_Time'], format='%H:%M:%S').dt.time
-    df['Exit_Time'] = pd.to_datetime(df['Exit_Time'], format='%H:%M:%S').dt.time
-    
-    # Extraction des caractéristiques temporelles
-    df['Year'] = df['Timestamp'].dt.year
-    df['Month'] = df['Timestamp'].dt.month
-    df['Day'] = df['Timestamp'].dt.day
-    df['Hour'] = df['Timestamp'].dt.hour
-    df['Minute'] = df['Timestamp'].dt.minute
-    df['Second'] = df['Timestamp'].dt.second
-    
-    # Création de caractéristiques plus significatives
-    df['Weekday'] = df['Timestamp'].dt.dayofweek  # 0-6 où 0 est lundi
-    df['Is_Weekend'] = df['Weekday'].apply(lambda x: 1 if x >= 5 else 0)
-    df['Time_of_Day'] = df['Hour'].apply(lambda x:
-                                        'Morning' if 5 <= x < 12 else
-                                        'Afternoon' if 12 <= x < 17 else
-                                        'Evening' if 17 <= x < 21 else
-                                        'Night')
-    
-    # Encodage One-Hot pour les variables catégorielles
-    categorical_columns = ['User_Type', 'Weather_Precipitation', 'Nearby_Traffic_Level',
-                          'Payment_Status', 'Occupancy_Status', 'Vehicle_Type',
-                          'Spot_Size', 'Weather_Category', 'Vehicle_Size', 'Parking_Lot_Section',
-                          'Time_of_Day']
-    df_encoded = pd.get_dummies(df, columns=categorical_columns, drop_first=True)
-    
-    # Conversion des temps en minutes
-    df_encoded['Entry_Time_Minutes'] = pd.to_datetime(df['Entry_Time'], format='%H:%M:%S').dt.hour * 60 + pd.to_datetime(df['Entry_Time'], format='%H:%M:%S').dt.minute
-    df_encoded['Exit_Time_Minutes'] = pd.to_datetime(df['Exit_Time'], format='%H:%M:%S').dt.hour * 60 + pd.to_datetime(df['Exit_Time'], format='%H:%M:%S').dt.minute
-    
-    # Conversion de occupancy en binaire (pour la classification)
-    if 'occupancy' in df_encoded.columns:
-        df_encoded['occupancy'] = df_encoded['occupancy'].map({'Yes': 1, 'No': 0}).astype(int)
-    
-    # Suppression des colonnes temporelles qui ne sont plus nécessaires
-    df_encoded = df_encoded.drop(['Timestamp', 'Entry_Time', 'Exit_Time'], axis=1)
-    
-    return df_encoded
+from sklearn.feature_selection import SelectKBest, f_regression, mutual_info_classif
+
+from feature_store import preprocess_data, iter_preprocessed, load_features
+from occupancy_cube import CUBE_FILE, OccupancyCube
+from fast_inference import CompiledRegression, CompiledClassifier
+from model_registry import dump_group_atomic
+from drift_monitor import REFERENCE_FILE, save_reference
+from serving_cost import (BudgetExceeded, ServingBudget, add_budget_arguments,
+                           print_reports, save_reports, serving_report)
+
+def sample_rows(X, y, max_samples, random_state=42):
+    """Sous-échantillonne les lignes (entier = nombre de lignes, flottant < 1 = fraction)"""
+    n_rows = len(y)
+    if not max_samples:
+        return X, y
+    size = int(max_samples * n_rows) if isinstance(max_samples, float) and max_samples < 1 else int(max_samples)
+    if size >= n_rows:
+        return X, y
+    rows = np.sort(np.random.RandomState(random_state).choice(n_rows, size, replace=False))
+    return X[rows], y[rows]
+
+def recursive_elimination(make_forest, X, y, k, step=1, time_budget=None, start_time=None):
+    """RFE avec une forêt : renvoie (support, importances du premier ajustement sur toutes les colonnes)
+
+    Même élimination que sklearn.feature_selection.RFE, sans l'ajustement final inutile ici ; le premier
+    ajustement sert aussi de score « importance Random Forest ». Avec time_budget (secondes), le pas est
+    agrandi pour tenir dans le budget et, s'il est épuisé, les k meilleures colonnes du dernier
+    ajustement sont retenues.
+    """
+    n_features = X.shape[1]
+    step = int(max(1, step * n_features)) if 0.0 < step < 1.0 else int(step)
+    support = np.ones(n_features, dtype=bool)
+    first_importances = None
+    while support.sum() > k:
+        features = np.arange(n_features)[support]
+        fit_start = time.perf_counter()
+        forest = make_forest()
+        forest.fit(X[:, features], y)
+        fit_seconds = time.perf_counter() - fit_start
+        importances = forest.feature_importances_
+        if first_importances is None:
+            first_importances = importances
+        ranks = np.argsort(importances ** 2)
+        remaining = support.sum() - k
+        threshold = min(step, remaining)
+        if time_budget is not None:
+            fits_left = int((time_budget - (time.perf_counter() - start_time)) / max(fit_seconds, 1e-9))
+            if fits_left <= 0:
+                # Budget épuisé : garder les k colonnes les plus importantes du dernier ajustement
+                threshold = remaining
+                print(f"Budget de temps atteint, sélection avec {support.sum()} colonnes restantes")
+            else:
+                threshold = max(threshold, -(-remaining // fits_left))
+        support[features[ranks][:threshold]] = False
+    if first_importances is None:
+        forest = make_forest()
+        forest.fit(X, y)
+        first_importances = forest.feature_importances_
+    return support, first_importances
 
 # Fonction de sélection des caractéristiques les plus pertinentes
-def select_features(X, y, k=4, task_type='regression'):
+def select_features(X, y, k=4, task_type='regression', n_jobs=-1, rfe_step=1, max_samples=None,
+                    time_budget=None, random_state=42):
+    """Combine SelectKBest, RFE et l'importance Random Forest
+
+    Le score univarié est calculé dans un thread pendant que RFE ajuste ses forêts sur n_jobs cœurs ;
+    la forêt sur toutes les colonnes n'est ajustée qu'une fois (premier pas de RFE). rfe_step peut être
+    une fraction des colonnes restantes, max_samples limite les lignes utilisées et time_budget
+    (secondes) borne la durée de RFE.
+    """
     print(f"\nSélection des {k} meilleures caractéristiques pour la tâche de {task_type}...")
-    
+    start_time = time.perf_counter()
+    X_values, y_values = sample_rows(X.to_numpy(dtype=float), np.asarray(y), max_samples, random_state)
+
     if task_type == 'regression':
         # Méthode 1: SelectKBest avec f_regression
-        selector1 = SelectKBest(score_func=f_regression, k=k)
-        selector1.fit(X, y)
-        scores1 = selector1.scores_
-        
-        # Méthode 2: Recursive Feature Elimination avec un modèle de base
-        base_model = RandomForestRegressor(n_estimators=100, random_state=42)
-        selector2 = RFE(estimator=base_model, n_features_to_select=k, step=1)
-        selector2.fit(X, y)
-        
-        # Méthode 3: Importance des caractéristiques avec Random Forest
-        rf = RandomForestRegressor(n_estimators=100, random_state=42)
-        rf.fit(X, y)
-        scores3 = rf.feature_importances_
-        
+        score_func = f_regression
+        forest_class = RandomForestRegressor
     else:  # classification
         # Méthode 1: SelectKBest avec mutual_info_classif
-        selector1 = SelectKBest(score_func=mutual_info_classif, k=k)
-        selector1.fit(X, y)
-        scores1 = selector1.scores_
-        
-        # Méthode 2: Recursive Feature Elimination avec un modèle de base
-        base_model = RandomForestClassifier(n_estimators=100, random_state=42)
-        selector2 = RFE(estimator=base_model, n_features_to_select=k, step=1)
-        selector2.fit(X, y)
-        
-        # Méthode 3: Importance des caractéristiques avec Random Forest
-        rf = RandomForestClassifier(n_estimators=100, random_state=42)
-        rf.fit(X, y)
-        scores3 = rf.feature_importances_
-    
+        score_func = mutual_info_classif
+        forest_class = RandomForestClassifier
+
+    def univariate_scores():
+        selector1 = SelectKBest(score_func=score_func, k=k)
+        selector1.fit(X_values, y_values)
+        return selector1.scores_
+
+    # Méthodes 2 et 3: Recursive Feature Elimination et importance des caractéristiques avec Random Forest
+    # (résultats identiques quel que soit n_jobs : chaque arbre a sa propre graine)
+    make_forest = partial(forest_class, n_estimators=100, random_state=random_state, n_jobs=n_jobs)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        univariate = executor.submit(univariate_scores)
+        support, scores3 = recursive_elimination(make_forest, X_values, y_values, k, rfe_step,
+                                                 time_budget, start_time)
+        scores1 = univariate.result()
+    print(f"Sélection effectuée en {time.perf_counter() - start_time:.1f}s")
+
     # Récupérer l'indice des caractéristiques sélectionnées par chaque méthode
     features_to_keep = set()
     
@@ -98,7 +116,7 @@ def select_features(X, y, k=4, task_type='regression'):
     features_to_keep.update(top_indices1)
     
     # À partir de RFE
-    top_indices2 = np.where(selector2.support_)[0]
+    top_indices2 = np.where(support)[0]
     features_to_keep.update(top_indices2)
     
     # À partir de RandomForest
@@ -123,11 +141,18 @@ def select_features(X, y, k=4, task_type='regression'):
     # Retourner les indices des caractéristiques à conserver et les noms correspondants
     return feature_indices, feature_names
 
-def train_and_save_models(data_path):
-    """Entraîne et sauvegarde les modèles pour la régression et la classification"""
+def train_and_save_models(data_path, budget=None, **selection_options):
+    """Entraîne et sauvegarde les modèles pour la régression et la classification
+
+    selection_options est transmis à select_features (n_jobs, rfe_step, max_samples, time_budget).
+    Le coût de service de chaque modèle est écrit dans serving_report.json ; un modèle hors budget
+    n'est pas sauvegardé (BudgetExceeded), les fichiers servis restent cohérents.
+    """
+    budget = budget or ServingBudget()
+    reports = {}
     # Prétraitement des données
     print("Chargement et prétraitement des données...")
-    df_encoded = preprocess_data(data_path)
+    df_encoded = load_features(data_path)
     
     # Sauvegarde des colonnes pour un usage ultérieur dans l'API
     all_columns = list(df_encoded.columns)
@@ -145,12 +170,9 @@ def train_and_save_models(data_path):
     y = df_encoded['Parking_Duration']
     
     # Sélection des caractéristiques pertinentes
-    feature_indices, feature_names = select_features(X, y, k=4, task_type='regression')
+    feature_indices, feature_names = select_features(X, y, k=4, task_type='regression', **selection_options)
     X_selected = X.iloc[:, feature_indices]
     
-    # Sauvegarde des noms de caractéristiques pour la régression
-    joblib.dump(feature_names, 'regression_features.pkl')
-    
     # Division des données
     X_train, X_test, y_train, y_test = train_test_split(X_selected, y, test_size=0.2, random_state=42)
     
@@ -162,9 +184,19 @@ def train_and_save_models(data_path):
     regression_model = LinearRegression()
     regression_model.fit(X_train_scaled, y_train)
     
-    # Sauvegarde du modèle et du scaler
-    joblib.dump(regression_model, 'regression_model.pkl')
-    joblib.dump(scaler_reg, 'regression_scaler.pkl')
+    # Coût de service avant sauvegarde : un modèle hors budget ne remplace pas le modèle servi
+    reports['regression'] = serving_report(CompiledRegression(scaler_reg, regression_model, feature_names).predict,
+                                           regression_model, scaler_reg, X_test.to_numpy(dtype=float))
+    check_budget(budget, 'regression', reports)
+
+    # Sauvegarde des caractéristiques, du modèle et du scaler (publiés d'un bloc pour le registre de l'API)
+    dump_group_atomic({
+        'regression_features.pkl': feature_names,
+        'regression_model.pkl': regression_model,
+        'regression_scaler.pkl': scaler_reg,
+    })
+    # Distribution des caractéristiques d'entraînement, comparée au trafic par /drift
+    save_reference('regression', X_train, feature_names)
     
     # ==========================================================
     # PARTIE 2: TÂCHE DE CLASSIFICATION (prédiction d'occupation)
@@ -176,12 +208,9 @@ def train_and_save_models(data_path):
     y = df_encoded['occupancy']
     
     # Sélection des caractéristiques pertinentes
-    feature_indices, feature_names = select_features(X, y, k=3, task_type='classification')
+    feature_indices, feature_names = select_features(X, y, k=3, task_type='classification', **selection_options)
     X_selected = X.iloc[:, feature_indices]
     
-    # Sauvegarde des noms de caractéristiques pour la classification
-    joblib.dump(feature_names, 'classification_features.pkl')
-    
     # Standardisation
     scaler_class = StandardScaler()
     X_scaled = scaler_class.fit_transform(X_selected)
@@ -193,9 +222,22 @@ def train_and_save_models(data_path):
     classification_model = SVC(kernel='rbf', C=1, gamma='scale', probability=True)
     classification_model.fit(X_train, y_train)
     
-    # Sauvegarde du modèle et du scaler
-    joblib.dump(classification_model, 'classification_model.pkl')
-    joblib.dump(scaler_class, 'classification_scaler.pkl')
+    reports['classification'] = serving_report(
+        CompiledClassifier(scaler_class, classification_model, feature_names).predict,
+        classification_model, scaler_class, scaler_class.inverse_transform(X_test))
+    check_budget(budget, 'classification', reports)
+
+    # Sauvegarde des caractéristiques, du modèle et du scaler
+    dump_group_atomic({
+        'classification_features.pkl': feature_names,
+        'classification_model.pkl': classification_model,
+        'classification_scaler.pkl': scaler_class,
+    })
+    save_reference('classification', scaler_class.inverse_transform(X_train), feature_names)
+
+    # Agrégats d'occupation servis par /stats, recalculés sur le même jeu de données
+    print("\nCalcul du cube d'occupation...")
+    OccupancyCube.from_csv(data_path).save(CUBE_FILE)
     
     print("\nModèles entraînés et sauvegardés avec succès!")
     print("Fichiers créés:")
@@ -206,10 +248,38 @@ def train_and_save_models(data_path):
     print("- classification_features.pkl: Caractéristiques utilisées pour la classification")
     print("- classification_model.pkl: Modèle de classification (SVM)")
     print("- classification_scaler.pkl: Standardisation pour la classification")
+    print(f"- {CUBE_FILE}: Agrégats d'occupation par section, heure, jour et météo (/stats)")
+    print("- serving_report.json: Latence, taille et structure des modèles (section train_models)")
+    print(f"- {REFERENCE_FILE}: Distributions d'entraînement des caractéristiques (/drift)")
+
+def check_budget(budget, name, reports):
+    """Rapport écrit dans tous les cas, puis BudgetExceeded si le modèle dépasse le budget"""
+    print_reports({name: reports[name]})
+    try:
+        budget.check(name, reports[name])
+    finally:
+        save_reports('train_models', reports, budget)
+
+def fraction_or_count(value):
+    number = float(value)
+    return number if number < 1 else int(number)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement des modèles de régression et de classification")
     # Chemin vers le fichier CSV traité
-    data_path = "cleaned_smart_parking_data.csv"
-    
+    parser.add_argument('data', nargs='?', default="cleaned_smart_parking_data.csv")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Cœurs utilisés par les forêts de la sélection")
+    parser.add_argument('--rfe-step', type=fraction_or_count, default=1,
+                        help="Colonnes éliminées par itération de RFE (entier, ou fraction des colonnes)")
+    parser.add_argument('--max-samples', type=fraction_or_count, default=None,
+                        help="Lignes utilisées pour la sélection (entier, ou fraction)")
+    parser.add_argument('--time-budget', type=float, default=None, help="Durée maximale de RFE, en secondes")
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+
     # Entraîner et sauvegarder les modèles
-    train_and_save_models(data_path)
+    try:
+        train_and_save_models(args.data, ServingBudget.from_args(args), n_jobs=args.n_jobs, rfe_step=args.rfe_step,
+                              max_samples=args.max_samples, time_budget=args.time_budget)
+    except BudgetExceeded as e:
+        sys.exit(f"Erreur: {e}")
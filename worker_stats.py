@@ -0,0 +1,81 @@
+# Mesure de la mémoire des processus (RSS, PSS, pages partagées) pour dimensionner les workers gunicorn
+import os
+import sys
+
+
+def read_proc_kb(path, keys):
+    """Lit les champs 'Clé: valeur kB' d'un fichier /proc"""
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in keys:
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def process_memory(pid='self'):
+    """Mémoire d'un processus en Mo
+
+    RSS compte les pages partagées dans chaque worker ; PSS les répartit entre
+    les processus qui les partagent et donne donc le vrai coût d'un worker.
+    """
+    status = read_proc_kb(f'/proc/{pid}/status', {'VmRSS'})
+    rollup = read_proc_kb(f'/proc/{pid}/smaps_rollup',
+                          {'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'})
+    if not status:
+        if pid != 'self':
+            return None
+        # Hors Linux : seul le pic RSS du processus courant est disponible
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return {"pid": os.getpid(), "max_rss_mb": round(peak / divisor, 2)}
+    report = {
+        "pid": os.getpid() if pid == 'self' else int(pid),
+        "rss_mb": round(status['VmRSS'] / 1024, 2)
+    }
+    if rollup:
+        report.update({
+            "pss_mb": round(rollup.get('Pss', 0) / 1024, 2),
+            "shared_mb": round((rollup.get('Shared_Clean', 0) + rollup.get('Shared_Dirty', 0)) / 1024, 2),
+            "private_mb": round((rollup.get('Private_Clean', 0) + rollup.get('Private_Dirty', 0)) / 1024, 2)
+        })
+    return report
+
+
+def sibling_pids(parent_pid):
+    """PID des processus enfants de parent_pid (les workers gunicorn du même maître)"""
+    pids = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Le nom du processus peut contenir des espaces : on repart de la dernière parenthèse
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def workers_memory():
+    """Mémoire du worker courant et, sous gunicorn, du maître et de tous les workers"""
+    report = {"current": process_memory()}
+    if 'gunicorn' in sys.modules:
+        master = os.getppid()
+        workers = [process_memory(pid) for pid in sibling_pids(master)]
+        workers = [w for w in workers if w is not None]
+        report["master"] = process_memory(master)
+        report["workers"] = workers
+        report["total_pss_mb"] = round(sum(w.get("pss_mb", 0) for w in workers + [report["master"] or {}]), 2)
+    return report